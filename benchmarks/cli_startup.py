@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+#-*- coding:UTF-8 -*-
+"""
+Measure the start up cost of facewap.py: wall time to build the parsers,
+and the slowest imports as reported by python -X importtime.
+
+    python benchmarks/cli_startup.py [-n RUNS] [args ...]
+
+args default to "extract -h".
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FACEWAP = os.path.join(ROOT, "facewap.py")
+
+def time_runs(args, runs):
+    """
+    En.Wall time in ms of each run of facewap.py with args
+    Cn.每次使用args运行facewap.py的耗时(毫秒)
+    """
+    timings = list()
+    for _ in range(runs):
+        started = time.time()
+        subprocess.call([sys.executable, FACEWAP] + args, cwd=ROOT,
+                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(1000 * (time.time() - started))
+    return timings
+
+def slowest_imports(args, count=10):
+    """
+    En.The modules with the largest cumulative import time, in ms
+    Cn.累计导入时间最长的模块(毫秒)
+    """
+    process = subprocess.run([sys.executable, "-X", "importtime", FACEWAP] + args, cwd=ROOT,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    imports = list()
+    for line in process.stderr.decode("utf-8", "replace").splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        imports.append((int(cumulative) / 1000, name.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+def main():
+    """
+    En.Run the benchmark
+    Cn.运行基准测试
+    """
+    parser = argparse.ArgumentParser(description="facewap.py start up benchmark")
+    parser.add_argument("-n", "--runs", type=int, default=10, help="Number of runs")
+    parser.add_argument("args", nargs=argparse.REMAINDER,
+                        help="Arguments passed to facewap.py. Defaults to 'extract -h'")
+    options = parser.parse_args()
+    args = options.args or ["extract", "-h"]
+
+    timings = time_runs(args, options.runs)
+    print("facewap.py {}".format(" ".join(args)))
+    print("  runs:   {}".format(options.runs))
+    print("  median: {:.1f} ms".format(statistics.median(timings)))
+    print("  min:    {:.1f} ms".format(min(timings)))
+    print("Slowest imports (cumulative ms):")
+    for cumulative, name in slowest_imports(args):
+        print("  {:>8.1f}  {}".format(cumulative, name))
+
+if __name__ == "__main__":
+    main()
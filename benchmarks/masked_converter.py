@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+#-*- coding:UTF-8 -*-
+"""
+Compare the Masked converter against a reference that runs each step on
+the full frame with freshly allocated arrays, the way the converter
+used to work. Frames and faces are synthetic and the model is replaced
+by an identity encoder, so only the converter's own cost is measured.
+
+    python benchmarks/masked_converter.py [-r 3840x2160] [-n 20] [-b 4]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.faces_detect import DetectedFace
+from plugins.Convert_Masked import Convert
+
+class FullFrameConvert(Convert):
+    """
+    En.Reference converter: every step allocates and works on full frame arrays
+    Cn.参考转换器：每个步骤都分配并处理整帧数组
+    """
+    def blend(self, image, face, mat, new_face, size, stats=None):
+        height, width = image.shape[:2]
+        frame = image.astype("float32")
+        flags = cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP
+        warped = cv2.warpAffine(new_face, mat, (width, height), frame.copy(),
+                                flags=flags, borderMode=cv2.BORDER_TRANSPARENT)
+        rect = cv2.warpAffine(np.ones((size, size), dtype="float32"), mat, (width, height),
+                              None, flags=flags)
+        hull = np.zeros((height, width), dtype="float32")
+        points = np.round(np.array(face.landmarksAsXY())).astype("int32")
+        cv2.fillConvexPoly(hull, cv2.convexHull(points), 1.0)
+        mask = {"rect": rect, "facehull": hull}.get(self.mask_type, rect * hull)
+        if self.erosion_kernel is not None:
+            operation = cv2.erode if self.erosion_kernel_size > 0 else cv2.dilate
+            mask = operation(mask, self.erosion_kernel, iterations=1)
+        if self.blur_size:
+            mask = cv2.blur(mask, (self.blur_size, self.blur_size))
+        if self.sharpen_image:
+            self.sharpen(warped)
+        if self.match_histogram:
+            self.histogram_match(warped, frame, mask)
+        mask = np.repeat(mask[..., None], 3, axis=2)
+        blended = warped * mask + frame * (1 - mask)
+        image[...] = np.clip(np.rint(blended), 0, 255).astype("uint8")
+
+def synthetic_frame(width, height, seed):
+    """
+    En.A frame with some structure, so blurs and histograms do real work
+    Cn.具有一定结构的帧，使模糊和直方图进行真实的计算
+    """
+    random = np.random.RandomState(seed)
+    small = random.randint(0, 256, (height // 32 + 1, width // 32 + 1, 3)).astype("uint8")
+    frame = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+    noise = random.randint(-8, 9, frame.shape)
+    return np.clip(frame.astype("int16") + noise, 0, 255).astype("uint8")
+
+def synthetic_face(width, height, seed):
+    """
+    En.A face box with 68 landmarks on an ellipse inside it
+    Cn.一个人脸框，其内部的椭圆上有68个特征点
+    """
+    random = np.random.RandomState(seed)
+    side = height // 4
+    x = int(random.randint(0, width - side))
+    y = int(random.randint(0, height - side))
+    angles = np.linspace(0, 2 * np.pi, 68, endpoint=False)
+    points = [(int(x + side / 2 + 0.4 * side * np.cos(angle)),
+               int(y + side / 2 + 0.45 * side * np.sin(angle))) for angle in angles]
+    return DetectedFace(x=x, w=side, y=y, h=side, landmarksXY=points)
+
+def run(converter, frames, faces, size, batch):
+    """
+    En.ms per frame of each batch, and the most memory allocated by one call
+    Cn.每批次的每帧毫秒数，以及单次调用分配的最大内存
+    """
+    timings = list()
+    peak = 0
+    tracemalloc.start()
+    for start in range(0, len(frames), batch):
+        images = [frame.copy() for frame in frames[start:start + batch]]
+        batch_faces = [[face] for face in faces[start:start + batch]]
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        started = time.time()
+        if batch > 1:
+            converter.patch_batch(images, batch_faces, size)
+        else:
+            converter.patch_image(images[0], batch_faces[0][0], size)
+        timings.append(1000 * (time.time() - started) / len(images))
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+    return timings, peak / (1024 * 1024)
+
+def main():
+    """
+    En.Run the benchmark
+    Cn.运行基准测试
+    """
+    parser = argparse.ArgumentParser(description="Masked converter benchmark")
+    parser.add_argument("-r", "--resolution", default="3840x2160", help="Frame size, WxH")
+    parser.add_argument("-n", "--frames", type=int, default=20, help="Number of frames")
+    parser.add_argument("-b", "--batch", type=int, default=4,
+                        help="Frames per patch_batch call for the fused converter")
+    parser.add_argument("-s", "--size", type=int, default=64, help="Model face size")
+    parser.add_argument("-M", "--mask-type", default="facehullandrect",
+                        choices=["rect", "facehull", "facehullandrect"])
+    parser.add_argument("-e", "--erosion-kernel-size", type=int, default=None)
+    parser.add_argument("-B", "--blur-size", type=int, default=2)
+    parser.add_argument("-sh", "--sharpen", default=None, choices=["bsharpen", "gsharpen"])
+    parser.add_argument("-mh", "--match-histogram", action="store_true")
+    options = parser.parse_args()
+    width, height = (int(value) for value in options.resolution.lower().split("x"))
+
+    frames = [synthetic_frame(width, height, seed) for seed in range(options.frames)]
+    faces = [synthetic_face(width, height, seed) for seed in range(options.frames)]
+    kwargs = {"blur_size": options.blur_size,
+              "mask_type": options.mask_type,
+              "erosion_kernel_size": options.erosion_kernel_size,
+              "sharpen_image": options.sharpen,
+              "match_histogram": options.match_histogram}
+    encoder = lambda batch: batch
+    cases = (("full frame", FullFrameConvert(encoder, **kwargs), 1),
+             ("fused", Convert(encoder, **kwargs), 1),
+             ("fused, batch {}".format(options.batch), Convert(encoder, **kwargs),
+              options.batch))
+
+    print("{}x{}, {} frames, mask {}".format(width, height, options.frames, options.mask_type))
+    print("{:<18} {:>12} {:>10} {:>14}".format("Converter", "median ms", "min ms", "peak alloc MB"))
+    for name, converter, batch in cases:
+        run(converter, frames[:batch], faces[:batch], options.size, batch)
+        timings, peak = run(converter, frames, faces, options.size, batch)
+        print("{:<18} {:>12.2f} {:>10.2f} {:>14.1f}".format(
+            name, statistics.median(timings), min(timings), peak))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+#!/usr/bin/env python
+#-*- coding:UTF-8 -*-
+"""
+End to end benchmark of each stage: resolving a video, extracting with
+the hog and cnn detectors, a train step, and the Masked and Adjust
+converters. Frames, videos and faces are generated locally, nothing is
+downloaded. Each stage runs in a fresh process so its peak RSS is its
+own. Results are written as json, and compared against a baseline
+results file if one is given; the exit code is 1 on a regression.
+
+    python benchmarks/suite.py [-r 640x360,1920x1080] [-n 20] [-s convert-masked]
+                               [-o results.json] [-b baseline.json] [-t 0.1]
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+from queue import Empty
+
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from masked_converter import synthetic_face, synthetic_frame
+
+STAGES = ("resolve", "extract-hog", "extract-cnn", "train-batch", "train-step",
+          "convert-masked", "convert-adjust")
+# 与分辨率无关的阶段只在第一个分辨率上运行一次
+FIXED_SIZE = ("train-batch", "train-step")
+TRAIN_BATCH_SIZE = 16
+
+class SkipStage(Exception):
+    """
+    En.A stage that can't run here, e.g. because a dependency is missing
+    Cn.无法在此运行的阶段，例如缺少依赖
+    """
+    pass
+
+def require_ffmpeg():
+    """
+    En.Skip the stage if the bundled ffmpeg is missing
+    Cn.若缺少附带的ffmpeg则跳过该阶段
+    """
+    from lib.frames import FFMPEG, FFPROBE
+    for path in (FFMPEG, FFPROBE):
+        if not os.path.isfile(path):
+            raise SkipStage("{} not found".format(path))
+
+def require_face_recognition():
+    """
+    En.Skip the stage if face_recognition can't be imported
+    Cn.若无法导入face_recognition则跳过该阶段
+    """
+    try:
+        import face_recognition
+    except ImportError as err:
+        raise SkipStage(str(err))
+
+def bench_resolve(width, height, frames, work_dir):
+    """
+    En.Resolve a synthetic video into png frames
+    Cn.将合成视频解析为png帧
+    """
+    require_ffmpeg()
+    from lib.frames import VideoSink, resolve_video
+    video = os.path.join(work_dir, "video.mp4")
+    sink = VideoSink(video, 25.0)
+    try:
+        for seed in range(frames):
+            sink.write(synthetic_frame(width, height, seed))
+    finally:
+        sink.close()
+    started = time.time()
+    resolve_video(video, os.path.join(work_dir, "picture"))
+    return frames, time.time() - started
+
+def bench_extract(detector):
+    """
+    En.Detect faces in synthetic frames with the hog or cnn detector
+    Cn.使用hog或cnn检测器在合成帧中检测人脸
+    """
+    def bench(width, height, frames, work_dir):
+        require_face_recognition()
+        from lib.faces_detect import detect_faces
+        images = [synthetic_frame(width, height, seed) for seed in range(frames)]
+        detect_faces(images[0], detector)
+        started = time.time()
+        for image in images:
+            detect_faces(image, detector)
+        return frames, time.time() - started
+    return bench
+
+def write_faces(folder, count):
+    """
+    En.count synthetic 256x256 training faces
+    Cn.count张合成的256x256训练人脸
+    """
+    os.makedirs(folder)
+    for seed in range(count):
+        cv2.imwrite(os.path.join(folder, "{:04d}.png".format(seed)),
+                    synthetic_frame(256, 256, seed))
+
+def bench_train_batch(width, height, frames, work_dir):
+    """
+    En.Warp training batches in the loader's worker pool. Counts faces
+    Cn.在加载器的工作进程池中扭曲训练批次。以人脸计数
+    """
+    from lib.training_data import BatchLoader, create_pool
+    folder = os.path.join(work_dir, "faces")
+    write_faces(folder, 4 * TRAIN_BATCH_SIZE)
+    pool = create_pool(max(1, (os.cpu_count() or 2) // 2))
+    try:
+        loader = BatchLoader(folder, TRAIN_BATCH_SIZE, pool, seed=0)
+        loader.get()
+        started = time.time()
+        for _ in range(frames):
+            loader.get()
+        return frames * TRAIN_BATCH_SIZE, time.time() - started
+    finally:
+        pool.terminate()
+
+def bench_train_step(width, height, frames, work_dir):
+    """
+    En.Train steps of a new model of the default trainer. Counts faces
+    Cn.默认训练器的新模型的训练步骤。以人脸计数
+    """
+    from lib.training_data import BatchLoader, create_pool
+    from plugins.PluginLoader import PluginLoader
+    if not PluginLoader.get_available_models():
+        raise SkipStage("no Model plugins installed")
+    name = PluginLoader.get_default_model()
+    try:
+        model = PluginLoader.get_model(name)(os.path.join(work_dir, "model"), 1)
+    except ImportError as err:
+        raise SkipStage(str(err))
+    model.load(swapped=False)
+    folders = [os.path.join(work_dir, side) for side in "AB"]
+    for folder in folders:
+        write_faces(folder, 4 * TRAIN_BATCH_SIZE)
+    pool = create_pool(max(1, (os.cpu_count() or 2) // 2))
+    try:
+        loaders = [BatchLoader(folder, TRAIN_BATCH_SIZE, pool, seed=0) for folder in folders]
+        trainer = PluginLoader.get_trainer(name)(model, loaders[0], loaders[1],
+                                                 TRAIN_BATCH_SIZE, False)
+        trainer.train_one_step(0, None)
+        started = time.time()
+        for iteration in range(1, frames + 1):
+            trainer.train_one_step(iteration, None)
+        return frames * TRAIN_BATCH_SIZE, time.time() - started
+    finally:
+        pool.terminate()
+
+def bench_convert(converter):
+    """
+    En.Swap one synthetic face per frame with an identity encoder, so only
+    the converter's own cost is measured
+    Cn.使用恒等编码器在每帧中替换一张合成人脸，因此只测量转换器本身的开销
+    """
+    def bench(width, height, frames, work_dir):
+        from plugins.PluginLoader import PluginLoader
+        plugin = PluginLoader.get_converter(converter)(lambda batch: batch)
+        images = [synthetic_frame(width, height, seed) for seed in range(frames)]
+        faces = [synthetic_face(width, height, seed) for seed in range(frames)]
+        plugin.patch_image(images[0].copy(), faces[0], 64)
+        started = time.time()
+        for image, face in zip(images, faces):
+            plugin.patch_image(image, face, 64)
+        return frames, time.time() - started
+    return bench
+
+BENCHMARKS = {"resolve": bench_resolve,
+              "extract-hog": bench_extract("hog"),
+              "extract-cnn": bench_extract("cnn"),
+              "train-batch": bench_train_batch,
+              "train-step": bench_train_step,
+              "convert-masked": bench_convert("Masked"),
+              "convert-adjust": bench_convert("Adjust")}
+
+def peak_rss_mb():
+    """
+    En.Peak resident set size of this process in MB
+    Cn.本进程的峰值常驻内存(MB)
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux上以KB为单位，macOS上以字节为单位
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+def run_stage(stage, width, height, frames, queue):
+    """
+    En.Run one stage in this (fresh) process and put its result on the queue
+    Cn.在此(新的)进程中运行一个阶段，并将结果放入队列
+    """
+    work_dir = tempfile.mkdtemp(prefix="facewap_bench_")
+    result = {"stage": stage, "resolution": "{}x{}".format(width, height)}
+    try:
+        count, elapsed = BENCHMARKS[stage](width, height, frames, work_dir)
+        result.update({"frames": count,
+                       "seconds": elapsed,
+                       "fps": count / elapsed if elapsed else 0.0,
+                       "ms_per_frame": 1000 * elapsed / count if count else 0.0,
+                       "peak_rss_mb": peak_rss_mb()})
+    except SkipStage as err:
+        result["skipped"] = str(err)
+    except Exception:
+        result["error"] = traceback.format_exc()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    queue.put(result)
+
+def run(stage, width, height, frames):
+    """
+    En.Run one stage in a spawned process
+    Cn.在新创建的进程中运行一个阶段
+    """
+    context = mp.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=run_stage, args=(stage, width, height, frames, queue))
+    process.start()
+    result = None
+    while result is None:
+        try:
+            result = queue.get(timeout=1.0)
+        except Empty:
+            if process.exitcode is None:
+                continue
+            # 进程退出前放入的结果可能仍在管道中
+            try:
+                result = queue.get(timeout=1.0)
+            except Empty:
+                result = {"stage": stage, "resolution": "{}x{}".format(width, height),
+                          "error": "The stage process exited with code {} without a "
+                                   "result".format(process.exitcode)}
+    process.join()
+    return result
+
+def result_key(result):
+    return "{}@{}".format(result["stage"], result["resolution"])
+
+def compare(results, baseline, threshold, rss_threshold, deselected=()):
+    """
+    En.Print each timed baseline result against this run. Returns the
+    keys that are slower than threshold, or use more than rss_threshold
+    more memory, as fractions of the baseline. A baseline result that has
+    no timing in this run, because it is missing, was skipped or failed,
+    is a regression too, unless its key is in deselected
+    Cn.打印每个有计时的基线结果与本次运行的比较。返回比基线慢超过threshold
+    或内存多用超过rss_threshold(均为基线的比例)的结果键。基线结果若在本次
+    运行中没有计时(缺失、被跳过或失败)也算作退化，除非其键在deselected中
+    """
+    baseline = {result_key(result): result for result in baseline["results"]
+                if "ms_per_frame" in result}
+    results = {result_key(result): result for result in results}
+    regressions = list()
+    print("-------------------------")
+    print("{:<28} {:>12} {:>12} {:>8} {:>8}".format("Against baseline", "ms/frame",
+                                                   "baseline", "time", "RSS"))
+    for key, base in baseline.items():
+        if key in deselected:
+            continue
+        result = results.get(key)
+        if result is None or "ms_per_frame" not in result:
+            status = ("missing" if result is None
+                      else "skipped" if "skipped" in result else "failed")
+            print("{:<28} {:>12} {:>12.2f} {:>8} {:>8}  REGRESSION".format(
+                key, status, base["ms_per_frame"], "", ""))
+            regressions.append(key)
+            continue
+        time_change = result["ms_per_frame"] / base["ms_per_frame"] - 1
+        rss_change = result["peak_rss_mb"] / base["peak_rss_mb"] - 1
+        regressed = time_change > threshold or rss_change > rss_threshold
+        print("{:<28} {:>12.2f} {:>12.2f} {:>+7.1f}% {:>+7.1f}%{}".format(
+            key, result["ms_per_frame"], base["ms_per_frame"], 100 * time_change,
+            100 * rss_change, "  REGRESSION" if regressed else ""))
+        if regressed:
+            regressions.append(key)
+    return regressions
+
+def main():
+    """
+    En.Run the benchmark
+    Cn.运行基准测试
+    """
+    parser = argparse.ArgumentParser(description="facewap end to end benchmark")
+    parser.add_argument("-r", "--resolutions", default="640x360,1280x720,1920x1080",
+                        help="Comma separated frame sizes, WxH")
+    parser.add_argument("-n", "--frames", type=int, default=20,
+                        help="Frames per stage and resolution, or train steps")
+    parser.add_argument("-s", "--stages", nargs="+", default=list(STAGES), choices=STAGES,
+                        help="Stages to run. Defaults to all")
+    parser.add_argument("-o", "--output", default="benchmark_results.json",
+                        help="Results file")
+    parser.add_argument("-b", "--baseline", default=None,
+                        help="Results file of an earlier run to compare against")
+    parser.add_argument("-t", "--threshold", type=float, default=0.10,
+                        help="Slowdown in ms/frame, as a fraction of the baseline, "
+                             "that counts as a regression")
+    parser.add_argument("--rss-threshold", type=float, default=0.20,
+                        help="Growth in peak RSS, as a fraction of the baseline, "
+                             "that counts as a regression")
+    options = parser.parse_args()
+    resolutions = [tuple(int(value) for value in resolution.lower().split("x"))
+                   for resolution in options.resolutions.split(",")]
+
+    results = list()
+    print("{:<28} {:>10} {:>12} {:>12}".format("Stage", "fps", "ms/frame", "peak RSS MB"))
+    for stage in options.stages:
+        sizes = resolutions[:1] if stage in FIXED_SIZE else resolutions
+        for width, height in sizes:
+            result = run(stage, width, height, options.frames)
+            results.append(result)
+            key = result_key(result)
+            if "skipped" in result:
+                print("{:<28} skipped: {}".format(key, result["skipped"]))
+            elif "error" in result:
+                print("{:<28} failed:\n{}".format(key, result["error"]))
+            else:
+                print("{:<28} {:>10.2f} {:>12.2f} {:>12.1f}".format(
+                    key, result["fps"], result["ms_per_frame"], result["peak_rss_mb"]))
+
+    with open(options.output, "w") as results_file:
+        json.dump({"python": platform.python_version(),
+                   "platform": platform.platform(),
+                   "cpus": os.cpu_count(),
+                   "opencv": cv2.__version__,
+                   "numpy": np.__version__,
+                   "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                   "frames": options.frames,
+                   "results": results}, results_file, indent=2)
+    print("Results written to: {}".format(options.output))
+
+    if options.baseline:
+        with open(options.baseline, "r") as baseline_file:
+            baseline = json.load(baseline_file)
+        # 本次用-s或-r排除的阶段不算缺失，但已从基准中删除的阶段算
+        planned = set(result_key(result) for result in results)
+        deselected = set(result_key(result) for result in baseline["results"]
+                         if result["stage"] in STAGES and result_key(result) not in planned)
+        regressions = compare(results, baseline, options.threshold, options.rss_threshold,
+                              deselected)
+        if regressions:
+            print("{} regression(s): {}".format(len(regressions), ", ".join(regressions)))
+            sys.exit(1)
+        print("No regressions")
+
+if __name__ == "__main__":
+    main()
@@ -9,8 +9,19 @@ if sys.version_info[0] < 3:
 if sys.version_info[0] == 3 and sys.version_info[1] < 6:
     raise Exception("This program requires at least python3.6")
 
+def bad_args(args):
+    """ Print help on bad arguments """
+    PARSER.print_help()
+    exit(0)
+
 if __name__ == "__main__":
     PARSER = cli.FullHelpArgumentParser()
     SUBPARSER = PARSER.add_subparsers()
     EXTRACT = cli.ExtractArgs(SUBPARSER,"extract","Extract the face from pictures")
-    TRAIN = cli
+    TRAIN = cli.TrainArgs(SUBPARSER,"train","This command trains the model for the two faces A and B")
+    CONVERT = cli.ConvertArgs(SUBPARSER,"convert","Convert a source image to a new one with the face swapped")
+    TUNE = cli.TuneArgs(SUBPARSER,"tune","Find the fastest convert settings for a given quality, scored with VMAF")
+    BATCH = cli.BatchArgs(SUBPARSER,"batch","Run a file of extract, convert and tune jobs in one process, sharing loaded models")
+    PARSER.set_defaults(func=bad_args)
+    ARGUMENTS = PARSER.parse_args()
+    ARGUMENTS.func(ARGUMENTS)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+#-*- coding:UTF-8 -*-
+"""Filter out faces that match reference images"""
+
+import hashlib
+import os
+
+import cv2
+import face_recognition
+import numpy as np
+
+def get_cache_dir():
+    """
+    En.Folder the reference encodings are cached in
+    Cn.缓存参考编码的文件夹
+    """
+    return os.path.join(os.path.expanduser("~"), ".cache", "facewap", "reference_encodings")
+
+class FaceFilter(object):
+    """
+    En.Rejects faces belonging to the people shown in the reference
+    images. A face is kept only if it is further than threshold from
+    every reference encoding. Reference encodings are cached in
+    cache_dir, keyed by a hash of the image file, so only new or changed
+    reference images are encoded. All the faces of a frame are encoded
+    together and compared with every reference in one distance matrix
+    Cn.拒绝参考图像中人物的人脸。仅当人脸与每个参考编码的距离都
+    大于阈值时才保留该人脸。参考编码缓存在cache_dir中，以图像文件的哈希
+    为键，因此只有新的或修改过的参考图像需要编码。一帧中的所有人脸一起
+    编码，并在一个距离矩阵中与所有参考进行比较
+    """
+    def __init__(self, reference_file_paths, threshold=0.6, cache_dir=None):
+        self.threshold = threshold
+        self.cache_dir = cache_dir or get_cache_dir()
+        encodings = list()
+        for path in reference_file_paths:
+            encoding = self.get_reference(path)
+            if encoding is None:
+                print("Warning: No face found in reference image {}".format(path))
+                continue
+            encodings.append(encoding)
+        self.encodings = np.array(encodings, dtype="float64").reshape(len(encodings), -1)
+
+    def get_reference(self, path):
+        """
+        En.The encoding of the first face in a reference image, from the
+        cache if it is there. None if the image has no face, which is
+        cached too
+        Cn.参考图像中第一张人脸的编码，若缓存中存在则从缓存读取。若图像中
+        没有人脸则返回None，这一结果同样会被缓存
+        """
+        with open(path, "rb") as infile:
+            data = infile.read()
+        digest = hashlib.sha1(data)
+        digest.update(getattr(face_recognition, "__version__", "").encode("utf-8"))
+        cache_path = os.path.join(self.cache_dir, "{}.npy".format(digest.hexdigest()))
+        try:
+            encoding = np.load(cache_path)
+            return encoding if encoding.size else None
+        except (IOError, OSError, ValueError):
+            pass
+        image = cv2.imdecode(np.frombuffer(data, dtype="uint8"), cv2.IMREAD_COLOR)
+        encodings = face_recognition.face_encodings(image[:, :, ::-1]) if image is not None else []
+        encoding = np.asarray(encodings[0], dtype="float64") if encodings else np.zeros(0)
+        temp_path = "{}.{}.tmp.npy".format(cache_path[:-4], os.getpid())
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            np.save(temp_path, encoding)
+            os.replace(temp_path, cache_path)
+        except (IOError, OSError):
+            pass
+        return encoding if encoding.size else None
+
+    def filter(self, frame, locations):
+        """
+        En.Whether each face at an (x, y, w, h) location in the frame should be kept
+        Cn.帧中位于各(x, y, w, h)位置的人脸是否应该被保留
+        """
+        keep = [True] * len(locations)
+        if not len(self.encodings) or not locations:
+            return keep
+        boxes = [(y, x + w, y + h, x) for x, y, w, h in locations]
+        encodings = face_recognition.face_encodings(np.ascontiguousarray(frame[:, :, ::-1]),
+                                                    boxes)
+        if not encodings:
+            return keep
+        encodings = np.array(encodings, dtype="float64")
+        distances = np.sqrt(((encodings[:, None, :] - self.encodings[None, :, :]) ** 2).sum(axis=2))
+        return (distances.min(axis=1) > self.threshold).tolist()
+
+    def check(self, frame, location):
+        """
+        En.Whether the face at (x, y, w, h) location in the frame should be kept
+        Cn.帧中位于(x, y, w, h)的人脸是否应该被保留
+        """
+        return self.filter(frame, [location])[0]
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+#-*- coding:UTF-8 -*-
+"""
+Library providing convenient classes and methods for writing data to files.
+"""
+import json
+import pickle
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+class Serializer(object):
+    """
+    En.Base class for the alignments serializers
+    Cn.对齐文件序列化器的基类
+    """
+    ext = ""
+    woptions = ""
+    roptions = ""
+
+    @classmethod
+    def marshal(cls, input_data):
+        """
+        En.Convert data to the serialized format
+        Cn.将数据转换为序列化格式
+        """
+        raise NotImplementedError()
+
+    @classmethod
+    def unmarshal(cls, input_string):
+        """
+        En.Convert serialized data back to python objects
+        Cn.将序列化数据转换回python对象
+        """
+        raise NotImplementedError()
+
+class YAMLSerializer(Serializer):
+    """
+    En.YAML Serializer
+    Cn.YAML序列化器
+    """
+    ext = "yml"
+    woptions = "w"
+    roptions = "r"
+
+    @classmethod
+    def marshal(cls, input_data):
+        return yaml.dump(input_data, default_flow_style=False)
+
+    @classmethod
+    def unmarshal(cls, input_string):
+        return yaml.load(input_string, Loader=yaml.SafeLoader)
+
+class JSONSerializer(Serializer):
+    """
+    En.JSON Serializer
+    Cn.JSON序列化器
+    """
+    ext = "json"
+    woptions = "w"
+    roptions = "r"
+
+    @classmethod
+    def marshal(cls, input_data):
+        return json.dumps(input_data, indent=2)
+
+    @classmethod
+    def unmarshal(cls, input_string):
+        return json.loads(input_string)
+
+class PickleSerializer(Serializer):
+    """
+    En.Pickle Serializer
+    Cn.Pickle序列化器
+    """
+    ext = "p"
+    woptions = "wb"
+    roptions = "rb"
+
+    @classmethod
+    def marshal(cls, input_data):
+        return pickle.dumps(input_data)
+
+    @classmethod
+    def unmarshal(cls, input_string):
+        return pickle.loads(input_string)
+
+class BinarySerializer(Serializer):
+    """
+    En.Binary alignments format, see lib.alignments.BinaryAlignments
+    for memory mapped, append only access to the same files
+    Cn.二进制对齐格式，对同一文件进行内存映射和仅追加访问请参见
+    lib.alignments.BinaryAlignments
+    """
+    ext = "fsa"
+    woptions = "wb"
+    roptions = "rb"
+
+    @classmethod
+    def marshal(cls, input_data):
+        from lib.alignments import to_bytes
+        return to_bytes(input_data)
+
+    @classmethod
+    def unmarshal(cls, input_string):
+        from lib.alignments import from_bytes
+        return from_bytes(input_string)
+
+def get_serializer(serializer):
+    """
+    En.Return the serializer class for the given name. Falls back to
+    json if yaml is requested but not installed
+    Cn.返回给定名称的序列化器类。若请求yaml但未安装，则回退到json
+    """
+    if serializer == "json":
+        return JSONSerializer
+    if serializer == "pickle":
+        return PickleSerializer
+    if serializer == "binary":
+        return BinarySerializer
+    if serializer == "yaml" and yaml is not None:
+        return YAMLSerializer
+    if serializer == "yaml":
+        print("You must have PyYAML installed to use YAML as the serializer. "
+              "Switching to JSON as the serializer.")
+    return JSONSerializer
+
+def get_serializer_from_filename(filename):
+    """
+    En.Return the serializer class matching a file's extension
+    Cn.返回与文件扩展名匹配的序列化器类
+    """
+    extension = filename.lower().rsplit(".", 1)[-1]
+    if extension == "json":
+        return JSONSerializer
+    if extension == "p":
+        return PickleSerializer
+    if extension == "fsa":
+        return BinarySerializer
+    if extension in ("yaml", "yml") and yaml is not None:
+        return YAMLSerializer
+    if extension in ("yaml", "yml"):
+        print("You must have PyYAML installed to use YAML as the serializer.\n"
+              "Switching to JSON as the serializer.")
+    return JSONSerializer
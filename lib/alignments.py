@@ -0,0 +1,438 @@
+#!/usr/bin/env python
+#-*- coding:UTF-8 -*-
+"""Binary, memory mapped alignments store"""
+
+import os
+import struct
+import sys
+
+import numpy as np
+
+MAGIC = b"FSALIGN2"
+# 魔数、版本、特征点数、特征点dtype、帧数、人脸数、帧名字节数
+HEADER = struct.Struct("<8sII4sQQQ")
+HEADER_SIZE = 64
+
+def column_layout(landmarks, dtype, frames, faces, name_bytes):
+    """
+    En.(name, dtype, shape) of the columns of a block, in file order.
+    The faces of frame i are rows face_offsets[i] to face_offsets[i + 1]
+    of the face columns, and its name is bytes name_offsets[i] to
+    name_offsets[i + 1] of names. The 8 byte columns come first so that
+    every column stays aligned
+    Cn.块中各列的(名称, dtype, 形状)，按文件中的顺序排列。第i帧的人脸是人脸
+    列中第face_offsets[i]到face_offsets[i + 1]行，其帧名是names中第
+    name_offsets[i]到name_offsets[i + 1]个字节。8字节的列在前，使每一列都保持对齐
+    """
+    return [("name_offsets", np.dtype("<u8"), (frames + 1, )),
+            ("face_offsets", np.dtype("<u8"), (frames + 1, )),
+            ("landmarks", np.dtype(dtype), (faces, landmarks, 2)),
+            ("boxes", np.dtype("<i4"), (faces, 5)),
+            ("integral", np.dtype("u1"), (faces, )),
+            ("names", np.dtype("u1"), (name_bytes, ))]
+
+def _exact_int(value, key, frame):
+    """
+    En.value as an int, refusing anything that wouldn't round trip
+    Cn.将value转换为int，拒绝任何无法无损往返的值
+    """
+    if int(value) != value:
+        raise ValueError("Frame {}: '{}' must be an integer to be stored in the binary "
+                         "alignments format, not {}".format(frame, key, value))
+    return int(value)
+
+def landmark_dtype(points):
+    """
+    En.The smallest dtype that holds the landmarks exactly: int32 for
+    the whole pixel landmarks the extractor writes, float32 or float64
+    otherwise
+    Cn.能精确保存特征点的最小dtype：提取器写出的整数像素特征点使用int32，
+    否则使用float32或float64
+    """
+    if not len(points) or (np.all(points == np.round(points))
+                           and np.abs(points).max() < 2 ** 31):
+        return "<i4"
+    if np.array_equal(points.astype("<f4"), points):
+        return "<f4"
+    return "<f8"
+
+def to_columns(items, landmarks):
+    """
+    En.Columns for (frame, faces) items
+    Cn.(帧, 人脸)条目对应的各列
+    """
+    names = list()
+    counts = list()
+    boxes = list()
+    integral = list()
+    points = list()
+    for frame, faces in items:
+        names.append(frame.encode("utf-8"))
+        counts.append(len(faces))
+        for face in faces:
+            unknown = set(face.keys()) - {"r", "x", "y", "w", "h", "landmarksXY"}
+            if unknown:
+                raise ValueError("Frame {}: keys {} can't be stored in the binary alignments "
+                                 "format".format(frame, sorted(unknown)))
+            # 全是int时numpy给出整数数组，据此判断特征点是否为整数
+            face_points = np.array(face["landmarksXY"]).reshape(-1, 2)
+            if face_points.shape[0] != landmarks:
+                raise ValueError("Frame {}: expected {} landmarks, got {}".format(
+                    frame, landmarks, face_points.shape[0]))
+            boxes.append([_exact_int(face.get(key, 0), key, frame)
+                          for key in ("r", "x", "y", "w", "h")])
+            integral.append(face_points.dtype.kind in "iu")
+            points.append(face_points)
+    points = np.array(points, dtype="float64").reshape(-1, landmarks, 2)
+    return {"name_lengths": np.array([len(name) for name in names], dtype="<u8"),
+            "counts": np.array(counts, dtype="<u8"),
+            "landmarks": points.astype(landmark_dtype(points)),
+            "boxes": np.array(boxes, dtype="<i4").reshape(-1, 5),
+            "integral": np.array(integral, dtype="u1"),
+            "names": np.frombuffer(b"".join(names), dtype="u1")}
+
+def pack(parts, landmarks):
+    """
+    En.Encode a block holding the concatenation of the columns in parts
+    Cn.将parts中各列拼接后编码为一个块
+    """
+    landmark_arrays = [part["landmarks"] for part in parts]
+    # 没有人脸的部分不参与决定dtype，以免int32被无谓地提升
+    dtypes = [array.dtype for array in landmark_arrays if len(array)]
+    dtype = np.result_type(*dtypes) if dtypes else np.dtype("<i4")
+    start = [np.zeros(1, dtype="<u8")]
+    columns = {"name_offsets": np.concatenate(start + [part["name_lengths"] for part in parts]),
+               "face_offsets": np.concatenate(start + [part["counts"] for part in parts]),
+               "landmarks": np.concatenate(landmark_arrays or [np.zeros((0, landmarks, 2))]),
+               "boxes": np.concatenate([part["boxes"] for part in parts] or [np.zeros((0, 5))]),
+               "integral": np.concatenate([part["integral"] for part in parts] or [[]]),
+               "names": np.concatenate([part["names"] for part in parts] or [[]])}
+    columns["name_offsets"] = np.cumsum(columns["name_offsets"])
+    columns["face_offsets"] = np.cumsum(columns["face_offsets"])
+    frames = len(columns["name_offsets"]) - 1
+    faces = int(columns["face_offsets"][-1])
+    header = HEADER.pack(MAGIC, 2, landmarks, dtype.str.encode("ascii"), frames, faces,
+                         int(columns["name_offsets"][-1]))
+    chunks = [header.ljust(HEADER_SIZE, b"\0")]
+    for name, column_dtype, shape in column_layout(landmarks, dtype, frames, faces,
+                                                   len(columns["names"])):
+        chunks.append(np.ascontiguousarray(columns[name], dtype=column_dtype)
+                      .reshape(shape).tobytes())
+    data = b"".join(chunks)
+    # 补齐到8字节，使下一个块的各列同样对齐
+    return data.ljust(-(-len(data) // 8) * 8, b"\0")
+
+def read_block(raw, offset):
+    """
+    En.(columns, frame names, size) of the block at offset in raw, a
+    uint8 array or memory map, or None if raw ends before the block
+    does. The columns are views of raw
+    Cn.raw(uint8数组或内存映射)中位于offset处的块的(各列, 帧名, 大小)，若raw
+    在块结束前就结束则返回None。各列都是raw的视图
+    """
+    if offset + HEADER_SIZE > len(raw):
+        return None
+    magic, version, landmarks, dtype, frames, faces, name_bytes = HEADER.unpack(
+        raw[offset:offset + HEADER.size].tobytes())
+    if magic != MAGIC or version != 2:
+        if offset == 0:
+            raise ValueError("Not a version 2 binary alignments file")
+        return None
+    columns = {"landmark_count": landmarks}
+    position = offset + HEADER_SIZE
+    for name, column_dtype, shape in column_layout(landmarks, dtype.rstrip(b"\0").decode("ascii"),
+                                                   frames, faces, name_bytes):
+        size = column_dtype.itemsize * int(np.prod(shape))
+        if position + size > len(raw):
+            return None
+        columns[name] = raw[position:position + size].view(column_dtype).reshape(shape)
+        position += size
+    position = offset + -(-(position - offset) // 8) * 8
+    if position > len(raw):
+        return None
+    names = columns["names"].tobytes()
+    offsets = columns["name_offsets"].tolist()
+    frame_names = [names[start:end].decode("utf-8")
+                   for start, end in zip(offsets[:-1], offsets[1:])]
+    return columns, frame_names, position - offset
+
+def read_blocks(raw):
+    """
+    En.The blocks of raw, the map of each frame name to its (block,
+    frame) and the size of the complete blocks. A frame written more
+    than once is looked up in its last write. A block cut short by a
+    crash ends the file
+    Cn.raw中的各块、每个帧名到其(块, 帧)的映射以及完整块的总大小。多次写入的
+    帧以最后一次写入为准。因崩溃而不完整的块视为文件结束
+    """
+    blocks = list()
+    index = dict()
+    offset = 0
+    while True:
+        block = read_block(raw, offset)
+        if block is None:
+            break
+        columns, frame_names, size = block
+        for idx, frame in enumerate(frame_names):
+            index[frame] = (len(blocks), idx)
+        blocks.append((columns, frame_names))
+        offset += size
+    return blocks, index, offset
+
+def frame_faces(columns, idx):
+    """
+    En.The alignments file entries of frame idx of a block
+    Cn.块中第idx帧的对齐文件条目
+    """
+    faces = list()
+    for face in range(int(columns["face_offsets"][idx]), int(columns["face_offsets"][idx + 1])):
+        rotation, left, top, width, height = columns["boxes"][face].tolist()
+        points = columns["landmarks"][face]
+        points = points.astype("int64" if columns["integral"][face] else "float64")
+        faces.append({"r": rotation,
+                      "x": left,
+                      "w": width,
+                      "y": top,
+                      "h": height,
+                      "landmarksXY": points.tolist()})
+    return faces
+
+def select_frames(columns, keep):
+    """
+    En.The columns of the frames of a block where keep is True, in the
+    form pack takes
+    Cn.块中keep为True的帧的各列，采用pack接受的形式
+    """
+    counts = np.diff(columns["face_offsets"]).astype("int64")
+    name_lengths = np.diff(columns["name_offsets"]).astype("int64")
+    keep_faces = np.repeat(keep, counts)
+    return {"name_lengths": name_lengths[keep],
+            "counts": counts[keep],
+            "landmarks": columns["landmarks"][keep_faces],
+            "boxes": columns["boxes"][keep_faces],
+            "integral": columns["integral"][keep_faces],
+            "names": columns["names"][np.repeat(keep, name_lengths)]}
+
+def landmarks_in(data):
+    """
+    En.Landmark count of the first face in an alignments dict
+    Cn.对齐字典中第一张人脸的特征点数量
+    """
+    for faces in data.values():
+        for face in faces:
+            return len(face["landmarksXY"])
+    return 68
+
+def to_bytes(data):
+    """
+    En.Encode an alignments dict in the binary format
+    Cn.将对齐字典编码为二进制格式
+    """
+    landmarks = landmarks_in(data)
+    return pack([to_columns(data.items(), landmarks)], landmarks)
+
+def from_bytes(data):
+    """
+    En.Decode the binary format into an alignments dict
+    Cn.将二进制格式解码为对齐字典
+    """
+    blocks, index, _ = read_blocks(np.frombuffer(data, dtype="u1"))
+    return {frame: frame_faces(blocks[block][0], idx) for frame, (block, idx) in index.items()}
+
+class BinaryAlignments(object):
+    """
+    En.Alignments held in a columnar file that is memory mapped for
+    reading. A file is a chain of blocks, each a header followed by its
+    columns: frame name and face offsets, the landmarks of every face as
+    one (faces, landmarks, 2) array (int32 for the whole pixel landmarks
+    the extractor writes), boxes and the frame names. The names are read
+    once on open and give O(1) lookup of any frame without touching the
+    other columns. New frames are appended to the end of the file as
+    blocks of their own, so extraction can write as it goes, and closing
+    a store that was written to merges its blocks back into one.
+    mode is 'r' to read, 'a' to read and append or 'w' to start a new file
+    Cn.对齐数据保存在列式文件中，读取时使用内存映射。文件是由块组成的链，
+    每个块由文件头及其各列组成：帧名和人脸偏移、所有人脸的特征点组成的
+    (人脸数, 特征点数, 2)数组(提取器写出的整数像素特征点使用int32)、人脸框以及
+    帧名。帧名在打开时读取一次，无需访问其他列即可O(1)查找任意帧。新帧作为
+    独立的块追加到文件末尾，因此提取时可以边处理边写入，关闭写入过的存储时
+    会将其各块合并为一个。mode为'r'表示读取，'a'表示读取并追加，'w'表示新建文件
+    """
+    def __init__(self, path, mode="r", landmarks=68):
+        self.path = path
+        self.mode = mode
+        self.landmarks = landmarks
+        # 崩溃时文件头可能还没写完，此时与文件不存在一样重新开始
+        if mode == "w" or (mode == "a" and (not os.path.exists(path)
+                                            or os.path.getsize(path) < HEADER_SIZE)):
+            with open(path, "wb") as outfile:
+                outfile.write(pack([], landmarks))
+        self.blocks = list()
+        self.index = dict()
+        self.size = 0
+        self._file = None
+        self.load()
+        if mode in ("a", "w"):
+            self._file = open(path, "ab")
+            # 丢弃崩溃时写了一半的块，使追加的块紧接在完整的块之后
+            self._file.truncate(self.size)
+
+    def load(self):
+        """
+        En.Memory map the file and read its frame names
+        Cn.内存映射文件并读取其帧名
+        """
+        if os.path.getsize(self.path) < HEADER_SIZE:
+            raise ValueError("Not a binary alignments file, it is too short to hold a "
+                             "header: {}".format(self.path))
+        raw = np.memmap(self.path, dtype="u1", mode="r")
+        self.blocks, self.index, self.size = read_blocks(raw)
+        if not self.blocks:
+            raise ValueError("Not a binary alignments file, its first block is cut "
+                             "short: {}".format(self.path))
+        self.landmarks = self.blocks[0][0]["landmark_count"]
+
+    def __contains__(self, frame):
+        return frame in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def keys(self):
+        """
+        En.The frame names
+        Cn.帧名
+        """
+        return self.index.keys()
+
+    def items(self):
+        """
+        En.(frame, faces) for every frame
+        Cn.每一帧的(帧, 人脸)
+        """
+        for frame in self.index:
+            yield frame, self[frame]
+
+    def __getitem__(self, frame):
+        block, idx = self.index[frame]
+        return frame_faces(self.blocks[block][0], idx)
+
+    def get(self, frame, default=None):
+        """
+        En.The faces of a frame, or default if it isn't in the store
+        Cn.帧的人脸，若不在存储中则返回default
+        """
+        return self[frame] if frame in self.index else default
+
+    def get_landmarks(self, frame):
+        """
+        En.A (faces, landmarks, 2) view of a frame's landmarks, straight
+        from the memory map, in the dtype they are stored in
+        Cn.直接来自内存映射的帧特征点视图，形状为(人脸数, 特征点数, 2)，
+        dtype与存储时相同
+        """
+        block, idx = self.index[frame]
+        columns = self.blocks[block][0]
+        start, end = columns["face_offsets"][idx:idx + 2].tolist()
+        return columns["landmarks"][start:end]
+
+    def __setitem__(self, frame, faces):
+        self.append(frame, faces)
+
+    def append(self, frame, faces):
+        """
+        En.Append a frame's faces to the end of the file
+        Cn.将一帧的人脸追加到文件末尾
+        """
+        if self._file is None:
+            raise IOError("Binary alignments file {} was opened read only".format(self.path))
+        data = pack([to_columns([(frame, faces)], self.landmarks)], self.landmarks)
+        self._file.write(data)
+        # 新块直接从内存中读取，无需重新映射文件
+        columns, frame_names, _ = read_block(np.frombuffer(data, dtype="u1"), 0)
+        self.index[frame] = (len(self.blocks), 0)
+        self.blocks.append((columns, frame_names))
+        self.size += len(data)
+
+    def compact(self):
+        """
+        En.Rewrite the file as a single block holding the last write of
+        each frame
+        Cn.将文件重写为单个块，其中保存每一帧的最后一次写入
+        """
+        parts = list()
+        for block, (columns, frame_names) in enumerate(self.blocks):
+            keep = np.array([self.index[frame] == (block, idx)
+                             for idx, frame in enumerate(frame_names)], dtype="bool")
+            if keep.any():
+                parts.append(select_frames(columns, keep))
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "wb") as outfile:
+            outfile.write(pack(parts, self.landmarks))
+        self.blocks = list()
+        os.replace(temp_path, self.path)
+
+    def close(self):
+        """
+        En.Flush and close the file, merging its blocks if it was written to
+        Cn.刷新并关闭文件，若写入过则合并其各块
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            if len(self.blocks) > 1:
+                self.compact()
+            self.load()
+
+    def to_dict(self):
+        """
+        En.All alignments as a dict
+        Cn.以字典形式返回所有对齐数据
+        """
+        return dict(self.items())
+
+def get_alignments_path(input_path, alignments_path=None, serializer="json"):
+    """
+    En.The alignments file given on the command line, or the default
+    one next to the input folder or video
+    Cn.命令行中给出的对齐文件，或位于输入文件夹或视频旁边的默认对齐文件
+    """
+    if alignments_path:
+        return alignments_path
+    from lib.Serializer import get_serializer
+    folder = os.path.dirname(input_path) if os.path.isfile(input_path) else input_path
+    return os.path.join(folder, "alignments.{}".format(get_serializer(serializer).ext))
+
+def load_alignments(path):
+    """
+    En.Read an alignments file. Binary files are opened as a read only
+    store instead of being read into a dict
+    Cn.读取对齐文件。二进制文件以只读存储的方式打开，而不是读入字典
+    """
+    from lib.Serializer import BinarySerializer, get_serializer_from_filename
+    serializer = get_serializer_from_filename(path)
+    if serializer is BinarySerializer:
+        return BinaryAlignments(path, mode="r")
+    with open(path, serializer.roptions) as alignments:
+        return serializer.unmarshal(alignments.read())
+
+def convert_alignments(input_path, output_path):
+    """
+    En.Convert an alignments file between any two of the json, pickle,
+    yaml and binary formats, picked from the file extensions
+    Cn.在json、pickle、yaml和二进制格式之间转换对齐文件，格式由文件扩展名决定
+    """
+    from lib.Serializer import get_serializer_from_filename
+    serializer = get_serializer_from_filename(input_path)
+    with open(input_path, serializer.roptions) as infile:
+        data = serializer.unmarshal(infile.read())
+    serializer = get_serializer_from_filename(output_path)
+    with open(output_path, serializer.woptions) as outfile:
+        outfile.write(serializer.marshal(data))
+    print("Converted {} frames from {} to {}".format(len(data), input_path, output_path))
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python -m lib.alignments <input alignments> <output alignments>")
+        exit(1)
+    convert_alignments(sys.argv[1], sys.argv[2])
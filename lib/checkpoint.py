@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+#-*- coding:UTF-8 -*-
+"""Background, atomic saving of model weights"""
+
+import os
+import shutil
+import threading
+import time
+import traceback
+
+from lib.utils import link_or_copy
+
+class Checkpointer(object):
+    """
+    En.Saves a model without stalling training. The training thread only
+    takes an in memory snapshot of the weights (model.snapshot()), and a
+    background thread writes it (model.write_snapshot(snapshot, folder)).
+    Each save is written to a temporary folder that is renamed to
+    checkpoints/<iteration> once complete, and its files are then moved
+    over the ones in the model folder one rename at a time, so a crash
+    never leaves a half written weights file behind. The last keep
+    checkpoints are kept. A save requested while the previous one is
+    still being written is skipped. Models without snapshot support are
+    saved in the foreground with save_weights(), as before
+    Cn.在不阻塞训练的情况下保存模型。训练线程只在内存中获取权重的快照
+    (model.snapshot())，由后台线程写入(model.write_snapshot(snapshot, folder))。
+    每次保存先写入临时文件夹，完成后重命名为checkpoints/<iteration>，然后
+    其文件逐个通过重命名替换模型文件夹中的文件，因此崩溃永远不会留下写了
+    一半的权重文件。保留最近keep个检查点。若上一次保存仍在写入时请求保存，
+    则跳过本次保存。不支持快照的模型仍像以前一样用save_weights()在前台保存
+    """
+    def __init__(self, model_dir, keep=3):
+        self.model_dir = str(model_dir)
+        self.folder = os.path.join(self.model_dir, "checkpoints")
+        self.keep = max(1, keep)
+        self.thread = None
+        self.saved = self.skipped = 0
+        self.snapshot_time = self.write_time = 0.0
+        self.error = None
+
+    @property
+    def busy(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def save(self, model, iteration):
+        """
+        En.Start saving the model. Returns False if the save was skipped
+        Cn.开始保存模型。若跳过了本次保存则返回False
+        """
+        if not hasattr(model, "snapshot"):
+            model.save_weights()
+            self.saved += 1
+            return True
+        if self.busy:
+            self.skipped += 1
+            return False
+        started = time.time()
+        snapshot = model.snapshot()
+        self.snapshot_time += time.time() - started
+        self.thread = threading.Thread(target=self.write, args=(model, snapshot, iteration))
+        self.thread.daemon = True
+        self.thread.start()
+        return True
+
+    def wait(self):
+        """
+        En.Block until the save in flight, if any, is written
+        Cn.阻塞直到正在进行的保存(若有)写入完成
+        """
+        if self.thread is not None:
+            self.thread.join()
+
+    def write(self, model, snapshot, iteration):
+        """
+        En.Write a snapshot as a new checkpoint and publish it to the model folder
+        Cn.将快照写为新的检查点并发布到模型文件夹
+        """
+        started = time.time()
+        name = "{:09d}".format(iteration)
+        temp_folder = os.path.join(self.folder, ".{}.tmp".format(name))
+        try:
+            shutil.rmtree(temp_folder, ignore_errors=True)
+            os.makedirs(temp_folder)
+            model.write_snapshot(snapshot, temp_folder)
+            checkpoint = os.path.join(self.folder, name)
+            shutil.rmtree(checkpoint, ignore_errors=True)
+            os.replace(temp_folder, checkpoint)
+            for filename in sorted(os.listdir(checkpoint)):
+                destination = os.path.join(self.model_dir, filename)
+                temp_path = destination + ".tmp"
+                link_or_copy(os.path.join(checkpoint, filename), temp_path)
+                os.replace(temp_path, destination)
+            self.prune()
+            self.saved += 1
+        except Exception:
+            self.error = traceback.format_exc()
+            print("Failed to save checkpoint {}:\n{}".format(name, self.error))
+            shutil.rmtree(temp_folder, ignore_errors=True)
+        self.write_time += time.time() - started
+
+    def prune(self):
+        """
+        En.Delete all but the newest keep checkpoints
+        Cn.删除除最新keep个之外的所有检查点
+        """
+        checkpoints = sorted(name for name in os.listdir(self.folder) if name.isdigit())
+        for name in checkpoints[:-self.keep]:
+            shutil.rmtree(os.path.join(self.folder, name), ignore_errors=True)
@@ -7,6 +7,7 @@ import os
 import platform
 import sys
 from importlib import import_module
+from lib.frame_ranges import parse_frame_range
 from plugins.PluginLoader import PluginLoader
 
 class FullHelpArgumentParser(argparse.ArgumentParser):
@@ -23,6 +24,74 @@ class FullHelpArgumentParser(argparse.ArgumentParser):
         args = {"prog":self.prog,"message":message}
         self.exit(2,"%(prog)s: error: %(message)s\n" % args)
 
+class LazyChoices(object):
+    """
+    En.Choices for an argument that are only looked up the first time
+    argparse needs them, i.e. when the argument is given or its help
+    is shown. Used for choices that need plugin discovery, so commands
+    that don't use them don't pay for it
+    Cn.仅在argparse第一次需要时(即给出该参数或显示其帮助时)才查找的
+    参数选项。用于需要发现插件的选项，使不使用它们的命令无需为此付出代价
+    """
+    def __init__(self, loader):
+        self.loader = loader
+        self._choices = None
+
+    @property
+    def choices(self):
+        """
+        En.The resolved choices
+        Cn.解析后的选项
+        """
+        if self._choices is None:
+            self._choices = tuple(self.loader())
+        return self._choices
+
+    def __contains__(self, item):
+        return item in self.choices
+
+    def __iter__(self):
+        return iter(self.choices)
+
+    def __len__(self):
+        return len(self.choices)
+
+    def __repr__(self):
+        return repr(self.choices)
+
+class LazyDefault(object):
+    """
+    En.A default value that is only computed when the script runs.
+    ScriptExecutor resolves any argument still holding a LazyDefault
+    Cn.仅在脚本运行时才计算的默认值。ScriptExecutor会解析所有仍为
+    LazyDefault的参数
+    """
+    def __init__(self, loader):
+        self.loader = loader
+
+    def resolve(self):
+        """
+        En.Compute the default
+        Cn.计算默认值
+        """
+        return self.loader()
+
+    def __repr__(self):
+        return "<default: {}>".format(getattr(self.loader, "__name__", "lazy"))
+
+def frame_range(text):
+    """
+    En.argparse type for one --frame-ranges range. The range is checked
+    here, so a bad one is a usage error, and kept as text
+    Cn.单个--frame-ranges范围的argparse类型。在此检查范围，使错误的范围成为
+    用法错误，并保留为文本
+    """
+    try:
+        parse_frame_range(text)
+    except ValueError as err:
+        raise argparse.ArgumentTypeError(str(err))
+    return text
+
 class FaceSwapArgs(object):
     """
     En.Faceswap argument parser function that are universal to all commends.
@@ -33,6 +102,7 @@ class FaceSwapArgs(object):
     def __init__(self, subparser, command, description="default", subparsers=None):
         self.argument_list = self.get_argument_list()
         self.optional_arguments = self.get_optional_arguments()
+        self.global_arguments = self.get_global_arguments()
         if not subparser:
             return
         self.parser = self.create_parser(subparser, command, description)
@@ -62,6 +132,65 @@ class FaceSwapArgs(object):
         argument_list = []
         return argument_list
 
+    @staticmethod
+    def get_global_arguments():
+        """
+        En.Arguments of every command, for metrics and profiling
+        Cn.所有命令共有的参数，用于指标和性能分析
+        """
+        argument_list = []
+        argument_list.append({
+                             "opts": ("--metrics-json", ),
+                             "dest": "metrics_json",
+                             "default": None,
+                             "help": "Write the stage timers and counters "
+                                     "(load, detect, align, mask, blend, "
+                                     "write, train-step, save...) to this "
+                                     "json file while running and at exit"
+                             })
+        argument_list.append({
+                             "opts": ("--metrics-prom", ),
+                             "dest": "metrics_prom",
+                             "default": None,
+                             "help": "Write the stage timers and counters "
+                                     "to this file in the Prometheus text "
+                                     "format while running and at exit. "
+                                     "Point it at node exporter's textfile "
+                                     "collector directory, e.g. "
+                                     "/var/lib/node_exporter/textfile_collector/facewap.prom"
+                             })
+        argument_list.append({
+                             "opts": ("--metrics-interval", ),
+                             "type": float,
+                             "dest": "metrics_interval",
+                             "default": 30.0,
+                             "help": "Seconds between metrics dumps while "
+                                     "running. 0 only writes them at exit. "
+                                     "Defaults to 30"
+                             })
+        argument_list.append({
+                             "opts": ("--profile", ),
+                             "dest": "profile",
+                             "choices": ("cprofile", "sample"),
+                             "default": None,
+                             "help": "Profile the run. 'cprofile' traces "
+                                     "every call of the main thread into a "
+                                     ".prof file for pstats/snakeviz. "
+                                     "'sample' samples the stacks of all "
+                                     "threads every 5ms into a collapsed "
+                                     "stacks file for flamegraph.pl or "
+                                     "speedscope, at a much lower cost. "
+                                     "Worker processes are not profiled"
+                             })
+        argument_list.append({
+                             "opts": ("--profile-output", ),
+                             "dest": "profile_output",
+                             "default": None,
+                             "help": "Where to write the profile. Defaults to "
+                                     "facewap_<command>.prof or .folded"
+                             })
+        return argument_list
+
     @staticmethod
     def create_parser(subparser, command, description):
         """
@@ -81,7 +210,7 @@ class FaceSwapArgs(object):
         En.Parse the arguments passed in from argparse
         Cn.解析从argparse传入的参数
         """
-        for option in self.argument_list + self.optional_arguments:
+        for option in self.argument_list + self.optional_arguments + self.global_arguments:
             args = option["opts"]
             kwargs = {key: option[key] for key in option.keys() if key != "opts"}
             self.parser.add_argument(*args, **kwargs)
@@ -167,14 +296,33 @@ class ScriptExecutor(object):
                         "macOS users need to install XQuartz. " 
                         "See https://support.apple.com/en-gb/HT201341")
                 exit(1)
+
+    @staticmethod
+    def resolve_defaults(arguments):
+        """
+        En.Replace defaults that were left lazy while parsing
+        Cn.替换解析时保留为惰性的默认值
+        """
+        for key, value in vars(arguments).items():
+            if isinstance(value, LazyDefault):
+                setattr(arguments, key, value.resolve())
+
     def execute_script(self, arguments):
         """
-        En.Run the script for called command
-        Cn.运行被调用的命令脚本
+        En.Run the script for called command, with the metrics dumps and
+        profiler asked for on the command line around it
+        Cn.运行被调用的命令脚本，并在其外围运行命令行所要求的指标写出和性能分析
         """
+        from lib.metrics import Instrumentation
+        self.resolve_defaults(arguments)
         script = self.import_script()
-        process = script(arguments)
-        process.process()
+        instrumentation = Instrumentation(self.command, arguments)
+        instrumentation.start()
+        try:
+            process = script(arguments)
+            process.process()
+        finally:
+            instrumentation.stop()
 
 
 class ExtractConvertArgs(FaceSwapArgs):
@@ -195,10 +343,11 @@ class ExtractConvertArgs(FaceSwapArgs):
         argparse and gui
         Cn.将参数放在列表中以便argparse和gui进行访问
         """
-        alignments_filetypes = [["Serializers", ["json", "p", "yaml"]],
+        alignments_filetypes = [["Serializers", ["json", "p", "yaml", "fsa"]],
                                 ["JSON", ["json"]],
                                 ["Pickle", ["p"]],
-                                ["YAML",["yaml"]]]
+                                ["YAML",["yaml"]],
+                                ["Binary", ["fsa"]]]
         alignments_filetypes = FileFullPaths.prep_filetypes(alignments_filetypes)
         argument_list = list()
         argument_list.append({
@@ -208,7 +357,8 @@ class ExtractConvertArgs(FaceSwapArgs):
                              "default": "input", 
                              "help": "Input directory. A directory "
                                      "containing the files you wish to " 
-                                     "process. Defaults to 'input'"
+                                     "process, or a video file to read the "
+                                     "frames from directly. Defaults to 'input'"
                             })
         argument_list.append({
                              "opts": ("-o", "--output-dir"),
@@ -232,11 +382,15 @@ class ExtractConvertArgs(FaceSwapArgs):
                              "type": str.lower,
                              "dest": "serializer",
                              "default": "json",
-                             "choices": ("json", "pickle", "yaml"),
+                             "choices": ("json", "pickle", "yaml", "binary"),
                              "help": "Serializer for alignments file. If "
                                     "yaml is chosen and not available, then " 
                                     "json will be used as the default " 
-                                    "fallback."
+                                    "fallback. binary is a compact, memory "
+                                    "mapped format that is written as frames "
+                                    "are extracted and loads instantly. "
+                                    "Convert between formats with "
+                                    "'python -m lib.alignments in out'"
                             })
         argument_list.append({
                             "opts": ("-D", "--detector"),
@@ -320,7 +474,9 @@ class ExtractArgs(ExtractConvertArgs):
                             "opts": ("-j", "--processes"),
                             "type": int,
                             "default": 1,
-                            "help": "Number of CPU processes to use. "
+                            "help": "Number of CPU processes to use for "
+                                    "face detection. Loading, alignment and "
+                                    "writing get their own smaller pools. "
                                     "WARNING: ONLY USE THIS IF YOU ARE NOT "
                                     "EXTRACTING ON A GPU. Anything above 1 "
                                     "process on a GPU will run out of "
@@ -333,6 +489,34 @@ class ExtractArgs(ExtractConvertArgs):
                             "default": False,
                             "help": "Skips frames that have already been extracted"
                             })
+        argument_list.append({
+                            "opts": ("-fbt", "--frame-blur-threshold"),
+                            "type": float,
+                            "dest": "frame_blur_thresh",
+                            "default": None,
+                            "help": "Skip frames blurrier than this before "
+                                    "running detection. Blur is measured "
+                                    "on the whole frame, scaled down to "
+                                    "320 pixels wide, so the values are "
+                                    "not comparable to --blur-threshold, "
+                                    "which measures the aligned face. "
+                                    "Each frame's score is written to "
+                                    "blur_scores.csv in the output folder"
+                            })
+        argument_list.append({
+                            "opts": ("-ti", "--track-interval"),
+                            "type": int,
+                            "dest": "track_interval",
+                            "default": 0,
+                            "help": "Tracking mode for videos and frame "
+                                    "sequences. Run the detector every N "
+                                    "frames, or when a face is lost, and "
+                                    "track faces from the previous frame in "
+                                    "between. Landmarks are smoothed over "
+                                    "time. Detection runs in a single "
+                                    "process in this mode. 0 turns "
+                                    "tracking off"
+                            })
         argument_list.append({
                             "opts": ("-dl", "--debug-landmarks"),
                             "action": "store_true",
@@ -393,9 +577,12 @@ class ConvertArgs(ExtractConvertArgs):
                             "opts": ("-t", "--trainer"), 
                             "type": str,
                             # 区分大小写，因为它用于加载插件
-                            "choices": PluginLoader.get_available_models(),
-                            "default": PluginLoader.get_default_model(), 
-                            "help": "Select the trainer that was used to create the model"
+                            "choices": LazyChoices(PluginLoader.get_available_models),
+                            # 给出metavar，否则argparse构建参数时就会遍历choices
+                            "metavar": "TRAINER",
+                            "default": LazyDefault(PluginLoader.get_default_model),
+                            "help": "Select the trainer that was used to create the model. "
+                                    "One of: %(choices)s"
                             })
         argument_list.append({
                             "opts": ("-c", "--converter"), 
@@ -448,15 +635,30 @@ class ConvertArgs(ExtractConvertArgs):
                             "default": 1,
                             "help": "Number of GPUs to use for conversion"
                             })
+        argument_list.append({
+                            "opts": ("-w", "--workers"),
+                            "type": int,
+                            "default": 1,
+                            "help": "Number of processes to convert frames "
+                                    "with. Each process loads its own copy "
+                                    "of the model, so only use this when "
+                                    "converting on the CPU. Frames are "
+                                    "still written out in order"
+                            })
         argument_list.append({
                             "opts": ("-fr", "--frame-ranges"),
                             "nargs": "+",
-                            "type": str,
+                            "type": frame_range,
                             "help": "frame ranges to apply transfer to e.g. "
                                     "For frames 10 to 50 and 90 to 100 use "
-                                    "--frame-ranges 10-50 90-100. Files "
-                                    "must have the frame-number as the last "
-                                    "number in the name!"
+                                    "--frame-ranges 10-50 90-100. Leave the "
+                                    "end out (90-) to go to the last frame. "
+                                    "A single number (90) is that frame "
+                                    "alone. "
+                                    "Files must have the frame-number as the "
+                                    "last number in the name! Frames outside "
+                                    "the ranges are hardlinked or cloned into "
+                                    "the output folder without being decoded"
                             })
         argument_list.append({
                             "opts": ("-d", "--discard-frames"),
@@ -465,7 +667,10 @@ class ConvertArgs(ExtractConvertArgs):
                             "default": False,
                             "help": "When used with --frame-ranges discards "
                                     "frames that are not processed instead "
-                                    "of writing them out unchanged"
+                                    "of writing them out unchanged. The "
+                                    "audio of a video input is then left "
+                                    "out of --output-video, as it would no "
+                                    "longer match the frames"
                             })
         argument_list.append({
                             "opts": ("-s", "--swap-model"),
@@ -488,6 +693,27 @@ class ConvertArgs(ExtractConvertArgs):
                             "default": False, 
                             "help": "Use histogram matching. (Masked converter only)"
                             })
+        argument_list.append({
+                            "opts": ("--mask-cache", ),
+                            "action": DirFullPaths,
+                            "dest": "mask_cache",
+                            "default": None,
+                            "help": "Folder to cache masks in. Masks are "
+                                    "keyed by the face's alignment, "
+                                    "--mask-type, --erosion-kernel-size and "
+                                    "--blur-size, so reruns that only "
+                                    "change the blending settings reuse "
+                                    "them. (Masked converter only)"
+                            })
+        argument_list.append({
+                            "opts": ("--mask-cache-size", ),
+                            "type": int,
+                            "dest": "mask_cache_size",
+                            "default": 1024,
+                            "help": "Size limit of the mask cache in MB. "
+                                    "The least recently used masks are "
+                                    "deleted to stay under it"
+                            })
         argument_list.append({
                             "opts": ("-sm", "--smooth-mask"),
                             "action": "store_true", 
@@ -502,6 +728,163 @@ class ConvertArgs(ExtractConvertArgs):
                             "default": True,
                             "help": "Average color adjust. (Adjust converter only)"
                             })
+        argument_list.append({
+                            "opts": ("--shot-stats", ),
+                            "action": "store_true",
+                            "dest": "shot_stats",
+                            "default": False,
+                            "help": "Split the input into shots and use "
+                                    "the colour statistics of each shot "
+                                    "for --match-histogram and "
+                                    "--avg-color-adjust instead of "
+                                    "measuring every frame. Faster, and "
+                                    "steadier colour within a shot. The "
+                                    "statistics are computed once and "
+                                    "kept in shots.npz next to the input. "
+                                    "Needs an alignments file"
+                            })
+        argument_list.append({
+                            "opts": ("-ov", "--output-video"),
+                            "type": str,
+                            "dest": "output_video",
+                            "default": None,
+                            "help": "Encode the converted frames straight "
+                                    "into this video file instead of "
+                                    "writing images to the output "
+                                    "directory. Frames outside "
+                                    "--frame-ranges are included unchanged "
+                                    "unless --discard-frames is set. The "
+                                    "audio of a video input is copied over, "
+                                    "except with --discard-frames. Frames "
+                                    "that can't be read are replaced by the "
+                                    "previous frame"
+                            })
+        argument_list.append({
+                            "opts": ("--fps", ),
+                            "type": float,
+                            "default": None,
+                            "help": "Frame rate of --output-video. Defaults "
+                                    "to the input video's, or 25 for a "
+                                    "folder of frames"
+                            })
+        argument_list.append({
+                            "opts": ("--encoder-args", ),
+                            "type": str,
+                            "dest": "encoder_args",
+                            "default": "-c:v libx264 -crf 18 -preset medium -pix_fmt yuv420p",
+                            "help": "ffmpeg output options for "
+                                    "--output-video"
+                            })
+        return argument_list
+
+class TuneArgs(ConvertArgs):
+    """
+    En.Class to parse the command line arguments for tuning the convert
+    settings. Takes every convert argument as the base settings
+    Cn.用于调优转换设置的命令行参数解析类。以所有转换参数作为基础设置
+    """
+    @staticmethod
+    def get_optional_arguments():
+        """
+        En.Put the arguments in a list so that they are accessible
+        from both argparse and gui
+        Cn.将参数放在一个列表中，以便argparse和gui都可以访问
+        """
+        argument_list = ConvertArgs.get_optional_arguments()
+        argument_list.append({
+                            "opts": ("-nf", "--frames"),
+                            "type": int,
+                            "default": 100,
+                            "help": "Number of aligned frames of the input "
+                                    "to tune on"
+                            })
+        argument_list.append({
+                            "opts": ("--grid", ),
+                            "action": FileFullPaths,
+                            "default": None,
+                            "help": "json file mapping convert settings "
+                                    "(e.g. \"mask_type\", \"blur_size\") to "
+                                    "the values to try, cheapest first. "
+                                    "Defaults to mask type, blur size, "
+                                    "sharpen, match histogram and seamless"
+                            })
+        argument_list.append({
+                            "opts": ("--reference", ),
+                            "action": FileFullPaths,
+                            "default": None,
+                            "help": "Reference render to score against. "
+                                    "Defaults to rendering the most "
+                                    "expensive settings of the grid"
+                            })
+        argument_list.append({
+                            "opts": ("--vmaf-model", ),
+                            "action": FileFullPaths,
+                            "dest": "vmaf_model",
+                            "default": None,
+                            "help": "VMAF model. Defaults to the bundled "
+                                    "vmaf_v0.6.1.pkl, or vmaf_4k_v0.6.1.pkl "
+                                    "for 4K input"
+                            })
+        argument_list.append({
+                            "opts": ("--min-vmaf", ),
+                            "type": float,
+                            "dest": "min_vmaf",
+                            "default": None,
+                            "help": "Report the fastest settings that "
+                                    "reach this VMAF score"
+                            })
+        argument_list.append({
+                            "opts": ("--results", ),
+                            "type": str,
+                            "default": None,
+                            "help": "Where to write the json results. "
+                                    "Defaults to tune_results.json in the "
+                                    "output directory"
+                            })
+        argument_list.append({
+                            "opts": ("--keep-renders", ),
+                            "action": "store_true",
+                            "dest": "keep_renders",
+                            "default": False,
+                            "help": "Keep every render instead of deleting "
+                                    "it once scored"
+                            })
+        return argument_list
+
+class BatchArgs(FaceSwapArgs):
+    """
+    En.Class to parse the command line arguments for running a list of
+    jobs in one process
+    Cn.用于在一个进程中运行作业列表的命令行参数解析类
+    """
+    @staticmethod
+    def get_argument_list():
+        """
+        En.Put the arguments in a list so that they are accessible
+        from both argparse and gui
+        Cn.将参数放在一个列表中，以便argparse和gui都可以访问
+        """
+        argument_list = []
+        argument_list.append({
+                            "opts": ("-J", "--job-file"),
+                            "action": FileFullPaths,
+                            "dest": "job_file",
+                            "required": True,
+                            "help": "Text file with one job per line: an "
+                                    "extract, convert or tune command "
+                                    "followed by its arguments, as they "
+                                    "would be given to facewap.py. Blank "
+                                    "lines and lines starting with # are "
+                                    "ignored"
+                            })
+        argument_list.append({
+                            "opts": ("-k", "--keep-going"),
+                            "action": "store_true",
+                            "dest": "keep_going",
+                            "default": False,
+                            "help": "Carry on with the next job when one "
+                                    "fails, instead of stopping"
+                            })
         return argument_list
 
 class TrainArgs(FaceSwapArgs):
@@ -552,14 +935,24 @@ class TrainArgs(FaceSwapArgs):
                             "help": "Sets the number of iterations before "
                                     "saving the model"
                             })
+        argument_list.append({
+                            "opts": ("-kc", "--keep-checkpoints"),
+                            "type": int,
+                            "dest": "keep_checkpoints",
+                            "default": 3,
+                            "help": "Number of past saves to keep in the "
+                                    "model directory's checkpoints folder"
+                            })
         argument_list.append({
                             "opts": ("-t", "--trainer"),
                             "type": str,
-                            "choices": PluginLoader.get_available_models(),
-                            "default": PluginLoader.get_default_model(),
+                            "choices": LazyChoices(PluginLoader.get_available_models),
+                            # 给出metavar，否则argparse构建参数时就会遍历choices
+                            "metavar": "TRAINER",
+                            "default": LazyDefault(PluginLoader.get_default_model),
                             "help": "Select which trainer to use, Use "
                                     "LowMem for cards with less than 2GB of "
-                                    "VRAM"
+                                    "VRAM. One of: %(choices)s"
                             })
         argument_list.append({
                             "opts": ("-bs", "--batch-size"),
@@ -567,6 +960,21 @@ class TrainArgs(FaceSwapArgs):
                             "default": 64,
                             "help": "Batch size, as a power of 2 (64, 128, 256, etc)"
                             })
+        argument_list.append({
+                            "opts": ("-lw", "--loader-workers"),
+                            "type": int,
+                            "dest": "loader_workers",
+                            "default": max(1, (os.cpu_count() or 2) // 2),
+                            "help": "Number of processes that warp training "
+                                    "batches. Defaults to half the CPU cores"
+                            })
+        argument_list.append({
+                            "opts": ("-pf", "--prefetch"),
+                            "type": int,
+                            "default": 4,
+                            "help": "Number of batches per side the loader "
+                                    "workers keep ready ahead of the trainer"
+                            })
         argument_list.append({
                             "opts": ("-ep", "--epochs"),
                             "type": int,
@@ -595,6 +1003,16 @@ class TrainArgs(FaceSwapArgs):
                             "help": "Writes the training result to a file "
                                     "even on preview mode"
                             })
+        argument_list.append({
+                            "opts": ("-pr", "--preview-rate"),
+                            "type": float,
+                            "dest": "preview_rate",
+                            "default": 5.0,
+                            "help": "Seconds between preview images. "
+                                    "Previews are rendered in their own "
+                                    "process and dropped if it falls "
+                                    "behind, so training never waits on them"
+                            })
         argument_list.append({
                             "opts": ("-pl", "--use-perceptual-loss"),
                             "action": "store_true",
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+#-*- coding:UTF-8 -*-
+"""Face detection and landmark location"""
+
+# face_recognition仅在检测人脸时导入，使DetectedFace无需加载dlib即可使用
+
+def detect_faces(frame, detector="hog"):
+    """
+    En.Return the face locations in a BGR frame as (x, y, w, h) tuples.
+    'all' runs the fast hog detector first and falls back to cnn when
+    hog finds nothing
+    Cn.以(x, y, w, h)元组返回BGR帧中的人脸位置。'all'先运行较快的hog
+    检测器，hog未找到人脸时再使用cnn
+    """
+    import face_recognition
+    rgb = frame[:, :, ::-1]
+    models = ("hog", "cnn") if detector == "all" else (detector, )
+    for model in models:
+        locations = face_recognition.face_locations(rgb, model=model)
+        if locations:
+            return [(left, top, right - left, bottom - top)
+                    for (top, right, bottom, left) in locations]
+    return list()
+
+def load_detection_models():
+    """
+    En.Load the face detection models ahead of the first detection.
+    face_recognition loads the hog and cnn detectors and the landmark
+    predictor when it is imported, which is what takes seconds, and
+    Python only does that once per process. Processes forked afterwards
+    inherit the loaded models
+    Cn.在第一次检测之前加载人脸检测模型。face_recognition在导入时加载hog和
+    cnn检测器以及特征点预测器，这正是耗时数秒的部分，且Python每个进程只导入
+    一次。之后fork出的进程会继承已加载的模型
+    """
+    import face_recognition
+
+def get_landmarks(frame, locations):
+    """
+    En.Return the 68 point landmarks for each (x, y, w, h) face location
+    Cn.返回每个(x, y, w, h)人脸位置的68个特征点
+    """
+    from face_recognition.api import _raw_face_landmarks
+    css_locations = [(y, x + w, y + h, x) for (x, y, w, h) in locations]
+    raw_landmarks = _raw_face_landmarks(frame[:, :, ::-1], css_locations)
+    return [[(point.x, point.y) for point in landmarks.parts()]
+            for landmarks in raw_landmarks]
+
+class DetectedFace(object):
+    """
+    En.A detected face and its landmarks, in the coordinates of the
+    (possibly rotated) frame it was found in
+    Cn.检测到的人脸及其特征点，坐标基于发现该人脸的(可能经过旋转的)帧
+    """
+    def __init__(self, image=None, x=None, w=None, y=None, h=None, landmarksXY=None, r=0):
+        self.image = image
+        self.x = x
+        self.w = w
+        self.y = y
+        self.h = h
+        self.r = r
+        self.landmarksXY = landmarksXY
+
+    def landmarksAsXY(self):
+        """
+        En.The landmarks as a list of (x, y) tuples
+        Cn.以(x, y)元组列表形式返回特征点
+        """
+        return self.landmarksXY
+
+    def to_alignment(self):
+        """
+        En.The face as an alignments file entry
+        Cn.以对齐文件条目的形式返回人脸
+        """
+        return {"r": self.r,
+                "x": self.x,
+                "w": self.w,
+                "y": self.y,
+                "h": self.h,
+                "landmarksXY": [list(point) for point in self.landmarksXY]}
+
+    @classmethod
+    def from_alignment(cls, alignment, image=None):
+        """
+        En.Build a face from an alignments file entry
+        Cn.从对齐文件条目构建人脸
+        """
+        return cls(image=image,
+                   x=alignment["x"],
+                   w=alignment["w"],
+                   y=alignment["y"],
+                   h=alignment["h"],
+                   landmarksXY=[tuple(point) for point in alignment["landmarksXY"]],
+                   r=alignment.get("r", 0))
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+#-*- coding:UTF-8 -*-
+"""Frame range index for --frame-ranges"""
+
+import os
+import re
+from bisect import bisect_right
+
+class FrameRanges(object):
+    """
+    En.The --frame-ranges compiled into sorted, merged intervals. A
+    frame number is looked up with a binary search over the interval
+    starts instead of being tested against every range. The frame number
+    of a file is the last number in its name; files without a number are
+    always in range
+    Cn.将--frame-ranges编译为排序并合并后的区间。查找帧号时在区间起点上
+    进行二分查找，而不是逐个测试每个范围。文件的帧号是其文件名中的最后
+    一个数字；没有数字的文件始终在范围内
+    """
+    number = re.compile(r"(\d+)(?!.*\d)")
+
+    def __init__(self, ranges):
+        self.starts = list()
+        self.ends = list()
+        for start, end in sorted(ranges):
+            if self.ends and start <= self.ends[-1] + 1:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    @classmethod
+    def from_strings(cls, ranges):
+        """
+        En.Build the index from strings like "10-50", see parse_frame_range
+        Cn.从"10-50"这样的字符串构建索引，参见parse_frame_range
+        """
+        return cls([parse_frame_range(frame_range) for frame_range in ranges])
+
+    def __contains__(self, frame_no):
+        idx = bisect_right(self.starts, frame_no) - 1
+        return idx >= 0 and frame_no <= self.ends[idx]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def frame_number(self, filename):
+        """
+        En.The frame number of a file, or None if its name has no number
+        Cn.文件的帧号，若文件名中没有数字则返回None
+        """
+        found = self.number.search(os.path.basename(filename))
+        return int(found.group(1)) if found else None
+
+    def includes(self, filename):
+        """
+        En.Whether a file is in range
+        Cn.文件是否在范围内
+        """
+        frame_no = self.frame_number(filename)
+        return frame_no is None or frame_no in self
+
+    def split(self, paths):
+        """
+        En.Split a listing into the paths in range and those outside it,
+        from the names alone
+        Cn.仅根据文件名将列表拆分为范围内和范围外的路径
+        """
+        inside = list()
+        outside = list()
+        for path in paths:
+            (inside if self.includes(path) else outside).append(path)
+        return inside, outside
+
+def parse_frame_range(frame_range):
+    """
+    En.(start, end) of a range like "10-50". A single number is that
+    frame alone, a missing start means the first frame and a missing end
+    or "+" means the last frame. Raises ValueError on anything else
+    Cn.形如"10-50"的范围的(起点, 终点)。单个数字仅表示该帧，缺少起点表示
+    第一帧，缺少终点或"+"表示最后一帧。其他任何输入都抛出ValueError
+    """
+    text = frame_range.strip()
+    start, dash, end = text.partition("-")
+    if not dash:
+        end = start
+    try:
+        if not start and not end:
+            raise ValueError
+        start = int(start) if start else 0
+        end = float("inf") if dash and end in ("", "+") else int(end)
+    except ValueError:
+        raise ValueError("Invalid frame range '{}', expected N, N-M, N- or -M".format(
+            frame_range))
+    if start < 0 or end < start:
+        raise ValueError("Invalid frame range '{}', the end is before the start".format(
+            frame_range))
+    return start, end
+
+def frame_order(path):
+    """
+    En.Sort key that puts frames in numeric order ("2.png" before
+    "10.png"), with files without a number last
+    Cn.按数字顺序排列帧的排序键("2.png"在"10.png"之前)，没有数字的文件排在最后
+    """
+    name = os.path.basename(path)
+    found = FrameRanges.number.search(name)
+    return (found is None, int(found.group(1)) if found else 0, name)
@@ -0,0 +1,432 @@
+#!/usr/bin/env python
+#-*- coding:UTF-8 -*-
+"""Video frame sources"""
+
+import json
+import os
+import shutil
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from lib.manifest import FrameManifest
+
+FFMPEG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          "tools", "ffmpeg-4.1-64bit-static")
+FFMPEG = os.path.join(FFMPEG_DIR, "ffmpeg")
+FFPROBE = os.path.join(FFMPEG_DIR, "ffprobe")
+
+def probe_video(video):
+    """
+    En.Return the width, height, frame rate and (if the container
+    knows it) frame count of the first video stream
+    Cn.返回第一个视频流的宽、高、帧率以及帧数(若容器中记录了帧数)
+    """
+    command = [FFPROBE, "-v", "error",
+               "-select_streams", "v:0",
+               "-show_entries", "stream=width,height,avg_frame_rate,nb_frames",
+               "-of", "json",
+               video]
+    output = subprocess.check_output(command)
+    stream = json.loads(output.decode("utf-8"))["streams"][0]
+    num, den = stream.get("avg_frame_rate", "0/1").split("/")
+    fps = float(num) / float(den) if float(den) else 0.0
+    nb_frames = stream.get("nb_frames")
+    frames = int(nb_frames) if nb_frames and nb_frames.isdigit() else None
+    return int(stream["width"]), int(stream["height"]), fps, frames
+
+def probe_frame_rate(video):
+    """
+    En.Return the r_frame_rate of the first video stream, both as
+    ffmpeg's exact "num/den" text and in frames per second. This is the
+    rate ffmpeg writes image sequences at, which differs from the
+    average rate of probe_video on variable frame rate video
+    Cn.返回第一个视频流的r_frame_rate，同时给出ffmpeg精确的"分子/分母"文本
+    和每秒帧数。这是ffmpeg写出图像序列的帧率，对于可变帧率视频，它与
+    probe_video给出的平均帧率不同
+    """
+    command = [FFPROBE, "-v", "error",
+               "-select_streams", "v:0",
+               "-show_entries", "stream=r_frame_rate",
+               "-of", "csv=p=0",
+               video]
+    text = subprocess.check_output(command).decode("utf-8").strip().rstrip(",")
+    num, _, den = text.partition("/")
+    try:
+        rate = float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return None, 0.0
+    return (text, rate) if rate > 0 else (None, 0.0)
+
+def probe_keyframes(video):
+    """
+    En.Return the presentation times (in seconds) of the keyframes
+    of the first video stream. Only keyframes are decoded, so this is
+    much cheaper than a full decode
+    Cn.返回第一个视频流中关键帧的显示时间(秒)。仅解码关键帧，
+    因此比完整解码快得多
+    """
+    command = [FFPROBE, "-v", "error",
+               "-select_streams", "v:0",
+               "-skip_frame", "nokey",
+               "-show_entries", "frame=best_effort_timestamp_time",
+               "-of", "csv=p=0",
+               video]
+    output = subprocess.check_output(command).decode("utf-8")
+    times = list()
+    for line in output.splitlines():
+        line = line.strip().rstrip(",")
+        if line and line != "N/A":
+            times.append(float(line))
+    return sorted(times)
+
+def probe_start_time(video):
+    """
+    En.Return the start time (in seconds) of the container, which input
+    -ss positions are relative to
+    Cn.返回容器的起始时间(秒)，输入端-ss的位置是相对于它的
+    """
+    command = [FFPROBE, "-v", "error",
+               "-show_entries", "format=start_time",
+               "-of", "csv=p=0",
+               video]
+    output = subprocess.check_output(command).decode("utf-8").strip()
+    try:
+        return float(output)
+    except ValueError:
+        return 0.0
+
+def split_keyframes(keyframes, segments):
+    """
+    En.Pick up to (segments - 1) keyframes, evenly spread through the
+    keyframe list, to split the video on. Returns a list of
+    (start, end) times where end is None for the final segment
+    Cn.从关键帧列表中均匀选取最多(segments - 1)个关键帧作为分割点。
+    返回(开始, 结束)时间列表，最后一段的结束时间为None
+    """
+    points = [keyframes[0] if keyframes else 0.0]
+    for idx in range(1, segments):
+        keyframe = keyframes[idx * len(keyframes) // segments] if keyframes else None
+        if keyframe is not None and keyframe > points[-1]:
+            points.append(keyframe)
+    ends = points[1:] + [None]
+    return list(zip(points, ends))
+
+def resolve_video(video, picture, segments=1, jobs=None, extension="png",
+                  hash_source=False, verify=False):
+    """
+    En.Resolve a video into picture/%d.<extension>, keeping a manifest
+    next to the frames. If the manifest shows the frames are already up
+    to date nothing is decoded. If a previous run was interrupted,
+    decoding resumes after the last complete frame. Otherwise the folder
+    is cleared and the whole video is decoded
+    Cn.将视频解析为picture/%d.<extension>，并在帧旁保存清单。若清单显示
+    帧已是最新，则不进行任何解码。若上一次运行被中断，则从最后一个完整
+    帧之后继续解码。否则清空文件夹并解码整个视频
+    """
+    source = FrameManifest.source_signature(video, use_hash=hash_source)
+    args = {"extension": extension, "ffmpeg": list()}
+    manifest = FrameManifest(picture) if os.path.isdir(picture) else None
+    resume = 0
+    if manifest is not None and manifest.matches(source, args):
+        if manifest.is_complete(verify=verify):
+            print("Frames in '{}' are up to date".format(picture))
+            return manifest
+        if not manifest.data.get("complete"):
+            for folder in os.listdir(picture):
+                if folder.startswith(".segment_"):
+                    shutil.rmtree(os.path.join(picture, folder))
+            resume = manifest.recover()
+    frames = FrameSource(video)
+    if resume and (not frames.rate or frames.variable_rate):
+        print("'{}' has a variable or unknown frame rate, so it can't be resumed. "
+              "Decoding it again".format(video))
+        resume = 0
+    if not resume:
+        if os.path.isdir(picture):
+            shutil.rmtree(picture)
+        os.makedirs(picture)
+        manifest = FrameManifest(picture)
+        manifest.start(source, args)
+
+    if resume:
+        print("Resuming from frame {}".format(resume + 1))
+        # 输入端-ss从该帧之前的关键帧开始解码并丢弃之前的帧，无需从头解码。
+        # 输出为固定帧率rate，帧号resume对应的时间为resume / rate。只提前
+        # 百分之一帧以免时间舍入丢掉这一帧，提前更多会使固定帧率输出在开头重复一帧
+        returncode = frames.dump(picture, extension, seek=(resume - 0.01) / frames.rate,
+                                 extra_args=["-start_number", str(resume + 1)])
+    elif segments > 1:
+        frames.dump_segmented(picture, segments, jobs, extension)
+        returncode = 0
+    else:
+        returncode = frames.dump(picture, extension)
+    if returncode != 0:
+        raise RuntimeError("ffmpeg exited with code {}".format(returncode))
+
+    frame_count = 0
+    while os.path.isfile(manifest.frame_path(frame_count + 1)):
+        frame_count += 1
+    manifest.finish(frame_count)
+    return manifest
+
+class FrameSource(object):
+    """
+    En.Decode a video through an ffmpeg pipe. Frames are read as raw
+    BGR24 video from ffmpeg's stdout straight into a small ring of
+    preallocated NumPy buffers, so no intermediate image files are
+    written. Iterating yields (frame_number, frame) tuples, numbered
+    from 1 to match ffmpeg's "%d.png" naming.
+
+    A yielded frame is only valid until the ring wraps around, i.e. for
+    the next (buffers - 1) iterations. Copy it if it must be kept longer.
+    Cn.通过ffmpeg管道解码视频。帧以原始BGR24格式从ffmpeg的标准输出
+    直接读入预先分配的NumPy缓冲区环中，不写入任何中间图像文件。
+    迭代时产生(帧号, 帧)元组，帧号从1开始，与ffmpeg的"%d.png"命名一致。
+    产生的帧仅在缓冲区环回绕之前有效，如需长期保存请复制。
+    """
+    def __init__(self, video, buffers=2):
+        self.video = video
+        self.width, self.height, self.fps, self.frames = probe_video(video)
+        self.rate_text, self.rate = probe_frame_rate(video)
+        self.shape = (self.height, self.width, 3)
+        self.buffers = [np.empty(self.shape, dtype="uint8") for _ in range(max(buffers, 1))]
+
+    def command(self, extra_args=None):
+        """
+        En.The ffmpeg command that writes raw frames to stdout
+        Cn.将原始帧写入标准输出的ffmpeg命令
+        """
+        command = [FFMPEG, "-v", "error", "-i", self.video]
+        command.extend(extra_args or [])
+        command.extend(["-f", "rawvideo", "-pix_fmt", "bgr24", "-"])
+        return command
+
+    def __iter__(self):
+        return self.iter_frames()
+
+    @property
+    def variable_rate(self):
+        """
+        En.Whether the average frame rate differs from the output rate,
+        in which case frame times can't be computed from frame numbers
+        Cn.平均帧率是否与输出帧率不同，若不同则无法由帧号计算帧的时间
+        """
+        return bool(self.rate) and abs(self.fps - self.rate) > 1e-3 * self.rate
+
+    def rate_args(self):
+        """
+        En.Output options that write frames at the constant rate self.rate,
+        so every dump numbers the frames the same way
+        Cn.以固定帧率self.rate写出帧的输出选项，使每次导出的帧编号都相同
+        """
+        if not self.rate:
+            return list()
+        # -vsync而非-fps_mode，附带的ffmpeg 4.1还不支持后者
+        return ["-vsync", "cfr", "-r", self.rate_text]
+
+    def iter_frames(self, start=1, extra_args=None):
+        """
+        En.Yield (frame_number, frame) for every decoded frame.
+        start is the number given to the first frame ffmpeg outputs
+        Cn.为每个解码的帧产生(帧号, 帧)。start为ffmpeg输出的第一帧的编号
+        """
+        frame_size = int(np.prod(self.shape))
+        process = subprocess.Popen(self.command(extra_args),
+                                   stdout=subprocess.PIPE,
+                                   bufsize=frame_size)
+        try:
+            frame_no = start
+            while True:
+                frame = self.buffers[(frame_no - start) % len(self.buffers)]
+                if not self.read_into(process.stdout, frame, frame_size):
+                    break
+                yield frame_no, frame
+                frame_no += 1
+        finally:
+            process.stdout.close()
+            if process.poll() is None:
+                process.terminate()
+            process.wait()
+
+    @staticmethod
+    def read_into(stream, frame, frame_size):
+        """
+        En.Fill frame from the stream. Returns False at end of stream
+        Cn.从流中填充帧，流结束时返回False
+        """
+        view = memoryview(frame.reshape(-1))
+        filled = 0
+        while filled < frame_size:
+            count = stream.readinto(view[filled:])
+            if not count:
+                if filled:
+                    print("Discarding truncated final frame")
+                return False
+            filled += count
+        return True
+
+    def dump(self, picture, extension="png", extra_args=None, seek=None):
+        """
+        En.Write every frame to picture/%d.<extension> with ffmpeg.
+        Kept for workflows that still want the frames on disk. seek
+        starts at that many seconds into the video instead
+        Cn.使用ffmpeg将每一帧写入picture/%d.<extension>，
+        保留给仍需要将帧保存到磁盘的工作流程。seek表示从视频的第seek秒开始
+        """
+        command = [FFMPEG, "-v", "error"]
+        if seek is not None:
+            command.extend(["-ss", "{:.6f}".format(seek)])
+        command.extend(["-i", self.video])
+        command.extend(self.rate_args())
+        command.extend(extra_args or [])
+        command.append(os.path.join(picture, "%d." + extension))
+        return subprocess.call(command, shell=False)
+
+    def dump_segmented(self, picture, segments, jobs=None, extension="png"):
+        """
+        En.Write every frame to picture/%d.<extension>, decoding
+        keyframe aligned segments of the video concurrently. At most
+        jobs ffmpeg processes run at once. Each segment is written to
+        its own temporary folder and then renamed into place, so the
+        frame numbering is the same as a single pass dump. Video with a
+        variable or unknown frame rate is dumped in a single pass, as its
+        segment boundaries don't fall on whole output frames. Returns a
+        list of (segment, frames, seconds) timings
+        Cn.将每一帧写入picture/%d.<extension>，并发解码按关键帧对齐的
+        视频片段。同时最多运行jobs个ffmpeg进程。每个片段先写入各自的
+        临时文件夹，然后重命名到位，因此帧编号与单次导出一致。可变或未知帧率
+        的视频单次导出，因为其片段边界不落在完整的输出帧上。
+        返回(片段, 帧数, 秒数)的计时列表
+        """
+        if not self.rate or self.variable_rate:
+            print("'{}' has a variable or unknown frame rate, decoding it in a single "
+                  "pass".format(self.video))
+            started = time.time()
+            returncode = self.dump(picture, extension)
+            if returncode != 0:
+                raise RuntimeError("ffmpeg exited with code {}".format(returncode))
+            count = sum(1 for name in os.listdir(picture) if name.endswith("." + extension))
+            return [(0, count, time.time() - started)]
+        # 关键帧时间是绝对时间，而输入端-ss相对于起始时间
+        start_time = probe_start_time(self.video)
+        keyframes = [keyframe - start_time for keyframe in probe_keyframes(self.video)]
+        ranges = split_keyframes(keyframes, max(segments, 1))
+        jobs = jobs or os.cpu_count() or 1
+        # 在结束时间前留出半帧，避免片段边界处的帧被写入两次
+        margin = 0.5 / self.rate
+        folders = [os.path.join(picture, ".segment_{}".format(idx)) for idx in range(len(ranges))]
+
+        def decode(idx):
+            start, end = ranges[idx]
+            os.makedirs(folders[idx], exist_ok=True)
+            # 与dump()使用相同的固定输出帧率，使帧编号与单次导出一致
+            command = [FFMPEG, "-v", "error", "-ss", "{:.6f}".format(start), "-i", self.video]
+            command.extend(self.rate_args())
+            if end is not None:
+                command.extend(["-t", "{:.6f}".format(end - start - margin)])
+            command.append(os.path.join(folders[idx], "%d." + extension))
+            started = time.time()
+            returncode = subprocess.call(command, shell=False)
+            if returncode != 0:
+                raise RuntimeError("ffmpeg failed on segment {} with exit code "
+                                   "{}".format(idx, returncode))
+            count = len(os.listdir(folders[idx]))
+            return idx, count, time.time() - started
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            timings = list(executor.map(decode, range(len(ranges))))
+
+        offset = 0
+        for idx, count, elapsed in timings:
+            for frame_no in range(1, count + 1):
+                name = "{}.{}".format(frame_no, extension)
+                os.rename(os.path.join(folders[idx], name),
+                          os.path.join(picture, "{}.{}".format(offset + frame_no, extension)))
+            shutil.rmtree(folders[idx])
+            offset += count
+            start, end = ranges[idx]
+            print("Segment {}/{}: {:.2f}s-{}, {} frames in {:.2f}s ({:.1f} fps)".format(
+                idx + 1, len(ranges), start,
+                "end" if end is None else "{:.2f}s".format(end),
+                count, elapsed, count / elapsed if elapsed else 0.0))
+        return timings
+
+class VideoSink(object):
+    """
+    En.Encode frames straight into a video through an ffmpeg pipe. Frames
+    are written as raw BGR24 video to ffmpeg's stdin, so no image files
+    are written and read back. A write blocks while ffmpeg's pipe is
+    full, which holds back whatever is producing the frames. ffmpeg is
+    started on the first frame, which sets the size; later frames of
+    another size are resized to it. The audio of audio_source, if it has
+    any, is copied into the output unchanged
+    Cn.通过ffmpeg管道将帧直接编码为视频。帧以原始BGR24格式写入ffmpeg的
+    标准输入，因此不会写入再读回图像文件。当ffmpeg的管道已满时写入会阻塞，
+    从而使产生帧的一方暂停。ffmpeg在第一帧时启动，第一帧决定视频尺寸；
+    之后尺寸不同的帧会被缩放到该尺寸。若audio_source有音频，则原样复制到
+    输出中
+    """
+    def __init__(self, path, fps=25.0, audio_source=None, encoder_args=None):
+        self.path = path
+        self.fps = fps
+        self.audio_source = audio_source
+        self.encoder_args = encoder_args or ["-c:v", "libx264", "-crf", "18",
+                                             "-preset", "medium", "-pix_fmt", "yuv420p"]
+        self.process = None
+        self.size = None
+        self.frames = 0
+
+    def command(self):
+        """
+        En.The ffmpeg command that encodes raw frames from stdin
+        Cn.从标准输入编码原始帧的ffmpeg命令
+        """
+        command = [FFMPEG, "-v", "error", "-y",
+                   "-f", "rawvideo", "-pix_fmt", "bgr24",
+                   "-s", "{}x{}".format(*self.size), "-r", "{:.6f}".format(self.fps),
+                   "-i", "-"]
+        if self.audio_source:
+            # "1:a?"：源视频没有音轨时不报错
+            command.extend(["-i", self.audio_source, "-map", "0:v:0", "-map", "1:a?",
+                            "-c:a", "copy", "-shortest"])
+        command.extend(self.encoder_args)
+        command.append(self.path)
+        return command
+
+    def write(self, frame):
+        """
+        En.Encode the next frame
+        Cn.编码下一帧
+        """
+        if self.process is None:
+            self.size = (frame.shape[1], frame.shape[0])
+            self.process = subprocess.Popen(self.command(), stdin=subprocess.PIPE)
+        if (frame.shape[1], frame.shape[0]) != self.size:
+            frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        try:
+            self.process.stdin.write(memoryview(np.ascontiguousarray(frame)).cast("B"))
+        except BrokenPipeError:
+            raise RuntimeError("ffmpeg exited with code {} while encoding {}".format(
+                self.process.wait(), self.path))
+        self.frames += 1
+
+    def close(self):
+        """
+        En.Finish the video
+        Cn.完成视频
+        """
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        returncode = self.process.wait()
+        self.process = None
+        if returncode != 0:
+            raise RuntimeError("ffmpeg exited with code {} while encoding {}".format(
+                returncode, self.path))
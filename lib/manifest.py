@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+#-*- coding:UTF-8 -*-
+"""Manifest of resolved video frames"""
+
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+def file_checksum(path, block_size=1 << 20):
+    """
+    En.SHA1 of a file's contents
+    Cn.文件内容的SHA1值
+    """
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as infile:
+        for block in iter(lambda: infile.read(block_size), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+class FrameManifest(object):
+    """
+    En.Index of the frames resolved from a video, stored next to the
+    frames. It records the source video's signature, the ffmpeg
+    arguments used, the frame count and the size and checksum of every
+    frame, so a rerun can tell whether the frames are up to date, or
+    which frames survived an interrupted run.
+    Cn.从视频解析出的帧的索引，与帧保存在一起。它记录源视频的签名、
+    使用的ffmpeg参数、帧数以及每一帧的大小和校验值，以便再次运行时
+    判断帧是否为最新，或者中断的运行中哪些帧已经完成。
+    """
+    filename = "manifest.json"
+
+    def __init__(self, picture):
+        self.picture = picture
+        self.path = os.path.join(picture, self.filename)
+        self.data = self.load()
+
+    def load(self):
+        """
+        En.Load the manifest. A missing or unreadable manifest is empty
+        Cn.加载清单。清单不存在或无法读取时为空
+        """
+        try:
+            with open(self.path, "r") as infile:
+                return json.load(infile)
+        except (IOError, OSError, ValueError):
+            return dict()
+
+    def save(self):
+        """
+        En.Write the manifest atomically so a crash never leaves it half written
+        Cn.原子地写入清单，使崩溃不会留下写了一半的文件
+        """
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as outfile:
+            json.dump(self.data, outfile)
+        os.replace(temp_path, self.path)
+
+    @staticmethod
+    def source_signature(video, use_hash=False):
+        """
+        En.Identify the source video by size and modification time, or
+        additionally by its content hash if use_hash is set
+        Cn.通过大小和修改时间标识源视频，若设置use_hash则同时使用内容哈希
+        """
+        stat = os.stat(video)
+        signature = {"path": os.path.abspath(video),
+                     "size": stat.st_size,
+                     "mtime": stat.st_mtime}
+        if use_hash:
+            signature["sha1"] = file_checksum(video)
+        return signature
+
+    def matches(self, source, args):
+        """
+        En.Whether the manifest was written for this source and these arguments
+        Cn.清单是否是为该源和这些参数写入的
+        """
+        return self.data.get("source") == source and self.data.get("args") == args
+
+    def frame_path(self, frame_no):
+        """
+        En.Full path to a frame
+        Cn.帧的完整路径
+        """
+        return os.path.join(self.picture,
+                            "{}.{}".format(frame_no, self.data["args"]["extension"]))
+
+    def is_complete(self, verify=False):
+        """
+        En.Whether every frame listed in a finished manifest exists with
+        the recorded size. If verify is set the checksums are also checked
+        Cn.已完成的清单中列出的每一帧是否都以记录的大小存在。
+        若设置verify，还会检查校验值
+        """
+        if not self.data.get("complete"):
+            return False
+        frames = self.data.get("frames", dict())
+        if len(frames) != self.data.get("frame_count"):
+            return False
+        for frame_no, (size, _) in frames.items():
+            path = self.frame_path(frame_no)
+            if not os.path.isfile(path) or os.path.getsize(path) != size:
+                return False
+        if verify:
+            checksums = self.checksums(int(frame_no) for frame_no in frames)
+            return all(checksums[frame_no] == frames[str(frame_no)][1]
+                       for frame_no in checksums)
+        return True
+
+    def start(self, source, args):
+        """
+        En.Begin a fresh manifest for a new resolve
+        Cn.为新的解析开始一个新的清单
+        """
+        self.data = {"source": source,
+                     "args": args,
+                     "frame_count": None,
+                     "complete": False,
+                     "frames": dict()}
+        self.save()
+
+    def recover(self):
+        """
+        En.Find the last complete frame left by an interrupted run.
+        Frames are written in order, so the contiguous run of frames from
+        1 is kept, less the final one which may have been cut off mid
+        write unless its checksum is already recorded. Everything after
+        it is removed. Returns the number of the last complete frame
+        Cn.查找中断的运行留下的最后一个完整帧。帧按顺序写入，因此保留
+        从1开始的连续帧，但最后一帧可能只写了一半，除非其校验值已被记录。
+        之后的所有帧都会被删除。返回最后一个完整帧的编号
+        """
+        extension = self.data["args"]["extension"]
+        frames = self.data.setdefault("frames", dict())
+        last = 0
+        while os.path.isfile(self.frame_path(last + 1)):
+            last += 1
+        if last and str(last) not in frames:
+            last -= 1
+        for filename in os.listdir(self.picture):
+            name, ext = os.path.splitext(filename)
+            if ext == "." + extension and name.isdigit() and int(name) > last:
+                os.remove(os.path.join(self.picture, filename))
+        for frame_no in [key for key in frames if int(key) > last]:
+            del frames[frame_no]
+        self.record(range(1, last + 1))
+        self.data["complete"] = False
+        self.save()
+        return last
+
+    def finish(self, frame_count):
+        """
+        En.Record the checksums of any new frames and mark the manifest complete
+        Cn.记录所有新帧的校验值并将清单标记为完成
+        """
+        self.record(range(1, frame_count + 1))
+        self.data["frame_count"] = frame_count
+        self.data["complete"] = True
+        self.save()
+
+    def record(self, frame_numbers):
+        """
+        En.Add the size and checksum of frames not yet in the manifest
+        Cn.添加清单中尚未记录的帧的大小和校验值
+        """
+        frames = self.data.setdefault("frames", dict())
+        missing = [frame_no for frame_no in frame_numbers if str(frame_no) not in frames]
+        for frame_no, checksum in self.checksums(missing).items():
+            frames[str(frame_no)] = [os.path.getsize(self.frame_path(frame_no)), checksum]
+
+    def checksums(self, frame_numbers):
+        """
+        En.Checksum frames in parallel. hashlib releases the GIL while
+        hashing, so threads are enough
+        Cn.并行计算帧的校验值。hashlib在哈希时会释放GIL，因此使用线程即可
+        """
+        frame_numbers = list(frame_numbers)
+        with ThreadPoolExecutor() as executor:
+            checksums = executor.map(lambda frame_no: file_checksum(self.frame_path(frame_no)),
+                                     frame_numbers)
+            return dict(zip(frame_numbers, checksums))
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+#-*- coding:UTF-8 -*-
+"""Disk cache for converter masks"""
+
+import hashlib
+import os
+import struct
+import zlib
+
+import numpy as np
+
+HEADER = struct.Struct("<II")
+
+def mask_key(face, size, frame_shape, **params):
+    """
+    En.Cache key for a face's mask: a hash of its alignment, the model
+    face size, the frame size and every setting the mask depends on
+    Cn.人脸遮罩的缓存键：其对齐数据、模型人脸尺寸、帧尺寸以及遮罩所依赖的
+    所有设置的哈希
+    """
+    digest = hashlib.sha1()
+    digest.update(np.array([face.x, face.y, face.w, face.h, face.r, size,
+                            frame_shape[0], frame_shape[1]], dtype="<i8").tobytes())
+    digest.update(np.array(face.landmarksAsXY(), dtype="<f8").tobytes())
+    digest.update(repr(sorted(params.items())).encode("utf-8"))
+    return digest.hexdigest()
+
+class MaskCache(object):
+    """
+    En.Masks stored as zlib compressed float32 files, one per key, in a
+    folder capped at budget bytes. When a write takes the folder over
+    budget, the least recently used masks are deleted. Writes go to a
+    temporary file that is then renamed, so several convert processes
+    can share one folder. Each process rescans the folder after writing
+    a twentieth of the budget, so the others' masks are counted and
+    the folder overshoots by at most that much per process
+    Cn.遮罩以zlib压缩的float32文件存储，每个键一个文件，文件夹总大小以
+    budget字节为上限。当写入使文件夹超出预算时，删除最近最少使用的遮罩。
+    写入先写到临时文件再重命名，因此多个转换进程可以共享同一个文件夹。
+    每个进程每写入预算的二十分之一就重新扫描文件夹，从而计入其他进程的遮罩，
+    每个进程最多使文件夹超出这么多
+    """
+    scan_fraction = 0.05
+
+    def __init__(self, folder, budget=1024 * 1024 * 1024):
+        self.folder = folder
+        self.budget = budget
+        self.hits = self.misses = 0
+        os.makedirs(folder, exist_ok=True)
+        self.files = dict()
+        self.total = 0
+        self.unscanned = 0
+        self.scan()
+
+    def scan(self):
+        """
+        En.Read the last use and size of every mask in the folder,
+        including those written by other processes
+        Cn.读取文件夹中每个遮罩(包括其他进程写入的)的最近使用时间和大小
+        """
+        files = dict()
+        for entry in os.scandir(self.folder):
+            try:
+                if entry.is_file() and entry.name.endswith(".mask"):
+                    stat = entry.stat()
+                    files[entry.name] = (stat.st_mtime, stat.st_size)
+            except OSError:
+                # 扫描期间被其他进程删除
+                continue
+        self.files = files
+        self.total = sum(size for _, size in files.values())
+        self.unscanned = 0
+
+    def path(self, key):
+        """
+        En.File holding a key's mask
+        Cn.保存某个键的遮罩的文件
+        """
+        return os.path.join(self.folder, "{}.mask".format(key))
+
+    def get(self, key, out):
+        """
+        En.Read a mask into out, which must have the cached mask's shape.
+        Returns False on a miss
+        Cn.将遮罩读入out，out必须与缓存的遮罩形状相同。未命中时返回False
+        """
+        try:
+            with open(self.path(key), "rb") as infile:
+                data = infile.read()
+            height, width = HEADER.unpack_from(data)
+            if (height, width) != out.shape:
+                raise ValueError("Cached mask has the wrong shape")
+            out.reshape(-1)[...] = np.frombuffer(zlib.decompress(data[HEADER.size:]),
+                                                 dtype="<f4")
+        except (IOError, OSError, ValueError, zlib.error, struct.error):
+            self.misses += 1
+            return False
+        self.hits += 1
+        self.touch(key)
+        return True
+
+    def put(self, key, mask):
+        """
+        En.Store a mask, then evict down to the budget
+        Cn.存储遮罩，然后淘汰至预算以内
+        """
+        data = HEADER.pack(*mask.shape) + zlib.compress(mask.astype("<f4").tobytes(), 1)
+        path = self.path(key)
+        temp_path = "{}.{}.tmp".format(path, os.getpid())
+        try:
+            with open(temp_path, "wb") as outfile:
+                outfile.write(data)
+            os.replace(temp_path, path)
+        except (IOError, OSError):
+            return
+        name = os.path.basename(path)
+        self.total += len(data) - self.files.get(name, (0, 0))[1]
+        self.files[name] = (os.stat(path).st_mtime, len(data))
+        self.unscanned += len(data)
+        if self.total > self.budget or self.unscanned > self.budget * self.scan_fraction:
+            self.scan()
+        if self.total > self.budget:
+            self.evict()
+
+    def touch(self, key):
+        """
+        En.Mark a mask as just used
+        Cn.将遮罩标记为刚刚使用
+        """
+        path = self.path(key)
+        name = os.path.basename(path)
+        try:
+            os.utime(path)
+            self.files[name] = (os.stat(path).st_mtime, self.files.get(name, (0, 0))[1])
+        except OSError:
+            pass
+
+    def evict(self):
+        """
+        En.Delete the least recently used masks until the folder is 10%
+        under budget, so evictions don't happen on every write
+        Cn.删除最近最少使用的遮罩，直到文件夹低于预算10%，以免每次写入都
+        触发淘汰
+        """
+        target = self.budget * 0.9
+        for name, (_, size) in sorted(self.files.items(), key=lambda item: item[1][0]):
+            if self.total <= target:
+                break
+            try:
+                os.unlink(os.path.join(self.folder, name))
+            except OSError:
+                pass
+            del self.files[name]
+            self.total -= size
@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+#-*- coding:UTF-8 -*-
+"""Stage timers and counters, metrics export and profiling"""
+
+import collections
+import contextlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+class Metrics(object):
+    """
+    En.Timers and counters for named stages (load, detect, align, mask,
+    blend, write, train-step, save...). A timer keeps its number of
+    calls, total seconds and slowest call. Every process has its own
+    instance, METRICS; the pipeline's worker processes drain theirs and
+    send them to the main process, which merges them
+    Cn.命名阶段(load、detect、align、mask、blend、write、train-step、save等)
+    的计时器和计数器。计时器记录调用次数、总秒数和最慢的一次调用。每个进程
+    有自己的实例METRICS；流水线的工作进程取出自己的数据发给主进程，由主进程合并
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timers = dict()
+        self.counters = dict()
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        """
+        En.Time the body of a with statement as one call of the name timer
+        Cn.将with语句体计时为name计时器的一次调用
+        """
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - started)
+
+    def observe(self, name, seconds, calls=1):
+        """
+        En.Add calls taking seconds in total to the name timer
+        Cn.向name计时器添加总耗时为seconds的calls次调用
+        """
+        with self.lock:
+            timer = self.timers.setdefault(name, [0, 0.0, 0.0])
+            timer[0] += calls
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds / calls if calls else 0.0)
+
+    def increment(self, name, value=1):
+        """
+        En.Add value to the name counter
+        Cn.向name计数器加上value
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self):
+        """
+        En.The timers and counters as plain dicts
+        Cn.以普通字典表示的计时器和计数器
+        """
+        with self.lock:
+            return {"timers": {name: {"calls": calls, "seconds": seconds, "max": slowest}
+                               for name, (calls, seconds, slowest) in self.timers.items()},
+                    "counters": dict(self.counters)}
+
+    def drain(self):
+        """
+        En.Snapshot and reset, for sending the metrics to another process
+        Cn.取快照并重置，用于将指标发送给另一个进程
+        """
+        with self.lock:
+            snapshot = {"timers": {name: {"calls": calls, "seconds": seconds, "max": slowest}
+                                   for name, (calls, seconds, slowest) in self.timers.items()},
+                        "counters": self.counters}
+            self.timers = dict()
+            self.counters = dict()
+        return snapshot
+
+    def merge(self, snapshot):
+        """
+        En.Add the metrics of another process's snapshot
+        Cn.加上另一个进程快照中的指标
+        """
+        with self.lock:
+            for name, other in snapshot["timers"].items():
+                timer = self.timers.setdefault(name, [0, 0.0, 0.0])
+                timer[0] += other["calls"]
+                timer[1] += other["seconds"]
+                timer[2] = max(timer[2], other["max"])
+            for name, value in snapshot["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def reset(self):
+        """
+        En.Start again from nothing with a new lock. Called first in a
+        forked worker, which inherits the parent's metrics and possibly
+        a lock held by one of its threads
+        Cn.使用新的锁从零开始。在fork出的工作进程中首先调用，因为它继承了
+        父进程的指标，以及可能被父进程某个线程持有的锁
+        """
+        self.lock = threading.Lock()
+        self.timers = dict()
+        self.counters = dict()
+
+METRICS = Metrics()
+
+def write_atomic(path, text):
+    """
+    En.Replace path with text in one rename, so scrapers never read a
+    half written file
+    Cn.通过一次重命名用text替换path，因此抓取程序永远不会读到写了一半的文件
+    """
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as out_file:
+        out_file.write(text)
+    os.replace(temp_path, path)
+
+def metric_name(name):
+    """
+    En.A name made safe for a Prometheus label value or metric name
+    Cn.可安全用作Prometheus标签值或指标名的名称
+    """
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+def to_prometheus(snapshot, command, started, complete):
+    """
+    En.A snapshot in the Prometheus text format, for node exporter's
+    textfile collector
+    Cn.Prometheus文本格式的快照，供node exporter的textfile收集器使用
+    """
+    label = 'command="{}"'.format(command)
+    lines = ["# HELP facewap_start_time_seconds When the command started",
+             "# TYPE facewap_start_time_seconds gauge",
+             "facewap_start_time_seconds{{{}}} {:.3f}".format(label, started),
+             "# HELP facewap_last_update_seconds When these metrics were written",
+             "# TYPE facewap_last_update_seconds gauge",
+             "facewap_last_update_seconds{{{}}} {:.3f}".format(label, time.time()),
+             "# HELP facewap_complete Whether the command has finished",
+             "# TYPE facewap_complete gauge",
+             "facewap_complete{{{}}} {}".format(label, int(complete))]
+    timers = sorted(snapshot["timers"].items())
+    for metric, key, kind, help_text in (
+            ("facewap_stage_calls_total", "calls", "counter", "Calls of each stage"),
+            ("facewap_stage_seconds_total", "seconds", "counter", "Seconds spent in each stage"),
+            ("facewap_stage_max_seconds", "max", "gauge", "Slowest call of each stage")):
+        lines.append("# HELP {} {}".format(metric, help_text))
+        lines.append("# TYPE {} {}".format(metric, kind))
+        for name, timer in timers:
+            lines.append('{}{{{},stage="{}"}} {}'.format(metric, label, metric_name(name),
+                                                        timer[key]))
+    for name, value in sorted(snapshot["counters"].items()):
+        metric = "facewap_{}_total".format(metric_name(name))
+        lines.append("# TYPE {} counter".format(metric))
+        lines.append("{}{{{}}} {}".format(metric, label, value))
+    return "\n".join(lines) + "\n"
+
+class Sampler(object):
+    """
+    En.Sampling profiler: a thread that records the stack of every other
+    thread of the process every interval seconds. Unlike cProfile it
+    sees all threads (the trainer runs in its own) and costs the same
+    however many calls are made. Stacks are written in the collapsed
+    format read by flamegraph.pl and speedscope
+    Cn.采样分析器：一个线程，每interval秒记录进程中其他所有线程的调用栈。
+    与cProfile不同，它能看到所有线程(训练器在自己的线程中运行)，且开销与
+    调用次数无关。调用栈以flamegraph.pl和speedscope可读取的折叠格式写出
+    """
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+
+    def run(self):
+        """
+        En.Sample until stopped
+        Cn.采样直到停止
+        """
+        own = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = list()
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append("{} ({}:{})".format(code.co_name,
+                                                     os.path.basename(code.co_filename),
+                                                     code.co_firstlineno))
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def write(self, path):
+        """
+        En.Write the collapsed stacks, most sampled first
+        Cn.写出折叠后的调用栈，采样次数最多的在前
+        """
+        write_atomic(path, "".join("{} {}\n".format(stack, count)
+                                   for stack, count in self.stacks.most_common()))
+
+class Instrumentation(object):
+    """
+    En.Wraps one run of a script: starts the profiler chosen with
+    --profile, dumps METRICS to --metrics-json and --metrics-prom every
+    --metrics-interval seconds while the script runs and once more when
+    it ends, however it ends
+    Cn.包装脚本的一次运行：启动--profile所选的分析器，在脚本运行期间每
+    --metrics-interval秒将METRICS写入--metrics-json和--metrics-prom，并在
+    脚本结束时(无论以何种方式结束)再写一次
+    """
+    def __init__(self, command, arguments):
+        self.command = command
+        self.json_path = getattr(arguments, "metrics_json", None)
+        self.prom_path = getattr(arguments, "metrics_prom", None)
+        self.interval = getattr(arguments, "metrics_interval", 30.0)
+        self.profile = getattr(arguments, "profile", None)
+        self.profile_output = getattr(arguments, "profile_output", None)
+        self.started = time.time()
+        self.profiler = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """
+        En.Start profiling and the periodic dumps
+        Cn.开始分析和定期写出
+        """
+        self.started = time.time()
+        if self.profile == "cprofile":
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        elif self.profile == "sample":
+            self.profiler = Sampler()
+            self.profiler.start()
+        if (self.json_path or self.prom_path) and self.interval and self.interval > 0:
+            self.thread = threading.Thread(target=self.dump_periodically)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def dump_periodically(self):
+        while not self.stopped.wait(self.interval):
+            self.dump(complete=False)
+
+    def dump(self, complete):
+        """
+        En.Write the metrics files
+        Cn.写出指标文件
+        """
+        snapshot = METRICS.snapshot()
+        if self.json_path:
+            write_atomic(self.json_path, json.dumps({"command": self.command,
+                                                     "started": self.started,
+                                                     "elapsed": time.time() - self.started,
+                                                     "complete": complete,
+                                                     "timers": snapshot["timers"],
+                                                     "counters": snapshot["counters"]},
+                                                    indent=2))
+        if self.prom_path:
+            write_atomic(self.prom_path, to_prometheus(snapshot, self.command, self.started,
+                                                       complete))
+
+    def stop(self):
+        """
+        En.Stop profiling, write its output and the final metrics
+        Cn.停止分析，写出其结果和最终指标
+        """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        if self.profile == "cprofile":
+            self.profiler.disable()
+            path = self.profile_output or "facewap_{}.prof".format(self.command)
+            self.profiler.dump_stats(path)
+            print("Profile written to: {} (main thread only)".format(path))
+        elif self.profile == "sample":
+            self.profiler.stop()
+            path = self.profile_output or "facewap_{}.folded".format(self.command)
+            self.profiler.write(path)
+            print("Profile written to: {} ({} samples)".format(path, self.profiler.samples))
+        if self.json_path or self.prom_path:
+            self.dump(complete=True)
+            self.print_summary()
+
+    def print_summary(self):
+        """
+        En.Print the timers, slowest stage first, and the counters
+        Cn.打印计时器(最慢的阶段在前)和计数器
+        """
+        snapshot = METRICS.snapshot()
+        timers = sorted(snapshot["timers"].items(), key=lambda item: -item[1]["seconds"])
+        print("-------------------------")
+        print("{:<12} {:>8} {:>10} {:>9} {:>9}".format("Timer", "Calls", "Total (s)",
+                                                       "ms/call", "Max (ms)"))
+        for name, timer in timers:
+            per_call = 1000 * timer["seconds"] / timer["calls"] if timer["calls"] else 0.0
+            print("{:<12} {:>8} {:>10.2f} {:>9.2f} {:>9.1f}".format(
+                name, timer["calls"], timer["seconds"], per_call, 1000 * timer["max"]))
+        for name, value in sorted(snapshot["counters"].items()):
+            print("{:<12} {:>8}".format(name, value))
+        print("Metrics written to: {}".format(
+            ", ".join(path for path in (self.json_path, self.prom_path) if path)))
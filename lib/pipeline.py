@@ -0,0 +1,368 @@
+#!/usr/bin/env python
+#-*- coding:UTF-8 -*-
+"""Multi process producer/consumer pipelines"""
+
+import heapq
+import multiprocessing as mp
+import queue
+import threading
+import time
+import traceback
+
+import numpy as np
+
+from lib.metrics import METRICS
+
+# 工作进程向主进程发送指标的间隔(秒)
+METRICS_INTERVAL = 5.0
+
+class EndOfInput(object):
+    """
+    En.Sent by every producer of a queue after its last item. It goes
+    through the same queue feeder as the producer's items, so it can't
+    overtake them
+    Cn.队列的每个生产者在其最后一个条目之后发送。它与生产者的条目经过
+    同一个队列发送线程，因此不会超过这些条目
+    """
+    pass
+
+class Stop(object):
+    """
+    En.Tells the other workers of a stage that its input is exhausted
+    Cn.通知阶段中的其他工作进程其输入已耗尽
+    """
+    pass
+
+class Stage(object):
+    """
+    En.One step of a Pipeline, run by its own pool of worker processes.
+    worker is instantiated once in each worker process with kwargs, so
+    expensive set up (loading a detector, a model...) happens once per
+    process. Each item is then passed to the instance, which returns
+    the item to hand to the next stage, or None to drop it. worker and
+    kwargs must be picklable
+    Cn.Pipeline中的一个步骤，由它自己的工作进程池运行。worker在每个
+    工作进程中用kwargs实例化一次，因此昂贵的初始化(加载检测器、模型等)
+    每个进程只执行一次。随后每个条目都会传给该实例，实例返回交给下一
+    阶段的条目，或返回None以丢弃该条目。worker和kwargs必须可被pickle
+    """
+    def __init__(self, name, worker, workers=1, **kwargs):
+        self.name = name
+        self.worker = worker
+        self.workers = max(1, int(workers))
+        self.kwargs = kwargs
+
+def _run_stage(stage, in_queue, out_queue, producers, ended, stats_queue):
+    """
+    En.Worker process loop for a stage. Each of the producers feeding
+    in_queue sends an EndOfInput after its last item; the worker that
+    receives the last of them tells its siblings to stop. Every worker
+    then sends its own EndOfInput downstream, after its results. A
+    worker that can't be set up reports the error and exits, and the
+    main process stops the pipeline
+    Cn.阶段的工作进程循环。向in_queue供数的每个生产者在其最后一个条目之后
+    发送一个EndOfInput；收到最后一个EndOfInput的工作进程通知其兄弟进程停止。
+    随后每个工作进程在其结果之后向下游发送自己的EndOfInput。无法初始化的
+    工作进程报告错误后退出，由主进程停止流水线
+    """
+    METRICS.reset()
+    try:
+        process_item = stage.worker(**stage.kwargs)
+    except Exception:
+        stats_queue.put(("error", "Stage '{}' failed to start:\n{}".format(
+            stage.name, traceback.format_exc())))
+        return
+    count = 0
+    busy = starved = blocked = 0.0
+    flushed = time.time()
+    while True:
+        started = time.time()
+        item = in_queue.get()
+        starved += time.time() - started
+        if isinstance(item, Stop):
+            break
+        if isinstance(item, EndOfInput):
+            with ended.get_lock():
+                ended.value += 1
+                last = ended.value == producers
+            if last:
+                for _ in range(stage.workers - 1):
+                    in_queue.put(Stop())
+                break
+            continue
+        started = time.time()
+        try:
+            result = process_item(item)
+        except Exception:
+            print("Stage '{}' failed to process an item:\n{}".format(stage.name,
+                                                                  traceback.format_exc()))
+            result = None
+        elapsed = time.time() - started
+        METRICS.observe(stage.name, elapsed)
+        busy += elapsed
+        count += 1
+        if time.time() - flushed >= METRICS_INTERVAL:
+            stats_queue.put(("metrics", METRICS.drain()))
+            flushed = time.time()
+        if result is not None:
+            started = time.time()
+            out_queue.put(result)
+            blocked += time.time() - started
+    out_queue.put(EndOfInput())
+    stats_queue.put(("metrics", METRICS.drain()))
+    stats_queue.put(("timings", (stage.name, count, busy, starved, blocked)))
+
+class Pipeline(object):
+    """
+    En.Chain of stages connected by bounded queues. Every stage runs in
+    its own pool of processes, so I/O bound stages overlap with CPU
+    bound ones, and the bounded queues stop a fast stage from running
+    too far ahead of a slow one. Results of the final stage are yielded
+    in the order they complete, not the order they were fed in. Each
+    item's time in a stage is added to the stage's timer in METRICS, and
+    workers send their METRICS to the main process every few seconds
+    Cn.由有界队列连接的阶段链。每个阶段在自己的进程池中运行，因此I/O
+    密集型阶段可以与CPU密集型阶段重叠，有界队列可防止快的阶段远远超前
+    于慢的阶段。最后阶段的结果按完成顺序产生，而不是按输入顺序。每个条目
+    在阶段中的耗时计入METRICS中该阶段的计时器，工作进程每隔几秒将其METRICS
+    发送给主进程
+    """
+    def __init__(self, stages, queue_size=8):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.timings = dict()
+        self.reports = list()
+        self.errors = list()
+
+    def run(self, items):
+        """
+        En.Feed items through the pipeline, yielding the final results
+        Cn.将条目送入流水线，并产生最终结果
+        """
+        queues = [mp.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        stats_queue = mp.Queue()
+        self.reports = list()
+        self.errors = list()
+        processes = list()
+        # 保留所有计数器的引用：被回收的共享内存块会被复用，
+        # 仍在使用它的工作进程会读到错误的计数
+        counters = list()
+        producers = 1
+        for idx, stage in enumerate(self.stages):
+            ended = mp.Value("i", 0)
+            counters.append(ended)
+            for _ in range(stage.workers):
+                process = mp.Process(target=_run_stage,
+                                     args=(stage, queues[idx], queues[idx + 1],
+                                           producers, ended, stats_queue))
+                process.daemon = True
+                process.start()
+                processes.append(process)
+            producers = stage.workers
+
+        stopped = threading.Event()
+        def feed():
+            try:
+                for item in items:
+                    if stopped.is_set():
+                        return
+                    queues[0].put(item)
+                queues[0].put(EndOfInput())
+            except Exception:
+                # 流水线被提前停止时，输入源可能已被关闭
+                if not stopped.is_set():
+                    self.errors.append("Reading the pipeline's input failed:\n{}".format(
+                        traceback.format_exc()))
+        feeder = threading.Thread(target=feed)
+        feeder.daemon = True
+        feeder.start()
+
+        finished = False
+        try:
+            ended = 0
+            while ended < producers:
+                try:
+                    result = queues[-1].get(timeout=0.5)
+                except queue.Empty:
+                    self.check_failures(stats_queue, processes)
+                    continue
+                if isinstance(result, EndOfInput):
+                    ended += 1
+                    continue
+                self.check_failures(stats_queue, processes)
+                yield result
+            finished = True
+        finally:
+            if finished:
+                self.collect_timings(stats_queue, len(processes))
+                for process in processes:
+                    process.join()
+            else:
+                stopped.set()
+                for process in processes:
+                    process.terminate()
+
+    def read_stats(self, stats_queue, block):
+        """
+        En.Handle one message from the workers: merge metrics into METRICS,
+        and keep final timings and errors. Returns False if there was none
+        waiting
+        Cn.处理一条来自工作进程的消息：将指标合并到METRICS中，并保存最终计时
+        和错误。若没有等待处理的消息则返回False
+        """
+        try:
+            kind, message = stats_queue.get(block)
+        except queue.Empty:
+            return False
+        if kind == "metrics":
+            METRICS.merge(message)
+        elif kind == "error":
+            self.errors.append(message)
+        else:
+            self.reports.append(message)
+        return True
+
+    def check_failures(self, stats_queue, processes):
+        """
+        En.Raise RuntimeError if a worker failed to start, a worker process
+        died, or reading the input failed
+        Cn.若工作进程初始化失败、工作进程意外退出或读取输入失败，则抛出RuntimeError
+        """
+        while self.read_stats(stats_queue, block=False):
+            pass
+        if not self.errors:
+            died = [process for process in processes
+                    if process.exitcode is not None and process.exitcode != 0]
+            if died:
+                self.errors.append("A pipeline worker exited with code {}".format(
+                    died[0].exitcode))
+        if self.errors:
+            raise RuntimeError("\n".join(self.errors))
+
+    def collect_timings(self, stats_queue, count):
+        """
+        En.Sum the timings reported by every worker, per stage
+        Cn.按阶段汇总每个工作进程报告的计时
+        """
+        while len(self.reports) < count:
+            self.read_stats(stats_queue, block=True)
+        self.timings = {stage.name: {"workers": stage.workers,
+                                     "items": 0,
+                                     "busy": 0.0,
+                                     "starved": 0.0,
+                                     "blocked": 0.0} for stage in self.stages}
+        for name, items, busy, starved, blocked in self.reports:
+            timing = self.timings[name]
+            timing["items"] += items
+            timing["busy"] += busy
+            timing["starved"] += starved
+            timing["blocked"] += blocked
+
+    def print_timings(self):
+        """
+        En.Print the per stage timings. busy is time spent processing,
+        starved is time spent waiting for input and blocked is time spent
+        waiting for the next stage to make room, each summed over workers
+        Cn.打印每个阶段的计时。busy为处理耗时，starved为等待输入的时间，
+        blocked为等待下一阶段腾出空间的时间，均为所有工作进程的总和
+        """
+        print("{:<10} {:>7} {:>8} {:>10} {:>9} {:>11} {:>11}".format(
+            "Stage", "Workers", "Items", "Busy (s)", "ms/item", "Starved (s)", "Blocked (s)"))
+        for stage in self.stages:
+            timing = self.timings.get(stage.name)
+            if not timing:
+                continue
+            per_item = 1000 * timing["busy"] / timing["items"] if timing["items"] else 0.0
+            print("{:<10} {:>7} {:>8} {:>10.2f} {:>9.1f} {:>11.2f} {:>11.2f}".format(
+                stage.name, timing["workers"], timing["items"], timing["busy"],
+                per_item, timing["starved"], timing["blocked"]))
+
+class FramePool(object):
+    """
+    En.Fixed number of frame sized slots in shared memory. A frame is
+    copied into a free slot once and only a small handle travels over the
+    pipeline's queues, instead of the whole frame being pickled at every
+    hop. put blocks while every slot is in use, which bounds the number
+    of frames in flight. Frames larger than a slot are passed as they are
+    Cn.共享内存中固定数量的帧大小的槽。帧只需复制到空闲槽中一次，之后在
+    流水线队列中传递的只是一个小的句柄，而不是在每一步都pickle整帧。
+    当所有槽都在使用时put会阻塞，从而限制处理中的帧数。大于槽的帧按原样传递
+    """
+    def __init__(self, frame_bytes, slots):
+        from multiprocessing import shared_memory
+        self.frame_bytes = frame_bytes
+        self.slots = slots
+        self.memory = shared_memory.SharedMemory(create=True, size=frame_bytes * slots)
+        self.free = mp.Queue()
+        for slot in range(slots):
+            self.free.put(slot)
+
+    def put(self, image):
+        """
+        En.Copy an image into a free slot and return its handle
+        Cn.将图像复制到空闲槽中并返回其句柄
+        """
+        if image.nbytes > self.frame_bytes:
+            return image
+        handle = (self.free.get(), image.shape, image.dtype.str)
+        np.copyto(self.view(handle), image)
+        return handle
+
+    def view(self, handle):
+        """
+        En.The image behind a handle, as a view of the shared memory
+        Cn.句柄对应的图像，为共享内存的视图
+        """
+        if isinstance(handle, np.ndarray):
+            return handle
+        slot, shape, dtype = handle
+        return np.ndarray(shape, dtype=dtype, buffer=self.memory.buf,
+                          offset=slot * self.frame_bytes)
+
+    def store(self, handle, image):
+        """
+        En.Replace the image behind a handle, returning the new handle
+        Cn.替换句柄对应的图像，并返回新的句柄
+        """
+        if isinstance(handle, np.ndarray) or image.nbytes > self.frame_bytes:
+            self.release(handle)
+            return image
+        handle = (handle[0], image.shape, image.dtype.str)
+        view = self.view(handle)
+        if not np.shares_memory(view, image):
+            np.copyto(view, image)
+        return handle
+
+    def release(self, handle):
+        """
+        En.Give a handle's slot back to the pool
+        Cn.将句柄的槽归还给池
+        """
+        if not isinstance(handle, np.ndarray):
+            self.free.put(handle[0])
+
+    def close(self):
+        """
+        En.Free the shared memory
+        Cn.释放共享内存
+        """
+        self.memory.close()
+        self.memory.unlink()
+
+def in_order(results, key="index", start=0):
+    """
+    En.Yield results that complete out of order in the order of their
+    key, holding back any that arrive before the ones ahead of them.
+    Every key from start on must turn up exactly once
+    Cn.按键的顺序产生乱序完成的结果，提前到达的结果会被暂存，直到排在
+    它前面的结果到达。从start开始的每个键都必须恰好出现一次
+    """
+    pending = list()
+    expected = start
+    for result in results:
+        heapq.heappush(pending, (result[key], id(result), result))
+        while pending and pending[0][0] == expected:
+            yield heapq.heappop(pending)[2]
+            expected += 1
+    while pending:
+        yield heapq.heappop(pending)[2]
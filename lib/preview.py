@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+#-*- coding:UTF-8 -*-
+"""Training previews rendered in a separate process"""
+
+import ctypes
+import multiprocessing as mp
+import os
+import time
+
+import cv2
+import numpy as np
+
+class Preview(object):
+    """
+    En.Hands the trainer's sample images to a preview process that
+    encodes, writes and shows them, so training never waits on it. An
+    instance is the viewer passed to the trainer. The latest sample is
+    copied into one slot of shared memory and the preview process picks
+    it up every rate seconds; samples that arrive in between overwrite it
+    and are dropped. If the preview process is reading the slot the
+    sample is dropped too, rather than waiting for the lock. With
+    show_window the process owns the preview window: Enter sets stopped
+    and 's' sets save_requested
+    Cn.将训练器的样本图像交给预览进程进行编码、写入和显示，因此训练永远不会
+    等待它。实例本身就是传给训练器的viewer。最新的样本被复制到共享内存的
+    一个槽中，预览进程每rate秒取一次；其间到达的样本会覆盖它并被丢弃。若
+    预览进程正在读取该槽，样本也会被丢弃，而不是等待锁。使用show_window时，
+    预览窗口由该进程持有：Enter设置stopped，'s'设置save_requested
+    """
+    def __init__(self, output_dir, write_image=False, redirect_gui=False, show_window=False,
+                 rate=5.0, capacity=16 * 1024 * 1024):
+        context = mp.get_context("spawn")
+        self.rate = rate
+        self.capacity = capacity
+        self.lock = context.Lock()
+        # 头部：序号、高、宽、通道数
+        self.header = context.RawArray(ctypes.c_int64, 4)
+        self.name = context.RawArray(ctypes.c_char, 256)
+        self.data = context.RawArray(ctypes.c_uint8, capacity)
+        self.rendered = context.RawValue(ctypes.c_int64, 0)
+        self.stopped = context.Event()
+        self.save_requested = context.Event()
+        self.last = None
+        self.sent = self.dropped = 0
+        self.process = context.Process(target=render_loop,
+                                       args=(self.lock, self.header, self.name, self.data,
+                                             self.rendered, self.stopped, self.save_requested,
+                                             str(output_dir), write_image, redirect_gui,
+                                             show_window, rate))
+        self.process.daemon = True
+        self.process.start()
+
+    def due(self):
+        """
+        En.Whether a new sample is wanted. Trainers are only handed the
+        viewer when one is, so they don't build samples that would be dropped
+        Cn.是否需要新的样本。只有需要时才把viewer交给训练器，因此训练器不会
+        构建将被丢弃的样本
+        """
+        return self.last is None or time.time() - self.last >= self.rate
+
+    def __call__(self, image, name=""):
+        self.last = time.time()
+        image = np.ascontiguousarray(image)
+        if image.dtype != np.uint8:
+            image = np.clip(image, 0, 255).astype("uint8")
+        if image.ndim == 2:
+            image = image[..., None]
+        if image.nbytes > self.capacity or not self.lock.acquire(block=False):
+            self.dropped += 1
+            return
+        try:
+            np.frombuffer(self.data, dtype="uint8", count=image.size)[...] = image.ravel()
+            self.name.value = name.encode("utf-8")[:255]
+            self.header[1:] = image.shape
+            self.header[0] += 1
+        finally:
+            self.lock.release()
+        self.sent += 1
+
+    def close(self):
+        """
+        En.Stop the preview process, letting it render the last sample first
+        Cn.停止预览进程，并让它先渲染最后一个样本
+        """
+        self.stopped.set()
+        self.process.join(self.rate + 5)
+        if self.process.is_alive():
+            self.process.terminate()
+        # 被后来的样本覆盖而未渲染的样本也算作丢弃
+        self.dropped += self.sent - self.rendered.value
+
+def render_loop(lock, header, name, data, rendered, stopped, save_requested,
+                output_dir, write_image, redirect_gui, show_window, rate):
+    """
+    En.The preview process: every rate seconds render the latest sample
+    if there is a new one
+    Cn.预览进程：每rate秒渲染一次最新的样本(若有新样本)
+    """
+    seen = 0
+    while True:
+        final = stopped.is_set()
+        image = None
+        with lock:
+            if header[0] != seen:
+                seen = header[0]
+                shape = tuple(header[1:])
+                image = np.frombuffer(data, dtype="uint8",
+                                      count=int(np.prod(shape))).reshape(shape).copy()
+                title = name.value.decode("utf-8")
+        if image is not None:
+            render(image, title, output_dir, write_image, redirect_gui, show_window)
+            rendered.value += 1
+        if final:
+            break
+        if show_window:
+            key = cv2.waitKey(max(1, int(rate * 1000)))
+            if key in (ord("\n"), ord("\r")):
+                stopped.set()
+            elif key == ord("s"):
+                save_requested.set()
+        else:
+            stopped.wait(rate)
+    if show_window:
+        cv2.destroyAllWindows()
+
+def render(image, title, output_dir, write_image, redirect_gui, show_window):
+    """
+    En.Write and show one sample
+    Cn.写入并显示一个样本
+    """
+    if write_image:
+        cv2.imwrite(os.path.join(output_dir, "_sample_{}.jpg".format(title)), image)
+    if redirect_gui:
+        cv2.imwrite(os.path.join(output_dir, ".gui_preview.png"), image)
+    if show_window:
+        cv2.imshow(title, image)
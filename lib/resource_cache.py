@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+#-*- coding:UTF-8 -*-
+"""Models kept loaded between the jobs of a batch"""
+
+class ResourceCache(object):
+    """
+    En.Loaded models, keyed by what they were loaded from (the trainer,
+    model folder and loading options). It is only enabled by the batch
+    command, so the jobs of a batch that use the same --trainer and
+    --model-dir share one copy. Otherwise every get loads afresh, as a
+    single run always has
+    Cn.已加载的模型，以加载它们的来源(训练器、模型文件夹和加载选项)为键。
+    只有batch命令会启用它，因此批处理中使用相同--trainer和--model-dir的作业
+    共享同一份。否则每次get都重新加载，与单次运行一直以来的行为相同
+    """
+    def __init__(self):
+        self.enabled = False
+        self.items = dict()
+        self.loaded = self.reused = 0
+
+    def get(self, key, loader):
+        """
+        En.The cached value for key, calling loader to load it on a miss.
+        None is never cached, so a model that isn't there yet is looked
+        for again by the next job
+        Cn.key对应的缓存值，未命中时调用loader加载。None永远不会被缓存，
+        因此尚不存在的模型会在下一个作业中重新查找
+        """
+        if not self.enabled:
+            return loader()
+        if key in self.items:
+            self.reused += 1
+            return self.items[key]
+        value = loader()
+        if value is not None:
+            self.items[key] = value
+            self.loaded += 1
+        return value
+
+RESOURCES = ResourceCache()
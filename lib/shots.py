@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+#-*- coding:UTF-8 -*-
+"""Shot detection and per shot colour statistics"""
+
+import os
+
+import cv2
+import numpy as np
+
+from lib.utils import rotate_image
+
+THUMBNAIL = (64, 36)
+SHOT_THRESHOLD = 30.0
+
+def get_shot_stats_path(input_path):
+    """
+    En.The shot statistics file next to the input folder or video
+    Cn.位于输入文件夹或视频旁边的镜头统计文件
+    """
+    folder = os.path.dirname(input_path) if os.path.isfile(input_path) else input_path
+    return os.path.join(folder, "shots.npz")
+
+def thumbnail(image):
+    """
+    En.Small grayscale copy of a frame for shot detection
+    Cn.用于镜头检测的帧的小尺寸灰度副本
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, THUMBNAIL, interpolation=cv2.INTER_AREA).astype("float32")
+
+def face_histograms(image, faces):
+    """
+    En.Per channel histograms of the pixels inside the face boxes. A
+    face found on a rotated frame is measured on the same rotation
+    Cn.人脸框内像素的逐通道直方图。在旋转后的帧上找到的人脸在相同的旋转下测量
+    """
+    histograms = np.zeros((3, 256), dtype="int64")
+    for face in faces:
+        rotated = rotate_image(image, face["r"]) if face.get("r") else image
+        height, width = rotated.shape[:2]
+        x0, y0 = max(face["x"], 0), max(face["y"], 0)
+        x1, y1 = min(face["x"] + face["w"], width), min(face["y"] + face["h"], height)
+        if x1 <= x0 or y1 <= y0:
+            continue
+        region = rotated[y0:y1, x0:x1]
+        for channel in range(3):
+            histograms[channel] += np.bincount(region[..., channel].ravel(), minlength=256)
+    return histograms
+
+class ShotStats(object):
+    """
+    En.Colour statistics of the faces in each shot: per channel
+    cumulative histograms, means and standard deviations. Shots are found
+    with a frame difference scan: a cut is where the mean absolute
+    difference between two consecutive thumbnails is above threshold.
+    Converters look a frame's statistics up here instead of measuring the
+    original face on every frame, which also keeps the colour of the
+    swapped face steady within a shot
+    Cn.每个镜头中人脸的颜色统计：逐通道累积直方图、均值和标准差。镜头通过
+    帧差扫描发现：相邻两帧缩略图的平均绝对差超过阈值处即为切换点。转换器
+    在此查找帧的统计数据，而不是在每一帧上测量原始人脸，这也使替换后人脸的
+    颜色在一个镜头内保持稳定
+    """
+    def __init__(self, frames, shots, cdfs, means, stds):
+        self.frames = list(frames)
+        self.shots = np.asarray(shots, dtype="int32")
+        self.cdfs = np.asarray(cdfs, dtype="float32")
+        self.means = np.asarray(means, dtype="float32")
+        self.stds = np.asarray(stds, dtype="float32")
+        self.index = {frame: int(shot) for frame, shot in zip(self.frames, self.shots)}
+
+    @classmethod
+    def compute(cls, frames, alignments, threshold=SHOT_THRESHOLD):
+        """
+        En.Scan (filename, image) pairs once, finding the shots and
+        summing the histograms of the aligned faces in each
+        Cn.扫描一次(文件名, 图像)对，找出镜头并累加每个镜头中已对齐人脸的直方图
+        """
+        names = list()
+        shots = list()
+        histograms = list()
+        previous = None
+        for filename, image in frames:
+            if image is None:
+                continue
+            small = thumbnail(image)
+            if previous is None or np.mean(np.abs(small - previous)) > threshold:
+                histograms.append(np.zeros((3, 256), dtype="int64"))
+            previous = small
+            names.append(filename)
+            shots.append(len(histograms) - 1)
+            histograms[-1] += face_histograms(image, alignments.get(filename) or list())
+        histograms = np.array(histograms, dtype="float64").reshape(-1, 3, 256)
+        counts = histograms.sum(axis=2)
+        counts[counts == 0] = np.nan
+        levels = np.arange(256, dtype="float64")
+        means = (histograms * levels).sum(axis=2) / counts
+        stds = np.sqrt(np.maximum((histograms * levels ** 2).sum(axis=2) / counts - means ** 2, 0))
+        cdfs = np.cumsum(histograms, axis=2) / counts[..., None]
+        return cls(names, shots, cdfs, means, stds)
+
+    @classmethod
+    def load(cls, path):
+        """
+        En.Read statistics saved with save
+        Cn.读取用save保存的统计数据
+        """
+        with np.load(path) as data:
+            return cls(data["frames"].tolist(), data["shots"], data["cdfs"],
+                       data["means"], data["stds"])
+
+    def save(self, path):
+        """
+        En.Write the statistics to a compressed .npz file
+        Cn.将统计数据写入压缩的.npz文件
+        """
+        temp_path = path + ".tmp.npz"
+        np.savez_compressed(temp_path, frames=np.array(self.frames), shots=self.shots,
+                            cdfs=self.cdfs, means=self.means, stds=self.stds)
+        os.replace(temp_path, path)
+
+    def __len__(self):
+        return len(self.cdfs)
+
+    def matches(self, frames):
+        """
+        En.Whether the statistics were computed for this list of frames
+        Cn.统计数据是否是针对这个帧列表计算的
+        """
+        return self.frames == list(frames)
+
+    def get(self, frame):
+        """
+        En.{"cdf", "mean", "std"} of the frame's shot, or None if the frame
+        is unknown or its shot had no aligned faces
+        Cn.帧所在镜头的{"cdf", "mean", "std"}，若帧未知或其镜头中没有已对齐
+        的人脸则返回None
+        """
+        shot = self.index.get(frame)
+        if shot is None or np.isnan(self.means[shot]).any():
+            return None
+        return {"cdf": self.cdfs[shot], "mean": self.means[shot], "std": self.stds[shot]}
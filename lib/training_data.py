@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+#-*- coding:UTF-8 -*-
+"""Training data: a decoded face cache and a prefetching batch loader"""
+
+import collections
+import json
+import multiprocessing as mp
+import os
+import time
+
+import cv2
+import numpy as np
+
+from lib.metrics import METRICS
+from lib.utils import get_image_paths
+
+FACE_SIZE = 256
+CACHE_NAME = ".training_cache"
+
+class FaceCache(object):
+    """
+    En.Every training face of a folder decoded once into a uint8 array of
+    shape (faces, 256, 256, 3) saved as a .npy file in the folder. Loaders
+    open it memory mapped, so worker processes share the page cache
+    instead of each decoding or holding their own copy. The cache is
+    rebuilt when a face is added, removed or changed
+    Cn.文件夹中的所有训练人脸一次性解码为形状为(人脸数, 256, 256, 3)的
+    uint8数组，并以.npy文件保存在该文件夹中。加载器以内存映射方式打开它，
+    因此工作进程共享页缓存，而不是各自解码或持有自己的副本。当人脸被添加、
+    删除或修改时重建缓存
+    """
+    def __init__(self, folder, size=FACE_SIZE):
+        self.folder = str(folder)
+        self.size = size
+        self.path = os.path.join(self.folder, CACHE_NAME + ".npy")
+        self.index_path = os.path.join(self.folder, CACHE_NAME + ".json")
+
+    def signature(self, paths):
+        """
+        En.Name, size and modification time of every face
+        Cn.每张人脸的名称、大小和修改时间
+        """
+        signature = list()
+        for path in paths:
+            stat = os.stat(path)
+            signature.append([os.path.basename(path), stat.st_size, stat.st_mtime_ns])
+        return {"size": self.size, "faces": signature}
+
+    def is_current(self, signature):
+        """
+        En.Whether the cache on disk was built from these faces
+        Cn.磁盘上的缓存是否由这些人脸构建
+        """
+        try:
+            with open(self.index_path, "r") as index_file:
+                return json.load(index_file) == signature and os.path.exists(self.path)
+        except (IOError, OSError, ValueError):
+            return False
+
+    def build(self, paths, pool=None):
+        """
+        En.Decode the faces into the cache, in the pool if one is given
+        Cn.将人脸解码到缓存中，若给出进程池则在池中解码
+        """
+        print("Caching {} faces from {}".format(len(paths), self.folder))
+        temp_path = self.path + ".tmp.npy"
+        faces = np.lib.format.open_memmap(temp_path, mode="w+", dtype="uint8",
+                                          shape=(len(paths), self.size, self.size, 3))
+        jobs = [(path, self.size) for path in paths]
+        decoded = pool.imap(read_face, jobs, chunksize=16) if pool else map(read_face, jobs)
+        for idx, face in enumerate(decoded):
+            faces[idx] = face
+        faces.flush()
+        del faces
+        os.replace(temp_path, self.path)
+
+    def load(self, pool=None):
+        """
+        En.Path of an up to date cache, building it first if needed
+        Cn.最新缓存的路径，若需要则先构建
+        """
+        paths = get_image_paths(self.folder)
+        if not paths:
+            raise ValueError("No training faces found in {}".format(self.folder))
+        signature = self.signature(paths)
+        if not self.is_current(signature):
+            self.build(paths, pool)
+            with open(self.index_path, "w") as index_file:
+                json.dump(signature, index_file)
+        return self.path
+
+def read_face(job):
+    """
+    En.Decode one face, resized to the cache's face size
+    Cn.解码一张人脸，并缩放到缓存的人脸尺寸
+    """
+    path, size = job
+    face = cv2.imread(path)
+    if face is None:
+        print("Failed to read image: {}".format(path))
+        return np.zeros((size, size, 3), dtype="uint8")
+    if face.shape[:2] != (size, size):
+        face = cv2.resize(face, (size, size), interpolation=cv2.INTER_AREA)
+    return face
+
+def random_transform(image, rotation_range=10, zoom_range=0.05, shift_range=0.05,
+                     random_flip=0.4, random=np.random):
+    """
+    En.Randomly rotate, zoom, shift and flip a face
+    Cn.随机旋转、缩放、平移和翻转人脸
+    """
+    height, width = image.shape[:2]
+    rotation = random.uniform(-rotation_range, rotation_range)
+    scale = random.uniform(1 - zoom_range, 1 + zoom_range)
+    tx = random.uniform(-shift_range, shift_range) * width
+    ty = random.uniform(-shift_range, shift_range) * height
+    mat = cv2.getRotationMatrix2D((width // 2, height // 2), rotation, scale)
+    mat[:, 2] += (tx, ty)
+    result = cv2.warpAffine(image, mat, (width, height), borderMode=cv2.BORDER_REPLICATE)
+    if random.random() < random_flip:
+        result = cv2.flip(result, 1)
+    return result
+
+def random_warp(image, size=64, random=np.random):
+    """
+    En.A randomly warped copy of the middle of the face, and the same
+    region unwarped as the target, both size x size
+    Cn.人脸中部的随机扭曲副本，以及作为目标的同一未扭曲区域，尺寸均为size x size
+    """
+    height = image.shape[0]
+    # 与原始faceswap相同：在256的人脸上取中间160像素的区域
+    half = 80 * height // 256
+    grid = np.linspace(height // 2 - half, height // 2 + half, 5)
+    mapx = np.broadcast_to(grid, (5, 5)) + random.normal(size=(5, 5), scale=5 * height / 256.0)
+    mapy = np.broadcast_to(grid, (5, 5)).T + random.normal(size=(5, 5), scale=5 * height / 256.0)
+    border = size // 8
+    full = size + 2 * border
+    interp_mapx = cv2.resize(mapx, (full, full))[border:-border, border:-border].astype("float32")
+    interp_mapy = cv2.resize(mapy, (full, full))[border:-border, border:-border].astype("float32")
+    warped = cv2.remap(image, interp_mapx, interp_mapy, cv2.INTER_LINEAR)
+    target = cv2.resize(image[height // 2 - half:height // 2 + half,
+                              height // 2 - half:height // 2 + half],
+                        (size, size), interpolation=cv2.INTER_AREA)
+    return warped, target
+
+_FACES = dict()
+
+def _open_faces(path):
+    """
+    En.A worker's memory mapped view of a face cache
+    Cn.工作进程对人脸缓存的内存映射视图
+    """
+    if path not in _FACES:
+        _FACES[path] = np.load(path, mmap_mode="r")
+    return _FACES[path]
+
+def make_batch(job):
+    """
+    En.Warp one batch in a worker process. Returns uint8 arrays, which are
+    a quarter of the size of float32 to send back
+    Cn.在工作进程中扭曲一个批次。返回uint8数组，回传的数据量只有float32的四分之一
+    """
+    path, indices, size, seed = job
+    faces = _open_faces(path)
+    random = np.random.RandomState(seed)
+    warped = np.empty((len(indices), size, size, 3), dtype="uint8")
+    target = np.empty_like(warped)
+    for idx, face_idx in enumerate(indices):
+        face = random_transform(faces[face_idx], random=random)
+        warped[idx], target[idx] = random_warp(face, size, random=random)
+    return warped, target
+
+class BatchLoader(object):
+    """
+    En.Training batches of (warped, target) float32 faces from a
+    FaceCache. Batches are warped in a pool of worker processes that keep
+    prefetch batches ready ahead of the trainer. Each epoch walks the
+    faces in a new random order. wait is the time the trainer has spent
+    waiting for a batch, and batches_per_second how fast batches have
+    been handed out between the first request and the last
+    Cn.来自FaceCache的(扭曲, 目标)float32人脸训练批次。批次在工作进程池
+    中扭曲，工作进程预先为训练器准备prefetch个批次。每个周期以新的随机顺序
+    遍历人脸。wait是训练器等待批次所花的时间，batches_per_second是从第一次
+    请求到最后一次请求之间分发批次的速度
+    """
+    def __init__(self, folder, batch_size, pool, prefetch=4, size=64, seed=None):
+        self.path = FaceCache(folder).load(pool)
+        self.count = len(np.load(self.path, mmap_mode="r"))
+        self.batch_size = batch_size
+        self.pool = pool
+        self.prefetch = max(1, prefetch)
+        self.size = size
+        self.random = np.random.RandomState(seed)
+        self.order = list()
+        self.pending = collections.deque()
+        self.batches = 0
+        self.wait = 0.0
+        self.started = self.finished = None
+
+    def next_indices(self):
+        """
+        En.Face indices of the next batch, reshuffling at each epoch
+        Cn.下一个批次的人脸索引，每个周期重新打乱
+        """
+        indices = list()
+        while len(indices) < self.batch_size:
+            if not self.order:
+                self.order = self.random.permutation(self.count).tolist()
+            indices.append(self.order.pop())
+        return indices
+
+    def submit(self):
+        """
+        En.Queue one more batch in the pool
+        Cn.在池中再排入一个批次
+        """
+        job = (self.path, self.next_indices(), self.size, self.random.randint(2 ** 31))
+        self.pending.append(self.pool.apply_async(make_batch, (job,)))
+
+    def get(self):
+        """
+        En.The next (warped, target) batch, scaled to 0-1
+        Cn.下一个(扭曲, 目标)批次，缩放到0-1
+        """
+        if self.started is None:
+            self.started = time.time()
+        while len(self.pending) < self.prefetch:
+            self.submit()
+        started = time.time()
+        warped, target = self.pending.popleft().get()
+        waited = time.time() - started
+        self.wait += waited
+        METRICS.observe("batch-wait", waited)
+        self.submit()
+        self.batches += 1
+        self.finished = time.time()
+        return warped.astype("float32") / 255.0, target.astype("float32") / 255.0
+
+    def __iter__(self):
+        while True:
+            yield self.get()
+
+    @property
+    def batches_per_second(self):
+        elapsed = self.finished - self.started if self.started else 0.0
+        return self.batches / elapsed if elapsed else 0.0
+
+def create_pool(workers):
+    """
+    En.Worker pool for the loaders. Spawned rather than forked, so the
+    workers don't inherit the trainer's model or GPU state
+    Cn.加载器的工作进程池。使用spawn而不是fork创建，因此工作进程不会继承
+    训练器的模型或GPU状态
+    """
+    return mp.get_context("spawn").Pool(max(1, workers), initializer=_init_worker)
+
+def _init_worker():
+    """
+    En.One OpenCV thread per worker, as the pool already uses the cores
+    Cn.每个工作进程只使用一个OpenCV线程，因为进程池已经占用了各个核心
+    """
+    cv2.setNumThreads(1)
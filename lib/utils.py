@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+#-*- coding:UTF-8 -*-
+"""Utilities available across all scripts"""
+
+import functools
+import os
+import queue
+import shutil
+import threading
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+image_extensions = [".jpg", ".jpeg", ".png", ".tif", ".tiff"]
+
+def get_folder(path):
+    """
+    En.Return a path to a folder, creating it if it doesn't exist
+    Cn.返回文件夹路径，若不存在则创建
+    """
+    output_dir = Path(path)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    return output_dir
+
+def get_image_paths(directory, exclude=None):
+    """
+    En.Return a sorted list of images that reside in a folder,
+    less any whose file name is in exclude
+    Cn.返回文件夹中图像的排序列表，排除文件名在exclude中的图像
+    """
+    exclude = set(exclude or [])
+    if not os.path.exists(directory):
+        directory = get_folder(directory)
+    dir_contents = list()
+    for entry in os.scandir(str(directory)):
+        if not entry.is_file() or entry.name in exclude:
+            continue
+        if os.path.splitext(entry.name)[1].lower() in image_extensions:
+            dir_contents.append(entry.path)
+    return sorted(dir_contents)
+
+def rotate_image(image, angle, rotated_width=None, rotated_height=None):
+    """
+    En.Rotate an image by angle degrees, expanding the canvas so
+    that nothing is cropped. Returns the rotated image
+    Cn.将图像旋转angle度，并扩展画布以确保不裁剪任何内容。返回旋转后的图像
+    """
+    height, width = image.shape[:2]
+    rotation_matrix, rotated_size = get_rotation_matrix(width, height, angle,
+                                                        rotated_width, rotated_height)
+    return cv2.warpAffine(image, rotation_matrix, rotated_size)
+
+@functools.lru_cache(maxsize=256)
+def get_rotation_matrix(width, height, angle, rotated_width=None, rotated_height=None):
+    """
+    En.The matrix and output size rotate_image uses. Cached, as a video
+    only ever needs a handful of them. The matrix is read only
+    Cn.rotate_image使用的矩阵和输出尺寸。由于一个视频只需要少数几个，因此
+    进行缓存。矩阵为只读
+    """
+    image_center = (width / 2, height / 2)
+    rotation_matrix = cv2.getRotationMatrix2D(image_center, -1. * angle, 1.)
+    if rotated_width is None or rotated_height is None:
+        abs_cos = abs(rotation_matrix[0, 0])
+        abs_sin = abs(rotation_matrix[0, 1])
+        if rotated_width is None:
+            rotated_width = int(height * abs_sin + width * abs_cos)
+        if rotated_height is None:
+            rotated_height = int(height * abs_cos + width * abs_sin)
+    rotation_matrix[0, 2] += rotated_width / 2 - image_center[0]
+    rotation_matrix[1, 2] += rotated_height / 2 - image_center[1]
+    rotation_matrix.setflags(write=False)
+    return rotation_matrix, (rotated_width, rotated_height)
+
+def link_or_copy(source, destination):
+    """
+    En.Make destination a copy of source without reading it where the
+    filesystem allows: a hardlink, then a copy-on-write clone, then a
+    plain copy
+    Cn.在文件系统允许的情况下，不读取内容地使destination成为source的副本：
+    先尝试硬链接，然后是写时复制克隆，最后是普通复制
+    """
+    source = str(source)
+    destination = str(destination)
+    if os.path.exists(destination):
+        if os.path.samefile(source, destination):
+            return
+        os.unlink(destination)
+    try:
+        os.link(source, destination)
+        return
+    except OSError:
+        pass
+    with open(source, "rb") as infile, open(destination, "wb") as outfile:
+        try:
+            # FICLONE: btrfs和xfs等文件系统上的写时复制克隆
+            import fcntl
+            fcntl.ioctl(outfile.fileno(), 0x40049409, infile.fileno())
+            return
+        except (ImportError, OSError):
+            pass
+        shutil.copyfileobj(infile, outfile, 1024 * 1024)
+
+def variance_of_laplacian(image):
+    """
+    En.Compute the Laplacian of the image and then return the focus
+    measure, which is simply the variance of the Laplacian
+    Cn.计算图像的拉普拉斯算子并返回聚焦度量，即拉普拉斯算子的方差
+    """
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return np.var(cv2.Laplacian(gray, cv2.CV_64F))
+
+def blur_scores(images, width=320):
+    """
+    En.variance_of_laplacian of each image, measured on a grayscale copy
+    downscaled to width pixels wide. The copies are stacked so the
+    Laplacian and variance run once for the whole batch. Images are
+    scaled to the size of the first, as frames of one video share a size
+    Cn.每张图像的variance_of_laplacian，在缩小到width像素宽的灰度副本上
+    测量。副本被堆叠在一起，因此拉普拉斯算子和方差对整批只计算一次。
+    图像均缩放到第一张图像的尺寸，因为同一视频的帧尺寸相同
+    """
+    height, original_width = images[0].shape[:2]
+    size = (min(width, original_width),
+            max(3, int(round(height * min(width, original_width) / float(original_width)))))
+    grays = np.empty((len(images), size[1], size[0]), dtype="float32")
+    for gray, image in zip(grays, images):
+        if image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        gray[...] = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    # 与cv2.Laplacian默认的3x3核相同，只计算内部像素
+    laplacian = (grays[:, :-2, 1:-1] + grays[:, 2:, 1:-1] + grays[:, 1:-1, :-2] +
+                 grays[:, 1:-1, 2:] - 4 * grays[:, 1:-1, 1:-1])
+    return laplacian.reshape(len(images), -1).var(axis=1, dtype="float64")
+
+class BackgroundGenerator(threading.Thread):
+    """
+    En.Run a generator in a background thread, keeping up to prefetch
+    items ready so the consumer doesn't wait on I/O. An exception raised
+    by the generator is re-raised in the consumer
+    Cn.在后台线程中运行生成器，最多预先准备prefetch个条目，使消费者
+    无需等待I/O。生成器抛出的异常会在消费者中重新抛出
+    """
+    def __init__(self, generator, prefetch=1):
+        threading.Thread.__init__(self)
+        self.queue = queue.Queue(prefetch)
+        self.generator = generator
+        self.daemon = True
+        self.start()
+
+    def run(self):
+        """
+        En.Put until queue size is reached. Note: put blocks only if put is
+        called while queue has already reached max size => this makes
+        prefetch + thread_queue_size items ready at most
+        Cn.持续放入直到达到队列大小
+        """
+        try:
+            for item in self.generator:
+                self.queue.put((item, None))
+        except Exception as err:
+            self.queue.put((None, err))
+            return
+        self.queue.put((None, None))
+
+    def iterator(self):
+        """
+        En.Iterate the items
+        Cn.迭代条目
+        """
+        while True:
+            next_item, error = self.queue.get()
+            if error is not None:
+                raise error
+            if next_item is None:
+                break
+            yield next_item
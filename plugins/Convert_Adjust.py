@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+#-*- coding:UTF-8 -*-
+"""Adjust converter: paste the swapped face over the face box"""
+
+import time
+
+import cv2
+import numpy as np
+
+from lib.metrics import METRICS
+
+class Convert(object):
+    """
+    En.Swap the face box for the model's output, resized back to the box.
+    avg_color_adjust shifts the new face's channel means onto the original
+    face's, and smooth_mask feathers the edges of the box. Given
+    shot_stats, the original face's means are those of the frame's shot
+    instead of being measured on every frame
+    Cn.用模型输出替换人脸框，并缩放回人脸框大小。avg_color_adjust将新人脸
+    的通道均值移到原始人脸的均值上，smooth_mask对人脸框的边缘进行羽化。
+    若给出shot_stats，原始人脸的均值取自帧所在镜头，而不是在每一帧上测量
+    """
+    def __init__(self, encoder, smooth_mask=True, avg_color_adjust=True, shot_stats=None,
+                 **kwargs):
+        self.encoder = encoder
+        self.smooth_mask = smooth_mask
+        self.avg_color_adjust = avg_color_adjust
+        self.shot_stats = shot_stats
+
+    def patch_image(self, image, face_detected, size, frame=None):
+        """
+        En.Swap one face into image. image is modified in place and returned
+        Cn.将一张人脸替换到图像中。图像被原地修改并返回
+        """
+        height, width = image.shape[:2]
+        x0, y0 = max(face_detected.x, 0), max(face_detected.y, 0)
+        x1 = min(face_detected.x + face_detected.w, width)
+        y1 = min(face_detected.y + face_detected.h, height)
+        if x1 <= x0 or y1 <= y0:
+            return image
+        target = image[y0:y1, x0:x1]
+        face = cv2.resize(target, (size, size), interpolation=cv2.INTER_AREA)
+        new_face = self.encoder(face[None].astype("float32") / 255.0)[0]
+        new_face = np.clip(np.asarray(new_face, dtype="float32") * 255, 0, 255)
+        new_face = cv2.resize(new_face, (x1 - x0, y1 - y0), interpolation=cv2.INTER_CUBIC)
+
+        started = time.time()
+        if self.avg_color_adjust:
+            new_face += self.get_means(target, frame) - new_face.mean(axis=(0, 1))
+        if self.smooth_mask:
+            mask = self.get_mask(y1 - y0, x1 - x0)
+            new_face = target + mask[..., None] * (new_face - target)
+        np.copyto(target, np.clip(np.rint(new_face), 0, 255), casting="unsafe")
+        METRICS.observe("blend", time.time() - started)
+        return image
+
+    def get_means(self, target, frame):
+        """
+        En.The channel means the new face is shifted onto
+        Cn.新人脸所要移到的通道均值
+        """
+        stats = None
+        if self.shot_stats is not None and frame is not None:
+            stats = self.shot_stats.get(frame)
+        if stats is not None:
+            return stats["mean"]
+        return target.mean(axis=(0, 1))
+
+    @staticmethod
+    def get_mask(height, width):
+        """
+        En.A mask that fades out over the outer eighth of the box
+        Cn.在人脸框外侧八分之一范围内逐渐淡出的遮罩
+        """
+        border = max(1, min(height, width) // 8)
+        mask = np.zeros((height, width), dtype="float32")
+        mask[border:-border, border:-border] = 1
+        return cv2.blur(mask, (2 * border + 1, 2 * border + 1))
@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+#-*- coding:UTF-8 -*-
+"""Masked converter: swap a face in and blend it through a mask"""
+
+import time
+
+import cv2
+import numpy as np
+
+from lib.mask_cache import mask_key
+from lib.metrics import METRICS
+
+class Convert(object):
+    """
+    En.Swap faces in and blend them through a mask. Every step (mask,
+    erosion, blur, sharpen, histogram match, blend) runs on the face's
+    region of the frame only, in float work buffers that are allocated
+    once for the largest face region and reused for every face after that.
+    patch_batch runs the model once for all the faces of a batch of frames.
+    The face the model sees is the square around the detected face box,
+    scaled to size x size. Given a mask_cache, masks are read back from
+    it instead of being rebuilt, so reruns that only change the blend
+    settings skip the mask steps. Given shot_stats, histogram matching
+    uses the histogram of the frame's shot instead of measuring the frame
+    Cn.替换人脸并通过遮罩融合。每个步骤(遮罩、腐蚀、模糊、锐化、直方图
+    匹配、融合)都只在帧中人脸所在的区域上运行，使用按最大人脸区域只分配一次
+    并在之后的每张人脸上复用的浮点工作缓冲区。patch_batch对一批帧中的所有
+    人脸只运行一次模型。模型看到的人脸是检测框周围的正方形，缩放到size x size。
+    若给出mask_cache，遮罩会从中读取而不是重新构建，因此只改变融合设置的
+    重新运行会跳过遮罩步骤。若给出shot_stats，直方图匹配使用帧所在镜头的
+    直方图，而不是测量该帧
+    """
+    def __init__(self, encoder, trainer=None, blur_size=2, seamless_clone=False,
+                 mask_type="facehullandrect", erosion_kernel_size=None,
+                 match_histogram=False, sharpen_image=None, mask_cache=None,
+                 shot_stats=None, **kwargs):
+        self.encoder = encoder
+        self.mask_cache = mask_cache
+        self.shot_stats = shot_stats
+        self.trainer = trainer
+        self.blur_size = blur_size or 0
+        self.seamless_clone = seamless_clone
+        self.mask_type = mask_type.lower()
+        self.match_histogram = match_histogram
+        self.sharpen_image = sharpen_image
+        self.erosion_kernel_size = erosion_kernel_size or 0
+        self.erosion_kernel = None
+        if self.erosion_kernel_size:
+            size = abs(self.erosion_kernel_size)
+            self.erosion_kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (size, size))
+        # 边缘留白：膨胀和模糊会让遮罩扩展到人脸四边形之外
+        self.margin = max(0, -self.erosion_kernel_size) + self.blur_size + 2
+        self.buffers = dict()
+
+    def get_buffers(self, pixels):
+        """
+        En.Flat float32 work buffers with room for a region of pixels.
+        They only grow when a larger face turns up, so after the first few
+        frames nothing is allocated. Regions are taken from the front of
+        them, so every region is a contiguous array
+        Cn.可容纳pixels个像素区域的扁平float32工作缓冲区。仅当出现更大的人脸
+        时才会增长，因此在最初几帧之后不再分配内存。区域从缓冲区的开头截取，
+        因此每个区域都是连续数组
+        """
+        if pixels > self.buffers.get("pixels", 0):
+            self.buffers = {"pixels": pixels,
+                            "mask": np.empty(pixels, dtype="float32"),
+                            "face": np.empty(pixels * 3, dtype="float32"),
+                            "frame": np.empty(pixels * 3, dtype="float32")}
+        return self.buffers
+
+    @staticmethod
+    def get_matrix(face, size):
+        """
+        En.The affine matrix from frame to face coordinates
+        Cn.从帧坐标到人脸坐标的仿射矩阵
+        """
+        side = max(face.w, face.h)
+        scale = size / float(side)
+        left = face.x + face.w / 2.0 - side / 2.0
+        top = face.y + face.h / 2.0 - side / 2.0
+        return np.array([[scale, 0, -left * scale],
+                         [0, scale, -top * scale]], dtype="float64")
+
+    def patch_image(self, image, face_detected, size, frame=None):
+        """
+        En.Swap one face into image. image is modified in place and returned.
+        frame is the frame's file name, used to look up its shot statistics
+        Cn.将一张人脸替换到图像中。图像被原地修改并返回。frame为帧的文件名，
+        用于查找其镜头统计数据
+        """
+        return self.patch_batch([image], [[face_detected]], size, [frame])[0]
+
+    def patch_batch(self, images, faces, size, frames=None):
+        """
+        En.Swap faces[i] into images[i] for a batch of frames, running the
+        model once for every face in the batch
+        Cn.对一批帧将faces[i]替换到images[i]中，对批中的所有人脸只运行一次模型
+        """
+        frames = frames or [None] * len(images)
+        jobs = [(idx, face, self.get_matrix(face, size))
+                for idx, frame_faces in enumerate(faces) for face in frame_faces]
+        if not jobs:
+            return images
+        batch = np.empty((len(jobs), size, size, 3), dtype="float32")
+        for slot, (idx, _, mat) in enumerate(jobs):
+            crop = cv2.warpAffine(images[idx], mat, (size, size))
+            np.multiply(crop, 1 / 255.0, out=batch[slot], casting="unsafe")
+        new_faces = self.encoder(batch)
+        new_faces = np.clip(np.asarray(new_faces, dtype="float32") * 255, 0, 255)
+        for (idx, face, mat), new_face in zip(jobs, new_faces):
+            self.blend(images[idx], face, mat, new_face, size, self.get_stats(frames[idx]))
+        return images
+
+    def get_stats(self, frame):
+        """
+        En.The shot statistics of a frame, if there are any
+        Cn.帧的镜头统计数据(若存在)
+        """
+        if self.shot_stats is None or frame is None:
+            return None
+        return self.shot_stats.get(frame)
+
+    def get_region(self, image, mat, size):
+        """
+        En.(x0, y0, x1, y1) of the frame the swapped face and its mask
+        can reach, or None if it is off the frame
+        Cn.替换后的人脸及其遮罩可能覆盖的帧区域(x0, y0, x1, y1)，若在帧外则返回None
+        """
+        height, width = image.shape[:2]
+        inverse = cv2.invertAffineTransform(mat)
+        corners = np.array([[0, 0, 1], [size, 0, 1], [0, size, 1], [size, size, 1]],
+                           dtype="float64").dot(inverse.T)
+        x0, y0 = np.floor(corners.min(axis=0)).astype("int64") - self.margin
+        x1, y1 = np.ceil(corners.max(axis=0)).astype("int64") + self.margin
+        x0, y0 = max(int(x0), 0), max(int(y0), 0)
+        x1, y1 = min(int(x1), width), min(int(y1), height)
+        if x1 <= x0 or y1 <= y0:
+            return None
+        return x0, y0, x1, y1, inverse, corners
+
+    def build_mask(self, mask, face, corners, offset):
+        """
+        En.Draw the mask for one face into the region's mask buffer
+        Cn.将一张人脸的遮罩绘制到区域的遮罩缓冲区中
+        """
+        mask.fill(0)
+        quad = np.round(corners[[0, 1, 3, 2]] - offset).astype("int32")
+        hull = None
+        if self.mask_type in ("facehull", "facehullandrect"):
+            points = np.array(face.landmarksAsXY(), dtype="float64") - offset
+            hull = cv2.convexHull(np.round(points).astype("int32"))
+        if self.mask_type == "rect":
+            cv2.fillConvexPoly(mask, quad, 1.0)
+        elif self.mask_type == "facehull":
+            cv2.fillConvexPoly(mask, hull, 1.0)
+        else:
+            # 人脸凸包与矩形的交集本身也是凸多边形，只需绘制一次
+            area, overlap = cv2.intersectConvexConvex(hull.reshape(-1, 2).astype("float32"),
+                                                      quad.astype("float32"))
+            if area > 0:
+                cv2.fillConvexPoly(mask, np.round(overlap).astype("int32"), 1.0)
+        if self.erosion_kernel is not None:
+            if self.erosion_kernel_size > 0:
+                cv2.erode(mask, self.erosion_kernel, dst=mask, iterations=1)
+            else:
+                cv2.dilate(mask, self.erosion_kernel, dst=mask, iterations=1)
+        if self.blur_size:
+            cv2.blur(mask, (self.blur_size, self.blur_size), dst=mask)
+        return mask
+
+    def get_mask(self, mask, face, corners, offset, size, frame_shape):
+        """
+        En.The mask for one face, from the mask cache if it has it
+        Cn.一张人脸的遮罩，若遮罩缓存中有则从中读取
+        """
+        if self.mask_cache is None:
+            return self.build_mask(mask, face, corners, offset)
+        key = mask_key(face, size, frame_shape,
+                       mask_type=self.mask_type,
+                       erosion_kernel_size=self.erosion_kernel_size,
+                       blur_size=self.blur_size)
+        if not self.mask_cache.get(key, mask):
+            self.build_mask(mask, face, corners, offset)
+            self.mask_cache.put(key, mask)
+        return mask
+
+    def sharpen(self, face):
+        """
+        En.Sharpen the warped face in place
+        Cn.原地锐化变换后的人脸
+        """
+        if self.sharpen_image == "bsharpen":
+            kernel = np.full((3, 3), -1, dtype="float32")
+            kernel[1, 1] = 9
+            cv2.filter2D(face, -1, kernel, dst=face)
+        elif self.sharpen_image == "gsharpen":
+            blurred = cv2.GaussianBlur(face, (0, 0), 3.0)
+            cv2.addWeighted(face, 1.5, blurred, -0.5, 0, dst=face)
+        np.clip(face, 0, 255, out=face)
+
+    @staticmethod
+    def histogram_match(face, frame, mask, template_cdfs=None):
+        """
+        En.Match each channel of the face to the frame, inside the mask,
+        through lookup tables built from their cumulative histograms. The
+        frame's cumulative histograms can be passed in as template_cdfs
+        Cn.在遮罩内通过由累积直方图构建的查找表，使人脸的每个通道与帧匹配。
+        帧的累积直方图可以通过template_cdfs传入
+        """
+        inside = mask > 0
+        if not inside.any():
+            return
+        source = face[inside].astype("uint8")
+        if template_cdfs is None:
+            template = frame[inside].astype("uint8")
+            template_cdfs = [np.cumsum(np.bincount(template[:, channel], minlength=256))
+                             for channel in range(3)]
+            template_cdfs = [cdf / float(cdf[-1]) for cdf in template_cdfs]
+        levels = np.arange(256)
+        matched = np.empty(source.shape, dtype="float32")
+        for channel in range(3):
+            src_cdf = np.cumsum(np.bincount(source[:, channel], minlength=256))
+            lookup = np.interp(src_cdf / float(src_cdf[-1]), template_cdfs[channel], levels)
+            matched[:, channel] = lookup[source[:, channel]]
+        face[inside] = matched
+
+    def blend(self, image, face, mat, new_face, size, stats=None):
+        """
+        En.Warp a new face back onto its region of the frame and blend it in
+        Cn.将新的人脸变换回其在帧中的区域并融合
+        """
+        region = self.get_region(image, mat, size)
+        if region is None:
+            return
+        x0, y0, x1, y1, inverse, corners = region
+        height, width = y1 - y0, x1 - x0
+        buffers = self.get_buffers(height * width)
+        mask = buffers["mask"][:height * width].reshape(height, width)
+        warped = buffers["face"][:height * width * 3].reshape(height, width, 3)
+        frame = buffers["frame"][:height * width * 3].reshape(height, width, 3)
+        target = image[y0:y1, x0:x1]
+        np.copyto(frame, target, casting="unsafe")
+        np.copyto(warped, frame)
+
+        inverse = inverse.copy()
+        inverse[:, 2] -= (x0, y0)
+        cv2.warpAffine(new_face, inverse, (width, height), dst=warped,
+                       borderMode=cv2.BORDER_TRANSPARENT)
+        started = time.time()
+        self.get_mask(mask, face, corners, (x0, y0), size, image.shape)
+        METRICS.observe("mask", time.time() - started)
+        started = time.time()
+        if self.sharpen_image:
+            self.sharpen(warped)
+        if self.match_histogram:
+            self.histogram_match(warped, frame, mask,
+                                 stats["cdf"] if stats is not None else None)
+
+        if self.seamless_clone:
+            self.clone(target, warped, mask)
+            METRICS.observe("blend", time.time() - started)
+            return
+        # frame + mask * (face - frame)，全部在缓冲区中原地计算
+        np.subtract(warped, frame, out=warped)
+        np.multiply(warped, mask[..., None], out=warped)
+        np.add(frame, warped, out=frame)
+        np.rint(frame, out=frame)
+        np.copyto(target, frame, casting="unsafe")
+        METRICS.observe("blend", time.time() - started)
+
+    @staticmethod
+    def clone(target, warped, mask):
+        """
+        En.Poisson blend the face into the region with cv2's seamless clone
+        Cn.使用cv2的无缝克隆将人脸泊松融合到区域中
+        """
+        clone_mask = (mask > 0.5).astype("uint8") * 255
+        if not clone_mask.any():
+            return
+        left, top, width, height = cv2.boundingRect(clone_mask)
+        center = (left + width // 2, top + height // 2)
+        source = np.clip(warped, 0, 255).astype("uint8")
+        target[...] = cv2.seamlessClone(source, np.ascontiguousarray(target), clone_mask,
+                                        center, cv2.NORMAL_CLONE)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+#-*- coding:UTF-8 -*-
+"""Align extractor: crop a face aligned on its landmarks"""
+
+import cv2
+import numpy as np
+
+# 标准化的平均人脸上68点中第18到68个特征点(眉毛、鼻子、眼睛、嘴)的位置
+MEAN_FACE_X = np.array([
+    0.000213256, 0.0752622, 0.18113, 0.29077, 0.393397, 0.586856, 0.689483, 0.799124,
+    0.904991, 0.98004, 0.490127, 0.490127, 0.490127, 0.490127, 0.36688, 0.426036,
+    0.490127, 0.554217, 0.613373, 0.121737, 0.187122, 0.265825, 0.334606, 0.260918,
+    0.182743, 0.645647, 0.714428, 0.793132, 0.858516, 0.79751, 0.719335, 0.254149,
+    0.340985, 0.428858, 0.490127, 0.551395, 0.639268, 0.726104, 0.642159, 0.556721,
+    0.490127, 0.423532, 0.338094, 0.290379, 0.428096, 0.490127, 0.552157, 0.689874,
+    0.553364, 0.490127, 0.42689])
+MEAN_FACE_Y = np.array([
+    0.106454, 0.038915, 0.0187482, 0.0344891, 0.0773906, 0.0773906, 0.0344891,
+    0.0187482, 0.038915, 0.106454, 0.203352, 0.307009, 0.409805, 0.515625, 0.587326,
+    0.609345, 0.628106, 0.609345, 0.587326, 0.216423, 0.178758, 0.179852, 0.231733,
+    0.245099, 0.244077, 0.231733, 0.179852, 0.178758, 0.216423, 0.244077, 0.245099,
+    0.780233, 0.745405, 0.727388, 0.742578, 0.727388, 0.745405, 0.780233, 0.864805,
+    0.902192, 0.909281, 0.902192, 0.864805, 0.784792, 0.778746, 0.785343, 0.778746,
+    0.784792, 0.824182, 0.831803, 0.824182])
+MEAN_FACE = np.stack([MEAN_FACE_X, MEAN_FACE_Y], axis=1)
+
+def umeyama(src, dst):
+    """
+    En.The least squares similarity transform (rotation, uniform scale
+    and translation) from the src points onto the dst points, as a 3x3
+    matrix (Umeyama, 1991)
+    Cn.从src点到dst点的最小二乘相似变换(旋转、等比缩放和平移)，以3x3矩阵
+    表示(Umeyama, 1991)
+    """
+    num, dim = src.shape
+    src_mean = src.mean(axis=0)
+    dst_mean = dst.mean(axis=0)
+    src_demean = src - src_mean
+    dst_demean = dst - dst_mean
+    covariance = dst_demean.T.dot(src_demean) / num
+    signs = np.ones(dim)
+    if np.linalg.det(covariance) < 0:
+        signs[-1] = -1
+    mat = np.eye(dim + 1)
+    u, s, v = np.linalg.svd(covariance)
+    rank = np.linalg.matrix_rank(covariance)
+    if rank == 0:
+        return np.nan * mat
+    if rank == dim - 1 and np.linalg.det(u) * np.linalg.det(v) <= 0:
+        signs[-1] = -1
+    elif rank == dim - 1:
+        signs[-1] = 1
+    mat[:dim, :dim] = u.dot(np.diag(signs)).dot(v)
+    scale = s.dot(signs) / src_demean.var(axis=0).sum()
+    mat[:dim, dim] = dst_mean - scale * mat[:dim, :dim].dot(src_mean)
+    mat[:dim, :dim] *= scale
+    return mat
+
+class Extract(object):
+    """
+    En.Crop a face by mapping its landmarks onto the mean face. The mean
+    face fills the crop less a padding of 48/256 on each side, so the
+    chin and forehead stay in. With align_eyes the crop is also rotated
+    so that the eyes are level
+    Cn.通过将特征点映射到平均人脸上来裁剪人脸。平均人脸填满裁剪区域，
+    四周各留出48/256的边距，因此下巴和额头仍在其中。使用align_eyes时还会
+    旋转裁剪区域使双眼保持水平
+    """
+    def extract(self, image, face, size, align_eyes=False):
+        """
+        En.The aligned size x size crop of face from image
+        Cn.从图像中裁剪出的size x size的对齐人脸
+        """
+        return cv2.warpAffine(image, self.get_matrix(face, size, align_eyes), (size, size))
+
+    @staticmethod
+    def get_matrix(face, size, align_eyes=False):
+        """
+        En.The affine matrix from frame to crop coordinates
+        Cn.从帧坐标到裁剪区域坐标的仿射矩阵
+        """
+        landmarks = np.array(face.landmarksAsXY(), dtype="float64")
+        mat = umeyama(landmarks[17:], MEAN_FACE)[:2]
+        if align_eyes:
+            eyes = np.array([landmarks[36:42].mean(axis=0), landmarks[42:48].mean(axis=0)])
+            left, right = eyes.dot(mat[:, :2].T) + mat[:, 2]
+            angle = np.degrees(np.arctan2(right[1] - left[1], right[0] - left[0]))
+            rotation = cv2.getRotationMatrix2D((0.5, 0.5), angle, 1.0)
+            mat = rotation[:, :2].dot(mat)
+            mat[:, 2] += rotation[:, 2]
+        padding = 48 * size // 256
+        mat = mat * (size - 2 * padding)
+        mat[:, 2] += padding
+        return mat
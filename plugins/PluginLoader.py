@@ -1,41 +1,160 @@
+import json
 import os
 
+class PluginRegistry(object):
+    """
+    En.Discovers the Extract_*, Convert_* and Model_* plugins once and
+    caches the imported plugin classes. The discovered names are also
+    kept in an index file keyed by the plugin folder's modification time,
+    so a warm start doesn't need to scan the folder at all. The index
+    lives in the user's cache folder, as writing it inside the plugin
+    folder would itself change the folder's modification time. Worker
+    processes forked from a process that already used the registry
+    inherit both caches.
+    Cn.一次性发现Extract_*、Convert_*和Model_*插件并缓存导入的插件类。
+    发现的名称也保存在以插件文件夹修改时间为键的索引文件中，因此热启动
+    时完全不需要扫描文件夹。索引保存在用户的缓存文件夹中，因为在插件
+    文件夹中写入索引本身就会改变文件夹的修改时间。从已使用过注册表的
+    进程派生的工作进程会继承这两个缓存。
+    """
+    kinds = ("Extract", "Convert", "Model")
+
+    def __init__(self, plugin_dir=None, index_path=None):
+        self.plugin_dir = plugin_dir or os.path.dirname(os.path.abspath(__file__))
+        self.index_path = index_path or os.path.join(os.path.expanduser("~"), ".cache",
+                                                     "facewap", "plugin_index.json")
+        self._index = None
+        self._classes = dict()
+
+    def signature(self):
+        """
+        En.Modification time of the plugin folder. Adding, removing or
+        renaming a plugin changes it
+        Cn.插件文件夹的修改时间。添加、删除或重命名插件都会改变它
+        """
+        return os.stat(self.plugin_dir).st_mtime_ns
+
+    def discover(self):
+        """
+        En.Scan the plugin folder. Plugins are either modules or packages
+        named <Kind>_<Name>
+        Cn.扫描插件文件夹。插件是名为<Kind>_<Name>的模块或包
+        """
+        index = {kind: list() for kind in self.kinds}
+        for entry in os.scandir(self.plugin_dir):
+            name = entry.name
+            if entry.is_file() and name.endswith(".py"):
+                name = name[:-3]
+            elif not entry.is_dir() or name.startswith(("_", ".")):
+                continue
+            kind, _, plugin = name.partition("_")
+            for known in self.kinds:
+                if kind.lower() == known.lower() and plugin:
+                    index[known].append(plugin)
+        return {kind: sorted(names) for kind, names in index.items()}
+
+    def load_index(self):
+        """
+        En.The index file's plugin names, if it is still up to date
+        Cn.若索引文件仍为最新，则返回其中的插件名称
+        """
+        try:
+            with open(self.index_path, "r") as index_file:
+                index = json.load(index_file)
+        except (IOError, OSError, ValueError):
+            return None
+        if (index.get("plugin_dir") != self.plugin_dir
+                or index.get("signature") != self.signature()):
+            return None
+        return index.get("plugins")
+
+    def save_index(self, plugins):
+        """
+        En.Write the index file. If it can't be written there are just no warm starts
+        Cn.写入索引文件。若无法写入，仅意味着没有热启动
+        """
+        temp_path = self.index_path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            with open(temp_path, "w") as index_file:
+                json.dump({"plugin_dir": self.plugin_dir,
+                           "signature": self.signature(),
+                           "plugins": plugins}, index_file)
+            os.replace(temp_path, self.index_path)
+        except (IOError, OSError):
+            pass
+
+    @property
+    def index(self):
+        """
+        En.The plugin names by kind, from memory, the index file or a scan
+        Cn.按类别划分的插件名称，来自内存、索引文件或扫描
+        """
+        if self._index is None:
+            self._index = self.load_index()
+        if self._index is None:
+            self._index = self.discover()
+            self.save_index(self._index)
+        return self._index
+
+    def list(self, kind):
+        """
+        En.Names of the available plugins of a kind
+        Cn.某类别可用插件的名称
+        """
+        return tuple(self.index.get(kind, list()))
+
+    def get(self, kind, name, attr=None):
+        """
+        En.Import plugin <kind>_<name> and return its attr class (which
+        defaults to kind). Each class is only imported once
+        Cn.导入插件<kind>_<name>并返回其attr类(默认为kind)。每个类只导入一次
+        """
+        attr = attr or kind
+        key = (attr, kind, name)
+        if key not in self._classes:
+            module_name = "{}_{}".format(kind, name)
+            print("Loading {} from {} plugin...".format(attr, module_name))
+            # __import__ 动态加载模块
+            # locals(): 局部名字空间的拷贝
+            # globals(): 实际的全局名字空间
+            module = __import__(module_name, globals(), locals(), [], 1)
+            self._classes[key] = getattr(module, attr)
+        return self._classes[key]
+
 class PluginLoader():
+    registry = PluginRegistry()
+
     @staticmethod
     def get_extractor(name):
-        return PluginLoader._import("Extract", "Extract_{0}".format(name))
+        return PluginLoader.registry.get("Extract", name)
 
     @staticmethod
     def _import(attr, name):
-        print ("Loading {} from {} plugin...".format(attr, name))
-        # __import__ 动态加载模块
-        # locals(): 局部名字空间的拷贝
-        # globals(): 实际的全局名字空间
-        module = __import__(name, globals(), locals(), [], 1)
-        return getattr(module, attr)
+        kind, _, plugin = name.partition("_")
+        return PluginLoader.registry.get(kind, plugin, attr=attr)
 
     @staticmethod
     def get_converter(name):
-        return PluginLoader._import("Convert", "Convert_{0}".format(name))
+        return PluginLoader.registry.get("Convert", name)
 
     @staticmethod
     def get_model(name):
-        return PluginLoader._import("Model", "Model_{0}".format(name))
+        return PluginLoader.registry.get("Model", name)
 
     @staticmethod
     def get_trainer(name):
-        return PluginLoader._import("Trainer", "Model_{0}".format(name))
+        return PluginLoader.registry.get("Model", name, attr="Trainer")
 
     @staticmethod
     def get_available_models():
-        models = ()
-        # os.path.dirname(__file__)的作用是 返回脚本的路径，即文件路径中所在的目录（不包含文件名）
-        for dir in next(os.walk(os.path.dirname(__file__)))[1]:
-            if dir[0:6].lower() == "model_":
-                models += (dir[6:],)
-        return models
+        return PluginLoader.registry.list("Model")
 
     @staticmethod
     def get_default_model():
         models = PluginLoader.get_available_models()
+        if not models:
+            # 与导入不存在的插件时一样抛出ImportError
+            raise ImportError("No Model plugins are installed in {}".format(
+                PluginLoader.registry.plugin_dir))
         return "Original" if "Original" in models else models[0]
@@ -1,20 +1,47 @@
 #!/usr/bin/env python
 #-*- coding:UTF-8 -*-
 
-from subprocess import call
-import os
+import sys
 
 if sys.version_info[0] < 3:
     raise Exception("This program requires at least python3.6")
 if sys.version_info[0] == 3 and sys.version_info[1] < 6:
     raise Exception("This program requires at least python3.6")
 
-ffmpeg = "./tools/ffmpeg-4.1-64bit-static/ffmpeg"
-paramter = "-i"
+from lib.cli import FullHelpArgumentParser
+from lib.frames import resolve_video
+
+PARSER = FullHelpArgumentParser(description="Resolve the frames of "
+                                            "workspace/data_dst/video.mp4")
+PARSER.add_argument("-S", "--segments",
+                    type=int,
+                    default=1,
+                    help="Split the video into this many keyframe aligned "
+                         "segments and decode them concurrently. Defaults to 1")
+PARSER.add_argument("-j", "--jobs",
+                    type=int,
+                    default=None,
+                    help="Maximum number of ffmpeg processes to run at once "
+                         "in segmented mode. Defaults to the number of CPUs")
+PARSER.add_argument("--hash-source",
+                    action="store_true",
+                    default=False,
+                    help="Identify the video by its content hash instead of "
+                         "its size and modification time when checking "
+                         "whether the frames are up to date")
+PARSER.add_argument("--verify",
+                    action="store_true",
+                    default=False,
+                    help="Check the checksum of every frame against the "
+                         "manifest instead of just its size")
+ARGS = PARSER.parse_args()
+
 video = "./workspace/data_dst/video.mp4"
 picture = "./workspace/data_dst/picture"
-command = [ffmpeg,paramter,video,picture + "/%d.png"]
-if os.path.isdir(picture):
-    call(["rm","-r"], shell=False)
-call(["mkdir",picture], shell=False)
-call(command, shell=False)
+# 帧旁的manifest.json记录了源视频、帧数和每帧的校验值，视频未改变时
+# 跳过解码，中断后从最后一个完整帧继续
+resolve_video(video, picture,
+              segments=ARGS.segments,
+              jobs=ARGS.jobs,
+              hash_source=ARGS.hash_source,
+              verify=ARGS.verify)
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+#-*- coding:UTF-8 -*-
+"""The script to run a file of faceswap jobs in one process"""
+
+import shlex
+import time
+import traceback
+
+import lib.cli as cli
+from lib.metrics import METRICS, Metrics
+from lib.resource_cache import RESOURCES
+
+class JobParser(cli.FullHelpArgumentParser):
+    """
+    En.Parser for the lines of a job file. A bad line raises ValueError
+    instead of printing the full help and exiting
+    Cn.作业文件各行的解析器。错误的行会抛出ValueError，而不是打印完整帮助并退出
+    """
+    def error(self, message):
+        raise ValueError(message)
+
+def create_job_parser():
+    """
+    En.Parser for the commands a job can run
+    Cn.作业可以运行的命令的解析器
+    """
+    parser = JobParser(prog="facewap.py")
+    subparser = parser.add_subparsers(dest="command")
+    cli.ExtractArgs(subparser, "extract", "Extract the face from pictures")
+    cli.ConvertArgs(subparser, "convert",
+                    "Convert a source image to a new one with the face swapped")
+    cli.TuneArgs(subparser, "tune",
+                 "Find the fastest convert settings for a given quality, scored with VMAF")
+    return parser
+
+class Batch(object):
+    """
+    En.Run the jobs of --job-file one after the other in this process.
+    Arguments are parsed once for the whole file before the first job
+    runs, so a typo on the last line doesn't waste the night, and each
+    script is only imported once. Models are kept loaded and shared by
+    the jobs that use the same --trainer and --model-dir. The face
+    detection models are loaded once, in this process, so the detect
+    workers of every extract job inherit them instead of loading their
+    own. Training runs until Enter is pressed, so train jobs are not
+    supported
+    Cn.在本进程中依次运行--job-file中的作业。整个文件的参数在第一个作业运行前
+    一次性解析，因此最后一行的拼写错误不会浪费一整夜，且每个脚本只导入一次。
+    模型保持加载状态，由使用相同--trainer和--model-dir的作业共享。人脸检测
+    模型只在本进程中加载一次，因此每个提取作业的检测进程直接继承，而不是各自
+    加载。训练会一直运行到按下Enter，因此不支持train作业
+    """
+    def __init__(self, arguments):
+        self.args = arguments
+        self.parser = create_job_parser()
+
+    def read_jobs(self):
+        """
+        En.(line number, text, parsed arguments) of every job in the file
+        Cn.文件中每个作业的(行号, 文本, 解析后的参数)
+        """
+        jobs = list()
+        errors = list()
+        with open(self.args.job_file, "r") as job_file:
+            for line_no, line in enumerate(job_file, 1):
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                try:
+                    arguments = self.parser.parse_args(shlex.split(line))
+                    if arguments.command is None:
+                        raise ValueError("no command given")
+                except ValueError as err:
+                    errors.append("Line {}: {}\n    {}".format(line_no, line, err))
+                    continue
+                jobs.append((line_no, line, arguments))
+        if errors:
+            print("Invalid jobs in {}:".format(self.args.job_file))
+            for error in errors:
+                print("  {}".format(error))
+            exit(1)
+        return jobs
+
+    @staticmethod
+    def run_job(arguments):
+        """
+        En.Run one job. Returns an error message, or None if it succeeded.
+        METRICS starts from nothing, so a job's --metrics-json and
+        --metrics-prom only count that job
+        Cn.运行一个作业。返回错误信息，成功时返回None。METRICS从零开始，
+        因此作业的--metrics-json和--metrics-prom只统计该作业
+        """
+        METRICS.reset()
+        try:
+            arguments.func(arguments)
+        except SystemExit as err:
+            # 脚本出错时调用exit(1)
+            if err.code:
+                return "exited with code {}".format(err.code)
+        except KeyboardInterrupt:
+            raise
+        except Exception:
+            return traceback.format_exc()
+        return None
+
+    def process(self):
+        """
+        En.Run the jobs
+        Cn.运行作业
+        """
+        jobs = self.read_jobs()
+        RESOURCES.enabled = True
+        results = list()
+        totals = Metrics()
+        started = time.time()
+        for idx, (line_no, line, arguments) in enumerate(jobs):
+            print("=========================")
+            print("Job {}/{} (line {}): {}".format(idx + 1, len(jobs), line_no, line))
+            job_started = time.time()
+            error = self.run_job(arguments)
+            results.append((line_no, error, time.time() - job_started))
+            totals.merge(METRICS.snapshot())
+            if error is not None:
+                print("Job on line {} failed: {}".format(line_no, error))
+                if not self.args.keep_going:
+                    break
+        elapsed = time.time() - started
+        # batch命令自身的指标文件在结束时写出所有作业的合计
+        METRICS.reset()
+        METRICS.merge(totals.snapshot())
+
+        failed = [line_no for line_no, error, _ in results if error is not None]
+        print("=========================")
+        for line_no, error, seconds in results:
+            print("Line {:>4}: {:<6} {:>9.2f}s".format(line_no, "failed" if error else "ok",
+                                                     seconds))
+        print("Jobs run:            {}/{}".format(len(results), len(jobs)))
+        print("Jobs failed:         {}".format(len(failed)))
+        print("Models loaded:       {} ({} reused)".format(RESOURCES.loaded, RESOURCES.reused))
+        print("Time elapsed:        {:.2f}s".format(elapsed))
+        if failed:
+            exit(1)
@@ -0,0 +1,521 @@
+#!/usr/bin/env python
+#-*- coding:UTF-8 -*-
+"""The script to run the convert process of faceswap"""
+
+import os
+import shlex
+import time
+import traceback
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from lib.alignments import get_alignments_path, load_alignments
+from lib.faces_detect import DetectedFace
+from lib.frame_ranges import FrameRanges, frame_order
+from lib.frames import FrameSource, VideoSink, probe_video
+from lib.mask_cache import MaskCache
+from lib.metrics import METRICS
+from lib.pipeline import FramePool, Pipeline, Stage, in_order
+from lib.resource_cache import RESOURCES
+from lib.shots import ShotStats, get_shot_stats_path
+from lib.utils import (BackgroundGenerator, get_folder, get_image_paths, link_or_copy,
+                       rotate_image)
+from plugins.PluginLoader import PluginLoader
+
+class Convert(object):
+    """
+    En.Swap the faces in a folder of frames or a video. Frames that
+    have an entry in the alignments file go straight to the converter.
+    The face detector is only loaded if a frame without alignments is
+    met, so when every frame has been aligned -D and --ref_threshold
+    cost nothing. Frames outside --frame-ranges are never read: they are
+    linked or cloned into the output folder, or left out with
+    --discard-frames. With --workers above 1 the frames are converted by
+    a pool of processes that each load the model once, and written back
+    out in their original order. With --output-video the frames are
+    encoded straight into a video instead of written as images
+    Cn.替换帧文件夹或视频中的人脸。在对齐文件中有条目的帧直接送入转换器。
+    仅在遇到没有对齐数据的帧时才加载人脸检测器，因此当每一帧都已对齐时，
+    -D和--ref_threshold没有任何开销。--frame-ranges之外的帧永远不会被读取：
+    它们被链接或克隆到输出文件夹，或在使用--discard-frames时被忽略。
+    当--workers大于1时，帧由一组各自只加载一次模型的进程转换，并按原始
+    顺序写出。使用--output-video时，帧直接编码为视频，而不是写为图像
+    """
+    def __init__(self, arguments):
+        self.args = arguments
+        self.output_dir = get_folder(self.args.output_dir)
+        self.is_video = os.path.isfile(self.args.input_dir)
+        self.alignments = self.load_alignments()
+        self.aligned_faces = self.get_aligned_faces()
+        self.frame_ranges = self.get_frame_ranges()
+        self.sink = self.get_sink()
+        self.input_paths, self.untouched_paths = self.get_input_paths()
+        self.pool = None
+        self.pipeline = None
+        self.fast_path = self.detected = self.passed_through = 0
+
+    def load_alignments(self):
+        """
+        En.The alignments for the input, if there are any
+        Cn.输入的对齐数据(若存在)
+        """
+        path = get_alignments_path(self.args.input_dir,
+                                   self.args.alignments_path,
+                                   self.args.serializer)
+        if not os.path.exists(path):
+            print("No alignments file found at {}. Faces will be detected".format(path))
+            return dict()
+        print("Loading alignments from {}".format(path))
+        return load_alignments(path)
+
+    def get_aligned_faces(self):
+        """
+        En.The names of the faces left in --input-aligned-dir. Faces that
+        have been deleted from it are not converted
+        Cn.--input-aligned-dir中剩余的人脸名称。已从中删除的人脸不会被转换
+        """
+        if self.args.input_aligned_dir is None:
+            return None
+        faces = set(os.path.basename(path)
+                    for path in get_image_paths(self.args.input_aligned_dir))
+        if not faces:
+            print("Aligned directory is empty, no faces will be converted!")
+        return faces
+
+    def get_frame_ranges(self):
+        """
+        En.The --frame-ranges index, if any were given
+        Cn.--frame-ranges的索引(若给出)
+        """
+        if not self.args.frame_ranges:
+            return None
+        return FrameRanges.from_strings(self.args.frame_ranges)
+
+    def get_sink(self):
+        """
+        En.The --output-video encoder, if one was asked for
+        Cn.--output-video的编码器(若需要)
+        """
+        if not self.args.output_video:
+            return None
+        fps = self.args.fps
+        if fps is None:
+            fps = (probe_video(self.args.input_dir)[2] if self.is_video else 0.0) or 25.0
+        audio_source = self.args.input_dir if self.is_video else None
+        if audio_source and self.frame_ranges is not None and self.args.discard_frames:
+            # 丢弃帧后视频变短，原音轨无法再与画面对齐
+            print("Frames outside --frame-ranges are discarded, so the audio is not copied")
+            audio_source = None
+        return VideoSink(self.args.output_video, fps, audio_source=audio_source,
+                         encoder_args=shlex.split(self.args.encoder_args))
+
+    def get_input_paths(self):
+        """
+        En.The frames to convert and the frames outside --frame-ranges,
+        split from the folder listing alone. A video has no listing, its
+        frames are checked as they are decoded. Frames written to a video
+        must stay in sequence, so they are put in frame number order and
+        not split either
+        Cn.待转换的帧和--frame-ranges之外的帧，仅根据文件夹列表拆分。
+        视频没有文件列表，其帧在解码时检查。写入视频的帧必须保持顺序，
+        因此按帧号排序且也不拆分
+        """
+        if self.is_video:
+            return list(), list()
+        paths = get_image_paths(self.args.input_dir)
+        if self.sink is not None:
+            return sorted(paths, key=frame_order), list()
+        if self.frame_ranges is None:
+            return paths, list()
+        return self.frame_ranges.split(paths)
+
+    def get_frames(self):
+        """
+        En.(filename, image, in range) for each input frame to read
+        Cn.每个需要读取的输入帧的(文件名, 图像, 是否在范围内)
+        """
+        if not self.is_video:
+            for path in self.input_paths:
+                filename = os.path.basename(path)
+                in_range = self.frame_ranges is None or self.frame_ranges.includes(filename)
+                if in_range or not self.args.discard_frames:
+                    with METRICS.timer("load"):
+                        image = cv2.imread(path)
+                    yield filename, image, in_range
+            return
+        for frame_no, frame in FrameSource(self.args.input_dir):
+            in_range = self.frame_ranges is None or frame_no in self.frame_ranges
+            if in_range or not self.args.discard_frames:
+                yield "{}.png".format(frame_no), frame.copy(), in_range
+
+    def get_items(self, frames):
+        """
+        En.The work items for the converter. Faces are looked up in the
+        alignments here, so only frames without an entry need a worker to
+        run the detector. A frame that can't be read is replaced by the
+        previous frame with its faces, or by a black frame before the first
+        readable one, so the output keeps every frame number and a video
+        keeps its timing
+        Cn.转换器的工作条目。人脸在此处从对齐数据中查找，因此只有没有条目
+        的帧才需要工作进程运行检测器。无法读取的帧用上一帧及其人脸代替，
+        在第一个可读帧之前则用黑帧代替，因此输出保留每一个帧号，视频也保持
+        原有的时间
+        """
+        index = 0
+        previous = None
+        unreadable = list()
+        for filename, image, in_range in frames:
+            if image is None and previous is None:
+                print("Failed to read image: {}, writing a black frame".format(filename))
+                unreadable.append(filename)
+                continue
+            if image is None:
+                print("Failed to read image: {}, repeating the previous frame".format(filename))
+                image, faces = previous
+            else:
+                faces = list()
+                if in_range:
+                    faces = self.alignments.get(filename)
+                    if faces is None:
+                        self.detected += 1
+                    else:
+                        self.fast_path += 1
+                previous = (image, faces)
+                # 第一个可读帧决定黑帧的尺寸
+                for missing in unreadable:
+                    yield self.make_item(index, missing, np.zeros_like(image), list())
+                    index += 1
+                unreadable = list()
+            yield self.make_item(index, filename, image, faces)
+            index += 1
+
+    def make_item(self, index, filename, image, faces):
+        """
+        En.A work item for the converter
+        Cn.转换器的一个工作条目
+        """
+        return {"index": index,
+                "filename": filename,
+                "frame": self.pool.put(image) if self.pool else image,
+                "faces": faces}
+
+    def pass_through(self):
+        """
+        En.Put the frames outside --frame-ranges into the output folder
+        unchanged, without decoding them
+        Cn.将--frame-ranges之外的帧原样放入输出文件夹，无需解码
+        """
+        if self.args.discard_frames:
+            return
+        for path in self.untouched_paths:
+            link_or_copy(path, self.output_dir / os.path.basename(path))
+            self.passed_through += 1
+
+    def check_fast_path(self):
+        """
+        En.Report whether every input frame already has alignments, in
+        which case the detector will never be loaded
+        Cn.报告是否每个输入帧都已有对齐数据，此时检测器永远不会被加载
+        """
+        if self.is_video or not self.alignments:
+            return
+        missing = sum(1 for path in self.input_paths
+                      if os.path.basename(path) not in self.alignments)
+        if missing:
+            print("{} frames have no alignments, faces will be detected for "
+                  "them".format(missing))
+        else:
+            print("All frames have alignments, face detection is skipped")
+
+    def worker_kwargs(self):
+        """
+        En.The settings each ConvertWorker is built from
+        Cn.构建每个ConvertWorker所用的设置
+        """
+        return {"arguments": self.args,
+                "aligned_faces": self.aligned_faces,
+                "pool": self.pool}
+
+    def convert_serial(self, frames):
+        """
+        En.Convert in this process, reading ahead on a background thread
+        Cn.在本进程中转换，并在后台线程中预读
+        """
+        worker = ConvertWorker(**self.worker_kwargs())
+        if worker.error:
+            print(worker.error)
+            exit(1)
+        for item in BackgroundGenerator(self.get_items(frames), 1).iterator():
+            with METRICS.timer("convert"):
+                item = worker(item)
+            yield item
+
+    def convert_parallel(self, frames, workers):
+        """
+        En.Convert in a pool of worker processes. Frames travel through
+        shared memory and the results are put back in order
+        Cn.在工作进程池中转换。帧通过共享内存传递，结果按原顺序重新排列
+        """
+        # 共享内存的大小取自第一个可读的帧
+        leading = list()
+        for frame in frames:
+            leading.append(frame)
+            if frame[1] is not None:
+                break
+        if not leading or leading[-1][1] is None:
+            # 没有可读的帧，只报告读取失败
+            for _ in self.get_items(iter(leading)):
+                pass
+            return
+        self.pool = FramePool(leading[-1][1].nbytes, workers * 2 + 2)
+        self.pipeline = Pipeline([Stage("convert", ConvertWorker, workers=workers,
+                                        **self.worker_kwargs())],
+                                 queue_size=workers)
+        results = self.pipeline.run(self.get_items(self.chain(leading, frames)))
+        try:
+            for item in in_order(results):
+                if item.get("fatal"):
+                    print(item["error"])
+                    exit(1)
+                yield item
+        finally:
+            results.close()
+            self.pool.close()
+
+    @staticmethod
+    def chain(first, rest):
+        """
+        En.Put peeked items back in front of a generator
+        Cn.将预先取出的条目放回生成器的最前面
+        """
+        for item in first:
+            yield item
+        for item in rest:
+            yield item
+
+    def prepare_shot_stats(self):
+        """
+        En.Make sure the shot statistics file is there and up to date,
+        computing it with one pass over the frames if it isn't. A video's
+        frames aren't listed, so an existing file for a video is trusted
+        Cn.确保镜头统计文件存在且为最新，否则扫描一遍所有帧来计算。视频的帧
+        没有列表，因此视频已有的统计文件被视为可信
+        """
+        path = get_shot_stats_path(self.args.input_dir)
+        if os.path.exists(path):
+            stats = ShotStats.load(path)
+            names = [os.path.basename(frame) for frame in self.input_paths]
+            if self.is_video or stats.matches(names):
+                print("Using {} shots from {}".format(len(stats), path))
+                return
+        if not self.alignments:
+            print("Shot statistics need an alignments file, colour statistics will be "
+                  "measured on every frame")
+            self.args.shot_stats = False
+            return
+        print("Computing shot statistics...")
+        frames = ((filename, image) for filename, image, _ in self.get_frames())
+        stats = ShotStats.compute(BackgroundGenerator(frames, 1).iterator(), self.alignments)
+        stats.save(path)
+        print("Found {} shots in {} frames, saved to {}".format(len(stats), len(stats.frames),
+                                                               path))
+
+    def process(self):
+        """
+        En.Run conversion
+        Cn.运行转换
+        """
+        self.check_fast_path()
+        self.pass_through()
+        if self.args.shot_stats:
+            self.prepare_shot_stats()
+        workers = max(1, self.args.workers)
+        started = time.time()
+        frames = 0
+        if workers == 1:
+            results = self.convert_serial(self.get_frames())
+        else:
+            results = self.convert_parallel(self.get_frames(), workers)
+        for item in results:
+            with METRICS.timer("write"):
+                self.write(item)
+            frames += 1
+            METRICS.increment("frames")
+        if self.sink is not None:
+            self.sink.close()
+            print("Video written to: {}".format(self.args.output_video))
+        elapsed = time.time() - started
+
+        print("-------------------------")
+        print("Frames processed:    {}".format(frames))
+        print("From alignments:     {}".format(self.fast_path))
+        print("Faces detected for:  {}".format(self.detected))
+        print("Passed through:      {}".format(self.passed_through))
+        print("Time elapsed:        {:.2f}s ({:.2f} frames/sec)".format(
+            elapsed, frames / elapsed if elapsed else 0.0))
+        print("-------------------------")
+        if self.pipeline is not None:
+            self.pipeline.print_timings()
+
+    def write(self, item):
+        """
+        En.Write a converted frame
+        Cn.写出一帧转换后的帧
+        """
+        if "error" in item:
+            print("Failed to convert image: {}. Reason: {}".format(item["filename"],
+                                                                   item["error"]))
+        if self.sink is not None:
+            # 失败的帧也要写入，以保持视频的时间和音频同步
+            self.sink.write(self.pool.view(item["frame"]) if self.pool else item["frame"])
+        elif "error" not in item:
+            image = self.pool.view(item["frame"]) if self.pool else item["frame"]
+            output_file = self.output_dir / Path(item["filename"]).name
+            if output_file.exists():
+                # 之前的运行可能把它硬链接到了输入帧，直接覆盖会改写输入
+                output_file.unlink()
+            cv2.imwrite(str(output_file), image)
+        if self.pool:
+            self.pool.release(item["frame"])
+
+def load_model(arguments):
+    """
+    En.Load the trained model, or None if there isn't one in --model-dir.
+    In a batch the model is shared by the jobs with the same --trainer
+    and --model-dir
+    Cn.加载训练好的模型，若--model-dir中没有模型则返回None。在批处理中，
+    使用相同--trainer和--model-dir的作业共享该模型
+    """
+    model_dir = get_folder(arguments.model_dir)
+    def load():
+        model = PluginLoader.get_model(arguments.trainer)(model_dir, arguments.gpus)
+        return model if model.load(arguments.swap_model) else None
+    key = ("model", arguments.trainer, str(model_dir.resolve()), arguments.swap_model,
+           arguments.gpus)
+    return RESOURCES.get(key, load)
+
+def load_converter(arguments, model):
+    """
+    En.Load the converter plugin
+    Cn.加载转换器插件
+    """
+    mask_cache = None
+    if arguments.mask_cache:
+        mask_cache = MaskCache(arguments.mask_cache, arguments.mask_cache_size * 1024 * 1024)
+    shot_stats = None
+    if arguments.shot_stats:
+        shot_stats = ShotStats.load(get_shot_stats_path(arguments.input_dir))
+    return PluginLoader.get_converter(arguments.converter)(
+        model.converter(False),
+        trainer=arguments.trainer,
+        blur_size=arguments.blur_size,
+        seamless_clone=arguments.seamless_clone,
+        sharpen_image=arguments.sharpen_image,
+        mask_type=arguments.mask_type,
+        erosion_kernel_size=arguments.erosion_kernel_size,
+        match_histogram=arguments.match_histogram,
+        smooth_mask=arguments.smooth_mask,
+        avg_color_adjust=arguments.avg_color_adjust,
+        mask_cache=mask_cache,
+        shot_stats=shot_stats)
+
+class ConvertWorker(object):
+    """
+    En.Swap the faces in one frame at a time. The model and converter
+    are loaded once when the worker is built. The worker never drops a
+    frame: a failure is reported on the item instead, so the ordered
+    writer is never left waiting for it
+    Cn.每次替换一帧中的人脸。模型和转换器在构建工作对象时加载一次。
+    工作对象从不丢弃帧：失败会记录在条目上，因此有序写入器永远不会
+    一直等待它
+    """
+    def __init__(self, arguments, aligned_faces=None, pool=None):
+        self.args = arguments
+        self.aligned_faces = aligned_faces
+        self.pool = pool
+        self.size = 128 if "128" in arguments.trainer else 64
+        self.face_filter = None
+        self.detector_loaded = False
+        self.error = None
+        model = load_model(arguments)
+        if model is None:
+            self.error = "Model Not Found! A valid model must be provided to continue!"
+            return
+        self.converter = load_converter(arguments, model)
+
+    def __call__(self, item):
+        if self.error:
+            item["error"] = self.error
+            item["fatal"] = True
+            return item
+        try:
+            image = self.pool.view(item["frame"]) if self.pool else item["frame"]
+            faces = item["faces"]
+            if faces is None:
+                faces = self.detect_faces(image)
+            else:
+                faces = [DetectedFace.from_alignment(alignment) for alignment in faces]
+            for idx, face in enumerate(faces):
+                if self.check_skipface(item["filename"], idx):
+                    print("face {} for frame {} was deleted, skipping".format(
+                        idx, item["filename"]))
+                    continue
+                image = self.patch_face(self.converter, image, face, self.size,
+                                        item["filename"])
+                METRICS.increment("faces")
+            item["frame"] = self.pool.store(item["frame"], image) if self.pool else image
+        except Exception:
+            # 只传文本：无法pickle的异常会被队列静默丢弃，其帧槽也永远不会释放
+            item["error"] = traceback.format_exc()
+        return item
+
+    def check_skipface(self, filename, face_idx):
+        """
+        En.Whether a face was deleted from --input-aligned-dir
+        Cn.人脸是否已从--input-aligned-dir中删除
+        """
+        if self.aligned_faces is None:
+            return False
+        filename = Path(filename)
+        return "{}_{}{}".format(filename.stem, face_idx, filename.suffix) not in self.aligned_faces
+
+    def detect_faces(self, image):
+        """
+        En.Detect the faces in a frame, loading the detector on first use
+        Cn.检测帧中的人脸，首次使用时加载检测器
+        """
+        from lib.faces_detect import detect_faces, get_landmarks
+        if not self.detector_loaded:
+            print("Loading the '{}' face detector".format(self.args.detector))
+            if self.args.nfilter:
+                from lib.FaceFilter import FaceFilter
+                self.face_filter = FaceFilter(self.args.nfilter, self.args.ref_threshold)
+            self.detector_loaded = True
+        with METRICS.timer("detect"):
+            locations = detect_faces(image, self.args.detector)
+        faces = list()
+        keep = [True] * len(locations)
+        if self.face_filter is not None:
+            keep = self.face_filter.filter(image, locations)
+        for location, landmarks, kept in zip(locations, get_landmarks(image, locations), keep):
+            if not kept:
+                continue
+            x, y, w, h = location
+            faces.append(DetectedFace(x=x, w=w, y=y, h=h, landmarksXY=landmarks))
+        return faces
+
+    @staticmethod
+    def patch_face(converter, image, face, size, frame=None):
+        """
+        En.Patch one face. Faces found on a rotated frame are patched on
+        the same rotation and then rotated back
+        Cn.替换一张人脸。在旋转后的帧上找到的人脸会在相同的旋转下替换，
+        然后再旋转回来
+        """
+        if not face.r:
+            return converter.patch_image(image, face, size, frame)
+        height, width = image.shape[:2]
+        rotated = converter.patch_image(rotate_image(image, face.r), face, size, frame)
+        return rotate_image(rotated, -face.r, width, height)
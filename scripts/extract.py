@@ -0,0 +1,553 @@
+#!/usr/bin/env python
+#-*- coding:UTF-8 -*-
+"""The script to run the extract process of faceswap"""
+
+import collections
+import os
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from lib.alignments import BinaryAlignments, get_alignments_path, load_alignments
+from lib.faces_detect import load_detection_models
+from lib.frame_ranges import frame_order
+from lib.frames import FrameSource
+from lib.metrics import METRICS
+from lib.pipeline import Pipeline, Stage
+from lib.resource_cache import RESOURCES
+from lib.Serializer import BinarySerializer, get_serializer, get_serializer_from_filename
+from lib.utils import (blur_scores, get_folder, get_image_paths, rotate_image,
+                       variance_of_laplacian)
+
+BLUR_BATCH = 16
+
+class Extract(object):
+    """
+    En.Extract the faces from a folder of frames or from a video.
+    Loading, detection, alignment and writing each run in their own pool
+    of processes, connected by bounded queues. Detection is the
+    expensive step, so it gets --processes workers. With
+    --track-interval the detector only runs every N frames, or when
+    tracking loses a face, and faces are tracked from frame to frame in
+    between. Frames are then read in frame number order and detection
+    runs in a single process so it sees them in that order. With
+    --frame-blur-threshold, frames are scored for blur before detection
+    and the blurry ones skip every later stage
+    Cn.从帧文件夹或视频中提取人脸。加载、检测、对齐和写入分别在各自的
+    进程池中运行，并通过有界队列连接。检测是最耗时的步骤，因此它获得
+    --processes个工作进程。使用--track-interval时，检测器只每N帧运行一次，
+    或在跟踪丢失人脸时运行，其间人脸逐帧跟踪。此时按帧号顺序读取各帧，
+    检测在单个进程中运行，以便按该顺序看到各帧。使用--frame-blur-threshold
+    时，检测前先对帧的模糊度打分，模糊的帧跳过之后的所有阶段
+    """
+    def __init__(self, arguments):
+        self.args = arguments
+        self.output_dir = get_folder(self.args.output_dir)
+        self.is_video = os.path.isfile(self.args.input_dir)
+        self.alignments_path = get_alignments_path(self.args.input_dir,
+                                                   self.args.alignments_path,
+                                                   self.args.serializer)
+        self.serializer = self.get_serializer()
+        self.alignments = self.load_alignments()
+
+    def get_serializer(self):
+        """
+        En.Serializer for the alignments file
+        Cn.对齐文件的序列化器
+        """
+        if self.args.alignments_path:
+            return get_serializer_from_filename(self.alignments_path)
+        return get_serializer(self.args.serializer)
+
+    def load_alignments(self):
+        """
+        En.Existing alignments, only needed when skipping frames that have
+        already been extracted. The binary format is opened as a store
+        that each frame is appended to as soon as it is extracted
+        Cn.已有的对齐数据，仅在跳过已提取的帧时需要。二进制格式以存储的
+        形式打开，每一帧提取完成后立即追加到其中
+        """
+        if self.serializer is BinarySerializer:
+            return BinaryAlignments(self.alignments_path,
+                                    mode="a" if self.args.skip_existing else "w")
+        if not self.args.skip_existing or not os.path.exists(self.alignments_path):
+            return dict()
+        print("Loading alignments from {}".format(self.alignments_path))
+        return load_alignments(self.alignments_path)
+
+    def write_alignments(self):
+        """
+        En.Save the alignments file
+        Cn.保存对齐文件
+        """
+        print("Writing alignments to: {}".format(self.alignments_path))
+        if isinstance(self.alignments, BinaryAlignments):
+            self.alignments.close()
+            return
+        with open(self.alignments_path, self.serializer.woptions) as alignments:
+            alignments.write(self.serializer.marshal(self.alignments))
+
+    def get_stages(self):
+        """
+        En.The extraction stages and their worker counts
+        Cn.提取阶段及其工作进程数
+        """
+        processes = max(1, self.args.processes)
+        tracking = self.args.track_interval > 0
+        stages = list()
+        if not self.is_video:
+            # 跟踪需要按顺序处理帧，因此只使用一个加载进程
+            stages.append(Stage("load", LoadWorker,
+                                workers=1 if tracking else max(1, processes // 4),
+                                blur_thresh=self.args.frame_blur_thresh))
+        detect_kwargs = {"detector": self.args.detector,
+                         "rotation_angles": get_rotation_angles(self.args.rotate_images),
+                         "verbose": self.args.verbose}
+        if tracking:
+            stages.append(Stage("detect", TrackWorker, workers=1,
+                                interval=self.args.track_interval, **detect_kwargs))
+        else:
+            stages.append(Stage("detect", DetectWorker, workers=processes, **detect_kwargs))
+        stages.append(Stage("align", AlignWorker, workers=max(1, processes // 2),
+                            align_eyes=self.args.align_eyes,
+                            debug_landmarks=self.args.debug_landmarks,
+                            nfilter=self.args.nfilter,
+                            ref_threshold=self.args.ref_threshold))
+        stages.append(Stage("write", WriteWorker, workers=max(1, processes // 4),
+                            output_dir=str(self.output_dir),
+                            blur_thresh=self.args.blur_thresh))
+        return stages
+
+    def get_items(self):
+        """
+        En.The frames to feed into the pipeline. Image paths for a folder,
+        or decoded frames, named like the resolve scripts name them, for a
+        video. Tracking needs neighbouring frames one after the other, so
+        then the paths are sorted by frame number (2.png before 10.png)
+        Cn.送入流水线的帧。文件夹输入为图像路径，视频输入为解码后的帧，
+        其命名方式与resolve脚本相同。跟踪需要相邻的帧依次到达，因此此时按
+        帧号排序路径(2.png在10.png之前)
+        """
+        if not self.is_video:
+            paths = get_image_paths(self.args.input_dir, exclude=self.alignments.keys())
+            if self.args.track_interval > 0:
+                paths = sorted(paths, key=frame_order)
+            return paths
+        return self.video_frames()
+
+    def video_frames(self):
+        """
+        En.Decode the input video through an ffmpeg pipe
+        Cn.通过ffmpeg管道解码输入视频
+        """
+        items = ({"filename": "{}.png".format(frame_no), "image": frame.copy()}
+                 for frame_no, frame in FrameSource(self.args.input_dir)
+                 if "{}.png".format(frame_no) not in self.alignments)
+        if self.args.frame_blur_thresh is None:
+            return items
+        return self.blur_filter(items)
+
+    def blur_filter(self, items):
+        """
+        En.Score decoded frames for blur a batch at a time. Blurry frames
+        are passed on without their image, so only the score travels on
+        Cn.按批次对解码后的帧进行模糊打分。模糊的帧不带图像继续传递，
+        因此只有分数会被传下去
+        """
+        batch = list()
+        for item in items:
+            batch.append(item)
+            if len(batch) < BLUR_BATCH:
+                continue
+            for scored in score_blur(batch, self.args.frame_blur_thresh):
+                yield scored
+            batch = list()
+        if batch:
+            for scored in score_blur(batch, self.args.frame_blur_thresh):
+                yield scored
+
+    def write_blur_scores(self, scores):
+        """
+        En.Save each frame's blur score as a csv file in the output folder
+        Cn.将每帧的模糊分数以csv文件保存在输出文件夹中
+        """
+        path = self.output_dir / "blur_scores.csv"
+        with open(str(path), "w") as outfile:
+            outfile.write("frame,blur\n")
+            for filename, score in sorted(scores.items()):
+                outfile.write("{},{:.2f}\n".format(filename, score))
+        return path
+
+    def process(self):
+        """
+        En.Run extraction
+        Cn.运行提取
+        """
+        print("Input: {}".format(self.args.input_dir))
+        print("Output Directory: {}".format(self.output_dir))
+        if RESOURCES.enabled:
+            # 批处理中检测模型在主进程中只加载一次，每个作业fork出的检测进程直接继承
+            load_detection_models()
+        pipeline = Pipeline(self.get_stages())
+        frames = faces = detections = attempts = 0
+        rotations = collections.Counter()
+        blur = dict()
+        blurry = 0
+        started = time.time()
+        for filename, alignments, info in pipeline.run(self.get_items()):
+            if "blur" in info:
+                blur[filename] = info["blur"]
+            if alignments is None:
+                # 模糊的帧不记录对齐数据，以便使用其他阈值重新运行时再次处理
+                blurry += 1
+                METRICS.increment("blurry_frames")
+                continue
+            self.alignments[filename] = alignments
+            frames += 1
+            faces += len(alignments)
+            METRICS.increment("frames")
+            METRICS.increment("faces", len(alignments))
+            detections += info.get("detected", True)
+            attempts += info.get("attempts", 0)
+            rotations.update(alignment.get("r", 0) for alignment in alignments)
+        elapsed = time.time() - started
+        self.write_alignments()
+
+        print("-------------------------")
+        print("Images found:        {}".format(frames))
+        print("Faces detected:      {}".format(faces))
+        if self.args.track_interval > 0:
+            print("Detector runs:       {}".format(detections))
+        if self.args.rotate_images and self.args.rotate_images != "0":
+            print("Detection attempts:  {}".format(attempts))
+            print("Faces per rotation:  {}".format(", ".join(
+                "{}: {}".format(angle, count) for angle, count in sorted(rotations.items()))))
+        if self.args.frame_blur_thresh is not None:
+            scores = np.array(list(blur.values()))
+            print("Blurry frames:       {}".format(blurry))
+            if len(scores):
+                print("Frame blur scores:   min {:.2f}, median {:.2f}, max {:.2f}".format(
+                    scores.min(), np.median(scores), scores.max()))
+            print("Blur scores written to: {}".format(self.write_blur_scores(blur)))
+        print("Time elapsed:        {:.2f}s ({:.2f} frames/sec)".format(
+            elapsed, frames / elapsed if elapsed else 0.0))
+        print("-------------------------")
+        pipeline.print_timings()
+
+def get_rotation_angles(rotate_images):
+    """
+    En.Angles to try when no face is found. A single number is an
+    increment up to 360, otherwise an explicit comma separated list
+    Cn.未找到人脸时尝试的角度。单个数字表示以该数值递增至360，
+    否则为明确的逗号分隔列表
+    """
+    if not rotate_images or rotate_images == "0":
+        return list()
+    passed_angles = [int(angle) for angle in rotate_images.split(",")]
+    if len(passed_angles) == 1:
+        step = passed_angles[0]
+        return [angle for angle in range(step, 360, step)]
+    return [angle for angle in passed_angles if angle != 0]
+
+def score_blur(items, blur_thresh):
+    """
+    En.Score a batch of frames for blur, dropping the image of any frame
+    below blur_thresh and marking it as blurry
+    Cn.对一批帧进行模糊打分，丢弃低于blur_thresh的帧的图像并将其标记为模糊
+    """
+    scores = blur_scores([item["image"] for item in items])
+    for item, score in zip(items, scores):
+        item.setdefault("info", dict())["blur"] = float(score)
+        if score < blur_thresh:
+            item["blurry"] = True
+            del item["image"]
+    return items
+
+class LoadWorker(object):
+    """
+    En.Read frames from disk, scoring them for blur if blur_thresh is set
+    Cn.从磁盘读取帧，若设置了blur_thresh则对其进行模糊打分
+    """
+    def __init__(self, blur_thresh=None):
+        self.blur_thresh = blur_thresh
+
+    def __call__(self, filename):
+        image = cv2.imread(filename)
+        if image is None:
+            print("Failed to read image: {}".format(filename))
+            return None
+        item = {"filename": os.path.basename(filename), "image": image}
+        if self.blur_thresh is not None:
+            item = score_blur([item], self.blur_thresh)[0]
+        return item
+
+class DetectWorker(object):
+    """
+    En.Find the faces in a frame, rotating it if no face is found. The
+    angles are tried starting with the one that found faces on the last
+    frame, then in order of how often each has found faces so far, and
+    the search stops at the first angle that finds any. Footage that is
+    turned on its side is then only detected once per frame
+    Cn.查找帧中的人脸，未找到人脸时旋转该帧。尝试角度时先从上一帧找到人脸
+    的角度开始，然后按各角度迄今找到人脸的次数排序，并在第一个找到人脸的
+    角度处停止。这样侧放的视频每帧只需检测一次
+    """
+    def __init__(self, detector="hog", rotation_angles=None, verbose=False):
+        from lib.faces_detect import detect_faces
+        self.detect_faces = detect_faces
+        self.detector = detector
+        self.rotation_angles = rotation_angles or list()
+        self.verbose = verbose
+        self.successes = collections.Counter()
+        self.last_angle = 0
+
+    def get_angles(self):
+        """
+        En.Every angle to try, no rotation included, most promising first
+        Cn.要尝试的所有角度（包括不旋转），最有希望的排在最前
+        """
+        angles = [0] + self.rotation_angles
+        if not self.successes:
+            return angles
+        position = {angle: idx for idx, angle in enumerate(angles)}
+        return sorted(angles, key=lambda angle: (angle != self.last_angle,
+                                                 -self.successes[angle],
+                                                 position[angle]))
+
+    def __call__(self, item):
+        if item.get("blurry"):
+            return item
+        image = item["image"]
+        rotation = 0
+        locations = list()
+        attempts = 0
+        for angle in self.get_angles():
+            rotated = rotate_image(image, angle) if angle else image
+            locations = self.detect_faces(rotated, self.detector)
+            attempts += 1
+            if locations:
+                image, rotation = rotated, angle
+                self.successes[angle] += 1
+                self.last_angle = angle
+                break
+        item.setdefault("info", dict())["attempts"] = attempts
+        if not locations and self.verbose:
+            print("Warning: No faces were detected in {}".format(item["filename"]))
+        item["image"] = image
+        item["rotation"] = rotation
+        item["locations"] = locations
+        item.setdefault("info", dict())["detected"] = True
+        return item
+
+class TrackWorker(DetectWorker):
+    """
+    En.Detect faces every interval frames, and track them in between.
+    A face is tracked by matching its patch from the last detection in a
+    window around its previous box, on a downscaled grayscale copy. Using
+    the detected patch rather than the previous frame's keeps the box from
+    drifting. If any face's match is weaker than min_confidence the
+    detector runs instead.
+    Landmarks are located here too, and smoothed over the frames a face
+    is followed for
+    Cn.每interval帧检测一次人脸，其间进行跟踪。跟踪人脸的方法是在缩小的灰度
+    副本上，在其上一个框周围的窗口中匹配最近一次检测时的人脸图块。使用检测
+    时的图块而不是上一帧的图块可以防止人脸框漂移。若任何人脸的
+    匹配度低于min_confidence，则改为运行检测器。特征点也在此定位，并在跟踪
+    人脸的各帧间进行平滑
+    """
+    def __init__(self, detector="hog", rotation_angles=None, verbose=False, interval=10,
+                 min_confidence=0.6, smoothing=0.5, template_width=48):
+        DetectWorker.__init__(self, detector, rotation_angles, verbose)
+        from lib.faces_detect import get_landmarks
+        self.get_landmarks = get_landmarks
+        self.interval = interval
+        self.min_confidence = min_confidence
+        self.smoothing = smoothing
+        self.template_width = template_width
+        self.tracks = list()
+        self.since_detect = 0
+
+    def __call__(self, item):
+        if item.get("blurry"):
+            return item
+        gray = cv2.cvtColor(item["image"], cv2.COLOR_BGR2GRAY)
+        locations = None
+        if self.tracks and self.since_detect < self.interval:
+            locations = self.track(gray)
+        if locations is None:
+            item = DetectWorker.__call__(self, item)
+            self.since_detect = 0
+        else:
+            item["rotation"] = 0
+            item["locations"] = locations
+            item.setdefault("info", dict())["detected"] = False
+        self.since_detect += 1
+        landmarks = self.get_landmarks(item["image"], item["locations"])
+        item["landmarks"] = self.smooth(item["locations"], landmarks)
+        if item["rotation"]:
+            # 旋转后找到的人脸不跟踪，下一帧重新检测
+            self.tracks = list()
+        elif item["info"]["detected"]:
+            self.start_tracks(gray, item["locations"], item["landmarks"])
+        else:
+            for track, box, points in zip(self.tracks, item["locations"], item["landmarks"]):
+                track["box"] = box
+                track["landmarks"] = points
+        return item
+
+    def scale(self, box):
+        """
+        En.Downscale factor that makes a face template_width wide
+        Cn.使人脸宽度为template_width的缩小系数
+        """
+        return min(1.0, self.template_width / float(max(box[2], 1)))
+
+    def track(self, gray):
+        """
+        En.The new box of every tracked face, or None if any was lost
+        Cn.每个被跟踪人脸的新框，若有任何人脸丢失则返回None
+        """
+        height, width = gray.shape
+        locations = list()
+        for track in self.tracks:
+            x, y, w, h = track["box"]
+            scale = track["scale"]
+            x0, y0 = max(0, x - w // 2), max(0, y - h // 2)
+            x1, y1 = min(width, x + w + w // 2), min(height, y + h + h // 2)
+            window = cv2.resize(gray[y0:y1, x0:x1], None, fx=scale, fy=scale,
+                                interpolation=cv2.INTER_AREA)
+            template = track["template"]
+            if (window.shape[0] < template.shape[0] or window.shape[1] < template.shape[1]):
+                return None
+            scores = cv2.matchTemplate(window, template, cv2.TM_CCOEFF_NORMED)
+            _, confidence, _, (left, top) = cv2.minMaxLoc(scores)
+            if confidence < self.min_confidence:
+                return None
+            locations.append((x0 + int(round(left / scale)), y0 + int(round(top / scale)), w, h))
+        return locations
+
+    def smooth(self, locations, landmarks):
+        """
+        En.Blend each face's landmarks with those of the track it continues.
+        A face continues a track when their boxes overlap by more than half
+        Cn.将每张人脸的特征点与其所延续的轨迹的特征点混合。当两者的框重叠超过
+        一半时，人脸延续该轨迹
+        """
+        smoothed = list()
+        for box, points in zip(locations, landmarks):
+            points = np.array(points, dtype="float64")
+            previous = max(self.tracks, key=lambda track: overlap(track["box"], box),
+                           default=None)
+            if previous is not None and overlap(previous["box"], box) > 0.5:
+                points = previous["landmarks"] + self.smoothing * (points - previous["landmarks"])
+            smoothed.append(points)
+        return smoothed
+
+    def start_tracks(self, gray, locations, landmarks):
+        """
+        En.Start tracking the faces the detector found
+        Cn.开始跟踪检测器找到的人脸
+        """
+        height, width = gray.shape
+        tracks = list()
+        for box, points in zip(locations, landmarks):
+            x, y, w, h = box
+            x0, y0 = max(0, x), max(0, y)
+            x1, y1 = min(width, x + w), min(height, y + h)
+            if x1 - x0 < 8 or y1 - y0 < 8:
+                continue
+            scale = self.scale(box)
+            template = cv2.resize(gray[y0:y1, x0:x1], None, fx=scale, fy=scale,
+                                  interpolation=cv2.INTER_AREA)
+            tracks.append({"box": (x0, y0, x1 - x0, y1 - y0), "scale": scale,
+                           "template": template, "landmarks": points})
+        self.tracks = tracks
+
+def overlap(box_a, box_b):
+    """
+    En.Intersection over union of two (x, y, w, h) boxes
+    Cn.两个(x, y, w, h)框的交并比
+    """
+    left = max(box_a[0], box_b[0])
+    top = max(box_a[1], box_b[1])
+    right = min(box_a[0] + box_a[2], box_b[0] + box_b[2])
+    bottom = min(box_a[1] + box_a[3], box_b[1] + box_b[3])
+    intersection = max(0, right - left) * max(0, bottom - top)
+    union = box_a[2] * box_a[3] + box_b[2] * box_b[3] - intersection
+    return intersection / float(union) if union else 0.0
+
+class AlignWorker(object):
+    """
+    En.Locate the landmarks of each detected face and extract the
+    aligned face
+    Cn.定位每个检测到的人脸的特征点并提取对齐后的人脸
+    """
+    def __init__(self, align_eyes=False, debug_landmarks=False, nfilter=None, ref_threshold=0.6):
+        from lib.faces_detect import DetectedFace, get_landmarks
+        from lib.FaceFilter import FaceFilter
+        from plugins.PluginLoader import PluginLoader
+        self.detected_face = DetectedFace
+        self.get_landmarks = get_landmarks
+        self.extractor = PluginLoader.get_extractor("Align")()
+        self.face_filter = FaceFilter(nfilter, ref_threshold) if nfilter else None
+        self.align_eyes = align_eyes
+        self.debug_landmarks = debug_landmarks
+
+    def __call__(self, item):
+        if item.get("blurry"):
+            return item
+        image = item["image"]
+        faces = list()
+        locations = item["locations"]
+        landmarks = item.get("landmarks")
+        if landmarks is None:
+            landmarks = self.get_landmarks(image, locations)
+        else:
+            landmarks = [[(int(round(x)), int(round(y))) for x, y in points]
+                         for points in landmarks]
+        keep = [True] * len(locations)
+        if self.face_filter is not None:
+            keep = self.face_filter.filter(image, locations)
+        for location, points, kept in zip(locations, landmarks, keep):
+            if not kept:
+                continue
+            x, y, w, h = location
+            faces.append(self.detected_face(x=x, w=w, y=y, h=h,
+                                            landmarksXY=points,
+                                            r=item["rotation"]))
+        if self.debug_landmarks:
+            image = image.copy()
+            for face in faces:
+                for (pos_x, pos_y) in face.landmarksAsXY():
+                    cv2.circle(image, (pos_x, pos_y), 2, (0, 0, 255), -1)
+        for face in faces:
+            face.image = self.extractor.extract(image, face, 256, self.align_eyes)
+        return {"filename": item["filename"], "faces": faces, "info": item.get("info", dict())}
+
+class WriteWorker(object):
+    """
+    En.Write the aligned faces, moving blurry ones into a "blurry" sub-folder
+    Cn.写入对齐后的人脸，将模糊的人脸移入"blurry"子文件夹
+    """
+    def __init__(self, output_dir, blur_thresh=None):
+        self.output_dir = Path(output_dir)
+        self.blur_thresh = blur_thresh
+
+    def __call__(self, item):
+        if item.get("blurry"):
+            return item["filename"], None, item["info"]
+        filename = Path(item["filename"])
+        alignments = list()
+        for idx, face in enumerate(item["faces"]):
+            output_file = self.output_dir / "{}_{}{}".format(filename.stem, idx, filename.suffix)
+            if self.blur_thresh is not None:
+                focus_measure = variance_of_laplacian(face.image)
+                if focus_measure < self.blur_thresh:
+                    print("{}'s focus measure of {:.2f} was below the blur threshold, "
+                          "moving to \"blurry\"".format(output_file.stem, focus_measure))
+                    output_file = get_folder(self.output_dir / "blurry") / output_file.name
+            cv2.imwrite(str(output_file), face.image)
+            alignments.append(face.to_alignment())
+        return item["filename"], alignments, item["info"]
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+#-*- coding:UTF-8 -*-
+"""The script to run the training process of faceswap"""
+
+import os
+import sys
+import threading
+
+from lib.checkpoint import Checkpointer
+from lib.metrics import METRICS
+from lib.preview import Preview
+from lib.training_data import BatchLoader, create_pool
+from lib.utils import get_folder
+from plugins.PluginLoader import PluginLoader
+
+class Train(object):
+    """
+    En.Train a model on the faces in --input-A and --input-B. The faces
+    are decoded once into a cache in each folder, and batches are warped
+    by a pool of --loader-workers processes that keep --prefetch batches
+    ready, so the trainer doesn't wait on decoding or augmentation. The
+    trainer plugin is handed one loader per side and pulls a batch from
+    each on every step. Saves are written in the background by a
+    Checkpointer, and previews are written and shown by a separate
+    preview process at most every --preview-rate seconds
+    Cn.在--input-A和--input-B中的人脸上训练模型。人脸在每个文件夹中一次性
+    解码到缓存中，批次由--loader-workers个进程组成的池进行扭曲，这些进程
+    预先准备--prefetch个批次，因此训练器无需等待解码或数据增强。训练器插件
+    为每一侧获得一个加载器，并在每一步从每个加载器中取一个批次。保存由
+    Checkpointer在后台写入，预览由单独的预览进程写入和显示，最多每
+    --preview-rate秒一次
+    """
+    def __init__(self, arguments):
+        self.args = arguments
+        self.stop = False
+        self.save_now = False
+        self.preview = None
+        self.trainer_name = self.args.trainer
+        self.loaders = list()
+        self.checkpoints = Checkpointer(get_folder(self.args.model_dir),
+                                        self.args.keep_checkpoints)
+
+    def process(self):
+        """
+        En.Run training, in a thread, while the main thread waits for the
+        user to stop it
+        Cn.在线程中运行训练，同时主线程等待用户停止训练
+        """
+        print("Training data directory: {}".format(self.args.model_dir))
+        if self.args.preview or self.args.write_image or self.args.redirect_gui:
+            self.preview = Preview(os.path.realpath(os.path.dirname(sys.argv[0])),
+                                   write_image=self.args.write_image,
+                                   redirect_gui=self.args.redirect_gui,
+                                   show_window=self.args.preview,
+                                   rate=self.args.preview_rate)
+        thread = threading.Thread(target=self.process_thread)
+        thread.start()
+        if self.args.preview:
+            self.monitor_preview()
+        else:
+            self.monitor_console()
+        thread.join()
+        self.print_loader_stats()
+        self.print_checkpoint_stats()
+        if self.preview is not None:
+            self.preview.close()
+            print("Previews: {} rendered, {} dropped".format(self.preview.rendered.value,
+                                                             self.preview.dropped))
+
+    def process_thread(self):
+        """
+        En.Load the model and data, and train
+        Cn.加载模型和数据，并进行训练
+        """
+        pool = create_pool(self.args.loader_workers)
+        try:
+            model = self.load_model()
+            self.loaders = [BatchLoader(folder, self.args.batch_size, pool,
+                                        prefetch=self.args.prefetch)
+                            for folder in (self.args.input_A, self.args.input_B)]
+            trainer = PluginLoader.get_trainer(self.trainer_name)(
+                model, self.loaders[0], self.loaders[1], self.args.batch_size,
+                self.args.perceptual_loss)
+            self.run_training_cycle(model, trainer)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop = True
+            pool.terminate()
+
+    def load_model(self):
+        """
+        En.Load the model from --model-dir, or start a new one
+        Cn.从--model-dir加载模型，或创建新模型
+        """
+        model_dir = get_folder(self.args.model_dir)
+        model = PluginLoader.get_model(self.trainer_name)(model_dir, self.args.gpus)
+        model.load(swapped=False)
+        return model
+
+    def run_training_cycle(self, model, trainer):
+        """
+        En.Train for --epochs iterations, saving every --save-interval
+        Cn.训练--epochs次迭代，每--save-interval次保存一次
+        """
+        iteration = 0
+        for iteration in range(self.args.epochs):
+            save_iteration = iteration % self.args.save_interval == 0
+            viewer = self.preview if self.preview is not None and self.preview.due() else None
+            with METRICS.timer("train-step"):
+                trainer.train_one_step(iteration, viewer)
+            METRICS.increment("iterations")
+            if self.stop:
+                break
+            if save_iteration or self.save_now:
+                with METRICS.timer("save"):
+                    self.checkpoints.save(model, iteration)
+                self.save_now = False
+                if self.args.verbose:
+                    self.print_loader_stats()
+        # 最后一次保存必须写入：等待正在进行的保存完成后再保存并等待其完成
+        with METRICS.timer("save"):
+            self.checkpoints.wait()
+            self.checkpoints.save(model, iteration)
+            self.checkpoints.wait()
+
+    def print_loader_stats(self):
+        """
+        En.Print how fast the loaders hand out batches and how long the
+        trainer has waited on them
+        Cn.打印加载器分发批次的速度以及训练器等待它们的时间
+        """
+        for side, loader in zip("AB", self.loaders):
+            print("Loader {}: {} batches, {:.1f} batches/sec, trainer waited {:.2f}s".format(
+                side, loader.batches, loader.batches_per_second, loader.wait))
+
+    def print_checkpoint_stats(self):
+        """
+        En.Print how many saves were written or skipped, and the time the
+        training thread spent taking snapshots
+        Cn.打印写入或跳过的保存次数，以及训练线程获取快照所花的时间
+        """
+        checkpoints = self.checkpoints
+        print("Checkpoints: {} saved, {} skipped, snapshots {:.2f}s, "
+              "background writes {:.2f}s".format(checkpoints.saved, checkpoints.skipped,
+                                                 checkpoints.snapshot_time,
+                                                 checkpoints.write_time))
+
+    def monitor_preview(self):
+        """
+        En.Wait for Enter on the preview window, which the preview process
+        shows. 's' saves now
+        Cn.等待在预览窗口上按下Enter，该窗口由预览进程显示。按's'立即保存
+        """
+        print("Using live preview. Press 'ENTER' on the preview window to save and quit. "
+              "Press 'S' on the preview window to save model weights immediately")
+        while not self.stop:
+            if self.preview.stopped.wait(0.5):
+                break
+            if self.preview.save_requested.is_set():
+                self.preview.save_requested.clear()
+                self.save_now = True
+        self.stop = True
+
+    def monitor_console(self):
+        """
+        En.Wait for Enter on the console
+        Cn.在控制台上等待Enter
+        """
+        print("Starting. Press 'ENTER' to stop training and save model")
+        try:
+            input()
+        except (KeyboardInterrupt, EOFError):
+            pass
+        finally:
+            self.stop = True
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+#-*- coding:UTF-8 -*-
+"""The script to tune the convert settings of faceswap for quality against speed"""
+
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import time
+
+import cv2
+
+from lib.alignments import get_alignments_path, load_alignments
+from lib.faces_detect import DetectedFace
+from lib.frame_ranges import frame_order
+from lib.frames import FFMPEG, FFMPEG_DIR, FrameSource, VideoSink, probe_video
+from lib.utils import get_folder, get_image_paths
+from scripts.convert import ConvertWorker, load_converter, load_model
+
+# 从便宜到昂贵的默认设置网格
+DEFAULT_GRID = {"mask_type": ["rect", "facehullandrect"],
+                "blur_size": [2, 5],
+                "sharpen_image": [None, "gsharpen"],
+                "match_histogram": [False, True],
+                "seamless_clone": [False, True]}
+
+# 渲染结果无损编码，使VMAF只衡量转换器设置之间的差异
+LOSSLESS = ["-c:v", "libx264", "-qp", "0", "-preset", "ultrafast", "-pix_fmt", "yuv444p"]
+
+class Tune(object):
+    """
+    En.Convert a sample clip once for every combination of settings in a
+    grid, timing the converter alone, and score each render with VMAF
+    against a reference render. The reference is --reference if given,
+    otherwise the most expensive settings of the grid. Renders are
+    encoded losslessly, so the scores only reflect the settings. The
+    model is loaded once and the clip is held in memory, so only
+    patching the faces is timed. The settings on the Pareto front (no
+    other setting is both faster and better) are printed and saved
+    Cn.对网格中的每种设置组合各转换一次样本片段，只对转换器计时，并用VMAF
+    将每次渲染与参考渲染进行比较评分。参考为--reference(若给出)，否则为
+    网格中最昂贵的设置。渲染结果无损编码，因此分数只反映设置的差异。模型
+    只加载一次，片段保存在内存中，因此只对替换人脸计时。打印并保存帕累托
+    前沿上的设置(没有其他设置既更快又更好)
+    """
+    def __init__(self, arguments):
+        self.args = arguments
+        self.output_dir = get_folder(self.args.output_dir)
+        self.grid = self.load_grid()
+        self.frames = list()
+        self.results = list()
+
+    def load_grid(self):
+        """
+        En.The settings to try: --grid as a json object of setting name to
+        a list of values, cheapest first, or the default grid
+        Cn.要尝试的设置：--grid为设置名称到取值列表(最便宜的在前)的json对象，
+        否则为默认网格
+        """
+        if not self.args.grid:
+            return DEFAULT_GRID
+        with open(self.args.grid, "r") as grid_file:
+            grid = json.load(grid_file)
+        unknown = [name for name in grid if not hasattr(self.args, name)]
+        if unknown:
+            raise ValueError("Unknown convert settings in {}: {}".format(self.args.grid,
+                                                                        ", ".join(unknown)))
+        return grid
+
+    def combinations(self):
+        """
+        En.Every combination of the grid's values, as dicts of settings
+        Cn.网格取值的所有组合，以设置字典的形式给出
+        """
+        names = sorted(self.grid)
+        for values in itertools.product(*(self.grid[name] for name in names)):
+            yield dict(zip(names, values))
+
+    def load_frames(self):
+        """
+        En.The first --frames frames of the input that have alignments
+        Cn.输入中前--frames个有对齐数据的帧
+        """
+        alignments = load_alignments(get_alignments_path(self.args.input_dir,
+                                                         self.args.alignments_path,
+                                                         self.args.serializer))
+        if os.path.isfile(self.args.input_dir):
+            frames = (("{}.png".format(frame_no), frame)
+                      for frame_no, frame in FrameSource(self.args.input_dir))
+        else:
+            frames = ((os.path.basename(path), cv2.imread(path))
+                      for path in sorted(get_image_paths(self.args.input_dir), key=frame_order))
+        for filename, frame in frames:
+            faces = alignments.get(filename)
+            if faces is None or frame is None:
+                continue
+            self.frames.append((filename, frame.copy(),
+                                [DetectedFace.from_alignment(face) for face in faces]))
+            if len(self.frames) >= self.args.frames:
+                break
+        if not self.frames:
+            raise ValueError("No aligned frames found in {}".format(self.args.input_dir))
+
+    def get_fps(self):
+        """
+        En.Frame rate of the renders
+        Cn.渲染结果的帧率
+        """
+        if os.path.isfile(self.args.input_dir):
+            return probe_video(self.args.input_dir)[2] or 25.0
+        return 25.0
+
+    def render(self, model, settings, path):
+        """
+        En.Convert the clip with settings into a lossless video.
+        Returns the converter's ms per frame
+        Cn.使用settings转换片段并写为无损视频。返回转换器的每帧毫秒数
+        """
+        arguments = argparse.Namespace(**vars(self.args))
+        for name, value in settings.items():
+            setattr(arguments, name, value)
+        converter = load_converter(arguments, model)
+        size = 128 if "128" in arguments.trainer else 64
+        sink = VideoSink(path, self.get_fps(), encoder_args=LOSSLESS)
+        busy = 0.0
+        try:
+            for filename, frame, faces in self.frames:
+                image = frame.copy()
+                started = time.time()
+                for face in faces:
+                    image = ConvertWorker.patch_face(converter, image, face, size, filename)
+                busy += time.time() - started
+                sink.write(image)
+        finally:
+            sink.close()
+        return 1000 * busy / len(self.frames)
+
+    def vmaf_model(self):
+        """
+        En.The VMAF model: --vmaf-model, or the bundled 4K or HD model
+        depending on the clip's height
+        Cn.VMAF模型：--vmaf-model，或根据片段高度选择附带的4K或高清模型
+        """
+        if self.args.vmaf_model:
+            return self.args.vmaf_model
+        name = "vmaf_4k_v0.6.1.pkl" if self.frames[0][1].shape[0] >= 2160 else "vmaf_v0.6.1.pkl"
+        return os.path.join(FFMPEG_DIR, "model", name)
+
+    def vmaf(self, distorted, reference):
+        """
+        En.(mean, lowest) per frame VMAF of distorted against reference
+        Cn.distorted相对于reference的逐帧VMAF的(平均值, 最低值)
+        """
+        log_path = distorted + ".vmaf.json"
+        command = [FFMPEG, "-v", "error", "-i", distorted, "-i", reference,
+                   "-lavfi", "[0:v][1:v]libvmaf=model_path={}:log_path={}:log_fmt=json".format(
+                       self.vmaf_model(), log_path),
+                   "-f", "null", "-"]
+        returncode = subprocess.call(command)
+        if returncode != 0:
+            raise RuntimeError("ffmpeg exited with code {} while scoring {}".format(returncode,
+                                                                                    distorted))
+        with open(log_path, "r") as log_file:
+            log = json.load(log_file)
+        scores = [frame["metrics"]["vmaf"] for frame in log.get("frames", list())]
+        mean = log.get("VMAF score", sum(scores) / len(scores) if scores else 0.0)
+        return float(mean), float(min(scores)) if scores else float(mean)
+
+    def process(self):
+        """
+        En.Run the tuning
+        Cn.运行调优
+        """
+        self.load_frames()
+        model = load_model(self.args)
+        if model is None:
+            print("Model Not Found! A valid model must be provided to continue!")
+            exit(1)
+        combinations = list(self.combinations())
+        print("Tuning {} settings on {} frames".format(len(combinations), len(self.frames)))
+
+        reference = self.args.reference
+        if not reference:
+            reference = str(self.output_dir / "reference.mkv")
+            most_expensive = {name: values[-1] for name, values in self.grid.items()}
+            print("Rendering the reference with {}".format(describe(most_expensive)))
+            self.render(model, most_expensive, reference)
+
+        for idx, settings in enumerate(combinations):
+            path = str(self.output_dir / "tune_{:03d}.mkv".format(idx))
+            ms_per_frame = self.render(model, settings, path)
+            vmaf, vmaf_min = self.vmaf(path, reference)
+            self.results.append({"settings": settings, "ms_per_frame": ms_per_frame,
+                                 "vmaf": vmaf, "vmaf_min": vmaf_min})
+            print("{:>3}/{}: {:8.2f} ms/frame  VMAF {:6.2f} (min {:6.2f})  {}".format(
+                idx + 1, len(combinations), ms_per_frame, vmaf, vmaf_min, describe(settings)))
+            os.remove(path + ".vmaf.json")
+            if not self.args.keep_renders:
+                os.remove(path)
+
+        front = pareto_front(self.results)
+        for result in self.results:
+            result["pareto"] = result in front
+        self.print_front(front)
+        results_path = self.args.results or str(self.output_dir / "tune_results.json")
+        with open(results_path, "w") as results_file:
+            json.dump({"reference": reference, "vmaf_model": self.vmaf_model(),
+                       "frames": len(self.frames), "results": self.results},
+                      results_file, indent=2)
+        print("Results written to: {}".format(results_path))
+
+    def print_front(self, front):
+        """
+        En.Print the Pareto front, fastest first, and the fastest setting
+        that meets --min-vmaf
+        Cn.打印帕累托前沿(最快的在前)，以及满足--min-vmaf的最快设置
+        """
+        print("-------------------------")
+        print("Pareto front (fastest first):")
+        for result in front:
+            print("{:8.2f} ms/frame  VMAF {:6.2f}  {}".format(
+                result["ms_per_frame"], result["vmaf"], describe(result["settings"])))
+        if self.args.min_vmaf is not None:
+            passing = [result for result in front if result["vmaf"] >= self.args.min_vmaf]
+            print("-------------------------")
+            if passing:
+                print("Fastest with VMAF >= {}: {}".format(self.args.min_vmaf,
+                                                           describe(passing[0]["settings"])))
+            else:
+                print("No setting reaches VMAF {}".format(self.args.min_vmaf))
+
+def pareto_front(results):
+    """
+    En.The results no other result beats on both speed and VMAF, fastest first
+    Cn.没有其他结果在速度和VMAF上同时胜过的结果，最快的在前
+    """
+    front = list()
+    best = None
+    for result in sorted(results, key=lambda result: (result["ms_per_frame"], -result["vmaf"])):
+        if best is None or result["vmaf"] > best:
+            front.append(result)
+            best = result["vmaf"]
+    return front
+
+def describe(settings):
+    """
+    En.Settings as command line style text
+    Cn.以命令行形式表示的设置
+    """
+    return " ".join("{}={}".format(name, value) for name, value in sorted(settings.items()))
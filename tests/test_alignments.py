@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+#-*- coding:UTF-8 -*-
+"""Tests for the binary alignments format"""
+
+import json
+import os
+
+import pytest
+
+from lib.alignments import BinaryAlignments, convert_alignments, from_bytes, to_bytes
+
+def make_face(seed, integral=True):
+    """
+    En.An alignments file entry with 68 landmarks
+    Cn.带有68个特征点的对齐文件条目
+    """
+    points = [[(seed * 7 + idx * 3) % 500, (seed * 5 + idx) % 400] for idx in range(68)]
+    if not integral:
+        points = [[x + 0.25, y / 3.0] for x, y in points]
+    return {"r": 0, "x": seed, "w": 50 + seed, "y": 2 * seed, "h": 60, "landmarksXY": points}
+
+def make_alignments():
+    """
+    En.Frames with no, one and two faces, integer and float landmarks
+    Cn.包含零张、一张和两张人脸，以及整数和浮点特征点的帧
+    """
+    return {"1.png": [make_face(1)],
+            "2.png": [],
+            "3.png": [make_face(3), make_face(4)],
+            "4.png": [make_face(5, integral=False)],
+            "帧5.png": [make_face(6)]}
+
+def test_json_round_trip(tmp_path):
+    data = make_alignments()
+    json_path = str(tmp_path / "alignments.json")
+    with open(json_path, "w") as outfile:
+        json.dump(data, outfile)
+    convert_alignments(json_path, str(tmp_path / "alignments.fsa"))
+    convert_alignments(str(tmp_path / "alignments.fsa"), str(tmp_path / "back.json"))
+    with open(str(tmp_path / "back.json"), "r") as infile:
+        back = json.load(infile)
+    assert back == data
+    # 整数特征点必须仍为整数
+    assert all(isinstance(value, int) for point in back["1.png"][0]["landmarksXY"]
+               for value in point)
+
+def test_bytes_round_trip():
+    data = make_alignments()
+    assert from_bytes(to_bytes(data)) == data
+    assert from_bytes(to_bytes(dict())) == dict()
+
+def test_append_then_compact(tmp_path):
+    path = str(tmp_path / "alignments.fsa")
+    data = make_alignments()
+    store = BinaryAlignments(path, mode="w")
+    for frame, faces in data.items():
+        store[frame] = faces
+    store["1.png"] = [make_face(9)]
+    data["1.png"] = [make_face(9)]
+    assert store.to_dict() == data
+    store.close()
+    store = BinaryAlignments(path, mode="r")
+    assert len(store.blocks) == 1
+    assert store.to_dict() == data
+    assert store.get_landmarks("3.png").shape == (2, 68, 2)
+
+def test_append_to_existing(tmp_path):
+    path = str(tmp_path / "alignments.fsa")
+    store = BinaryAlignments(path, mode="w")
+    store["1.png"] = [make_face(1)]
+    store.close()
+    store = BinaryAlignments(path, mode="a")
+    store["2.png"] = [make_face(2)]
+    store.close()
+    assert BinaryAlignments(path).to_dict() == {"1.png": [make_face(1)],
+                                                "2.png": [make_face(2)]}
+
+def test_torn_last_block_is_truncated(tmp_path):
+    path = str(tmp_path / "alignments.fsa")
+    store = BinaryAlignments(path, mode="w")
+    store["1.png"] = [make_face(1)]
+    store["2.png"] = [make_face(2)]
+    store._file.flush()
+    size = os.path.getsize(path)
+    store._file.close()
+    store._file = None
+    # 模拟写最后一个块时崩溃
+    with open(path, "r+b") as infile:
+        infile.truncate(size - 100)
+    assert BinaryAlignments(path).to_dict() == {"1.png": [make_face(1)]}
+    store = BinaryAlignments(path, mode="a")
+    store["3.png"] = []
+    store.close()
+    assert BinaryAlignments(path).to_dict() == {"1.png": [make_face(1)], "3.png": []}
+
+def test_empty_file(tmp_path):
+    path = str(tmp_path / "alignments.fsa")
+    open(path, "wb").close()
+    with pytest.raises(ValueError):
+        BinaryAlignments(path, mode="r")
+    store = BinaryAlignments(path, mode="a")
+    store["1.png"] = [make_face(1)]
+    store.close()
+    assert BinaryAlignments(path).to_dict() == {"1.png": [make_face(1)]}
+
+def test_not_an_alignments_file(tmp_path):
+    path = str(tmp_path / "alignments.fsa")
+    with open(path, "wb") as outfile:
+        outfile.write(b"{}" * 64)
+    with pytest.raises(ValueError):
+        BinaryAlignments(path, mode="r")
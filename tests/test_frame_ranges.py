@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+#-*- coding:UTF-8 -*-
+"""Tests for --frame-ranges parsing"""
+
+import pytest
+
+from lib.frame_ranges import FrameRanges, parse_frame_range
+
+def test_parse_frame_range():
+    assert parse_frame_range("10-50") == (10, 50)
+    assert parse_frame_range("10") == (10, 10)
+    assert parse_frame_range("-5") == (0, 5)
+    assert parse_frame_range("90-") == (90, float("inf"))
+    assert parse_frame_range("90-+") == (90, float("inf"))
+
+@pytest.mark.parametrize("frame_range", ["", "-", "x-3", "3-x", "5-3", "1-2-3"])
+def test_parse_frame_range_rejects(frame_range):
+    with pytest.raises(ValueError):
+        parse_frame_range(frame_range)
+
+def test_single_frame():
+    ranges = FrameRanges.from_strings(["10", "20-"])
+    assert 10 in ranges
+    assert 11 not in ranges
+    assert 9 not in ranges
+    assert 1000 in ranges
+    assert ranges.includes("frame_10.png")
+    assert not ranges.includes("frame_11.png")